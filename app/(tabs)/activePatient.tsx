@@ -27,9 +27,16 @@ export default function PatientInfoScreen() {
   const fetchPatients = async () => {
     setLoading(true);
     try {
-      const res = await fetch(`${API_URL}/patients/`);
-      const data = await res.json();
-      setPatients(data.filter((p: Patient) => p.is_active));
+      // The list is paginated: follow `next` until the last page
+      const active: Patient[] = [];
+      let url: string | null = `${API_URL}/patients/?is_active=true&page_size=200`;
+      while (url) {
+        const res: Response = await fetch(url);
+        const data = await res.json();
+        active.push(...data.results);
+        url = data.next;
+      }
+      setPatients(active);
     } catch (e) {
       console.error('Error fetching patients:', e);
     }
@@ -34,6 +34,17 @@ export default function DirectMessageChatScreen() {
     getUsername().then(setCurrentUsername);
   }, []);
 
+  // Tell the server this peer's messages have been seen, which clears their unread count in the inbox
+  const markRead = async () => {
+    const token = await getAccessToken();
+    if (!token) return;
+    fetch(`${API_URL}/messages/read/`, {
+      method: 'POST',
+      headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' },
+      body: JSON.stringify({ peer: receiverId }),
+    }).catch((e) => console.error('Error marking messages read:', e));
+  };
+
   // Fetch messages between current user and receiver
   useEffect(() => {
     if (!currentUserId) return;
@@ -48,50 +59,31 @@ export default function DirectMessageChatScreen() {
           return;
         }
 
-        const res = await fetch(`${API_URL}/messages/?ordering=timestamp`, {
-          headers: { 'Authorization': `Bearer ${token}` },
-        });
+        // The thread endpoint filters and decrypts the conversation server-side
+        const thread: (Message & { decrypted_message?: string })[] = [];
+        let url: string | null = `${API_URL}/messages/thread/?peer=${receiverId}`;
+        while (url) {
+          const res: Response = await fetch(url, {
+            headers: { 'Authorization': `Bearer ${token}` },
+          });
 
-        if (!res.ok) {
-          if (res.status === 401) {
-            Alert.alert('Session Expired', 'Please login again');
-            router.replace('/');
-            return;
+          if (!res.ok) {
+            if (res.status === 401) {
+              Alert.alert('Session Expired', 'Please login again');
+              router.replace('/');
+              return;
+            }
+            throw new Error('Failed to fetch messages');
           }
-          throw new Error('Failed to fetch messages');
-        }
 
-        const data = await res.json();
-        // Filter messages between these two users
-        const filtered = data.filter((msg: Message) =>
-          (msg.sender === currentUserId && msg.receiver === receiverId) ||
-          (msg.sender === receiverId && msg.receiver === currentUserId)
-        );
-
-        // Decrypt each message using the backend endpoint
-        const decryptedMessages = await Promise.all(
-          filtered.map(async (msg: Message) => {
-            try {
-              const decRes = await fetch(`${API_URL}/messages/${msg.id}/decrypt/`, {
-                headers: { 'Authorization': `Bearer ${token}` },
-              });
-              if (!decRes.ok) {
-                if (decRes.status === 401) {
-                  throw new Error('auth_error');
-                }
-                return { ...msg, decrypted_message: '[Decryption failed]' };
-              }
-              const decData = await decRes.json();
-              return { ...msg, decrypted_message: decData.decrypted };
-            } catch (error: any) {
-              if (error.message === 'auth_error') {
-                throw error;
-              }
-              return { ...msg, decrypted_message: '[Decryption failed]' };
-            }
-          })
-        );
-        setMessages(decryptedMessages);
+          const data = await res.json();
+          data.results.forEach((msg: Message & { decrypted: string }) => {
+            thread.push({ ...msg, decrypted_message: msg.decrypted });
+          });
+          url = data.next;
+        }
+        setMessages(thread);
+        markRead();
       } catch (e: any) {
         if (e.message === 'auth_error') {
           Alert.alert('Session Expired', 'Please login again');
@@ -107,6 +99,28 @@ export default function DirectMessageChatScreen() {
     fetchMessages();
   }, [currentUserId, receiverId]);
 
+  // Receive new messages from this peer over the websocket instead of polling
+  useEffect(() => {
+    if (!currentUserId) return;
+    let socket: WebSocket | null = null;
+    let closed = false;
+    getAccessToken().then((token) => {
+      if (!token || closed) return;
+      const wsUrl = API_URL.replace(/^http/, 'ws').replace(/\/api\/?$/, '');
+      socket = new WebSocket(`${wsUrl}/ws/messages/?token=${token}`);
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type !== 'message.created' || data.message.sender !== receiverId) return;
+        setMessages(prev => [...prev, { ...data.message, decrypted_message: data.message.decrypted }]);
+        markRead();
+      };
+    });
+    return () => {
+      closed = true;
+      socket?.close();
+    };
+  }, [currentUserId, receiverId]);
+
   // Send a new message
   const handleSend = async () => {
     if (!input.trim() || !currentUserId) return;
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { View, Text, StyleSheet, FlatList, TouchableOpacity, ActivityIndicator, Image, SafeAreaView, Alert } from 'react-native';
-import { useRouter } from 'expo-router';
+import { useNavigation, useRouter } from 'expo-router';
 import { API_URL } from '../config';
 import { getUserId, getUsername, getRole, getAccessToken } from '../utils/auth';
 
@@ -8,6 +8,14 @@ interface User {
   id: string;
   username: string;
   role: string;
+  last_message_at?: string | null;
+  unread_count?: number;
+}
+
+interface InboxEntry {
+  peer: string;
+  last_message_at: string;
+  unread_count: number;
 }
 
 export default function DirectMessageUsersScreen() {
@@ -17,6 +25,7 @@ export default function DirectMessageUsersScreen() {
   const [username, setUsername] = useState('');
   const [userRole, setUserRole] = useState('');
   const router = useRouter();
+  const navigation = useNavigation();
 
   useEffect(() => {
     // Get current user info
@@ -38,11 +47,11 @@ export default function DirectMessageUsersScreen() {
           return;
         }
 
-        const response = await fetch(`${API_URL}/users/`, {
-          headers: {
-            'Authorization': `Bearer ${token}`,
-          }
-        });
+        const headers = { 'Authorization': `Bearer ${token}` };
+        const [response, inboxResponse] = await Promise.all([
+          fetch(`${API_URL}/users/`, { headers }),
+          fetch(`${API_URL}/messages/inbox/`, { headers }),
+        ]);
         
         if (!response.ok) {
           if (response.status === 401) {
@@ -55,8 +64,21 @@ export default function DirectMessageUsersScreen() {
 
         const data = await response.json();
         
-        // Only filter out the current user, show all other users regardless of role
-        const filtered = currentUserId ? data.filter((u: User) => u.id !== currentUserId) : data;
+        // Last message time and unread count per peer, without loading any conversation
+        const inbox: Record<string, InboxEntry> = {};
+        if (inboxResponse.ok) {
+          (await inboxResponse.json()).forEach((entry: InboxEntry) => { inbox[entry.peer] = entry; });
+        }
+
+        // Only filter out the current user, show all other users regardless of role;
+        // the most recent conversations come first
+        const filtered: User[] = (currentUserId ? data.filter((u: User) => u.id !== currentUserId) : data)
+          .map((u: User) => ({
+            ...u,
+            last_message_at: inbox[u.id]?.last_message_at ?? null,
+            unread_count: inbox[u.id]?.unread_count ?? 0,
+          }));
+        filtered.sort((a, b) => (b.last_message_at || '').localeCompare(a.last_message_at || ''));
         setUsers(filtered);
       } catch (e) {
         Alert.alert('Error', 'Failed to load users list');
@@ -67,6 +89,8 @@ export default function DirectMessageUsersScreen() {
 
     if (currentUserId !== null) {
       fetchUsers();
+      // Refresh the unread counts when coming back from a chat
+      return navigation.addListener('focus', fetchUsers);
     }
   }, [currentUserId]);
 
@@ -84,8 +108,20 @@ export default function DirectMessageUsersScreen() {
         style={styles.userItem}
         onPress={() => router.push({ pathname: '/directMessageChat', params: { userId: item.id, username: item.username, role: displayRole } })}
       >
-        <Text style={styles.username}>{item.username}</Text>
-        <Text style={styles.role}>{displayRole}</Text>
+        <View>
+          <Text style={styles.username}>{item.username}</Text>
+          {item.last_message_at ? (
+            <Text style={styles.lastMessage}>Last message: {new Date(item.last_message_at).toLocaleString()}</Text>
+          ) : null}
+        </View>
+        <View style={styles.itemRight}>
+          <Text style={styles.role}>{displayRole}</Text>
+          {item.unread_count ? (
+            <View style={styles.unreadBadge}>
+              <Text style={styles.unreadText}>{item.unread_count}</Text>
+            </View>
+          ) : null}
+        </View>
       </TouchableOpacity>
     );
   };
@@ -213,6 +249,30 @@ const styles = StyleSheet.create({
     fontSize: 16,
     color: '#000',
   },
+  lastMessage: {
+    fontSize: 13,
+    color: '#333',
+    marginTop: 4,
+  },
+  itemRight: {
+    flexDirection: 'row',
+    alignItems: 'center',
+  },
+  unreadBadge: {
+    minWidth: 24,
+    height: 24,
+    borderRadius: 12,
+    paddingHorizontal: 6,
+    marginLeft: 10,
+    backgroundColor: '#E53935',
+    alignItems: 'center',
+    justifyContent: 'center',
+  },
+  unreadText: {
+    color: '#fff',
+    fontWeight: 'bold',
+    fontSize: 13,
+  },
   bottomBarRow: {
     position: 'absolute',
     left: 0,
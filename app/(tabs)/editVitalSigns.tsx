@@ -31,22 +31,25 @@ export default function EditVitalSignsScreen() {
         return;
       }
 
-      const response = await fetch(`${API_URL}/patients/${patient.id}/`, {
-        method: 'PATCH',
+      const response = await fetch(`${API_URL}/patients/${patient.id}/vitals/`, {
+        method: 'POST',
         headers: { 
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`
         },
+        // Readings are appended to the patient's vital signs series; the patient keeps the latest one
         body: JSON.stringify({
-          blood_pressure: bloodPressure,
-          heart_rate: parseInt(heartRate),
-          oxygen_saturation: parseInt(oxygenSaturation),
-          electromyography: electromyography,
+          readings: [{
+            blood_pressure: bloodPressure,
+            heart_rate: parseInt(heartRate),
+            oxygen_saturation: parseInt(oxygenSaturation),
+            electromyography: electromyography,
+          }],
         }),
       });
 
       if (response.ok) {
-        const updatedPatient = await response.json();
+        const updatedPatient = (await response.json()).patient;
         Alert.alert('Success', 'Vital signs updated successfully!', [
           {
             text: 'OK',
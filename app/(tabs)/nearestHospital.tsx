@@ -2,10 +2,22 @@ import React, { useEffect, useState } from 'react';
 import { View, Text, StyleSheet, ActivityIndicator, Alert } from 'react-native';
 import MapView, { Marker } from 'react-native-maps';
 import * as Location from 'expo-location';
+import { API_URL } from '../config';
+import { getAccessToken } from '../utils/auth';
+
+interface NearbyHospital {
+  id: number;
+  name: string;
+  hosp_lat: string;
+  hosp_long: string;
+  address: string;
+  distance_km: number;
+}
 
 export default function NearestHospitalScreen() {
   const [location, setLocation] = useState<Location.LocationObjectCoords | null>(null);
   const [loading, setLoading] = useState(true);
+  const [hospitals, setHospitals] = useState<NearbyHospital[]>([]);
 
   useEffect(() => {
     (async () => {
@@ -20,6 +32,21 @@ export default function NearestHospitalScreen() {
       // Get current location
       let location = await Location.getCurrentPositionAsync({});
       setLocation(location.coords);
+
+      // Ask the backend for the closest hospitals to this position
+      try {
+        const token = await getAccessToken();
+        const { latitude, longitude } = location.coords;
+        const res = await fetch(
+          `${API_URL}/hospital/hospitals/nearest/?lat=${latitude}&long=${longitude}&k=5`,
+          { headers: { 'Authorization': `Bearer ${token}` } }
+        );
+        if (res.ok) {
+          setHospitals(await res.json());
+        }
+      } catch (e) {
+        console.error('Error fetching nearest hospitals:', e);
+      }
       setLoading(false);
     })();
   }, []);
@@ -46,17 +73,14 @@ export default function NearestHospitalScreen() {
         }}
         showsUserLocation={true} // Show user's current location on the map
       >
-        {/* Sample hospital markers */}
-        <Marker
-          coordinate={{ latitude: 45.4064, longitude: 11.8778 }}
-          title="Azienda Ospedale"
-          description="Nearest hospital in your area"
-        />
-        <Marker
-          coordinate={{ latitude: 45.4075, longitude: 11.8755 }}
-          title="Monoblocco Ospedale"
-          description="Another nearby hospital"
-        />
+        {hospitals.map((hospital) => (
+          <Marker
+            key={hospital.id}
+            coordinate={{ latitude: Number(hospital.hosp_lat), longitude: Number(hospital.hosp_long) }}
+            title={hospital.name}
+            description={`${hospital.distance_km.toFixed(1)} km - ${hospital.address}`}
+          />
+        ))}
       </MapView>
     </View>
   );
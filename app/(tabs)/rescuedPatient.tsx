@@ -46,14 +46,21 @@ export default function RescuedPatientScreen() {
         return;
       }
 
-      const res = await fetch(`${API_URL}/patients/`, {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json'
-        }
-      });
-      const data = await res.json();
-      setPatients(data.filter((p: Patient) => !p.is_active));
+      // The list is paginated: follow `next` until the last page
+      const rescued: Patient[] = [];
+      let url: string | null = `${API_URL}/patients/?is_active=false&page_size=200`;
+      while (url) {
+        const res: Response = await fetch(url, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json'
+          }
+        });
+        const data = await res.json();
+        rescued.push(...data.results);
+        url = data.next;
+      }
+      setPatients(rescued);
     } catch (e) {
       setPatients([]);
     }
@@ -40,20 +40,25 @@ export default function VitalSignsScreen() {
         return;
       }
 
-      const response = await fetch(`${API_URL}/patients/`, {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json'
+      // Only active patients are requested; the list is paginated, so follow `next` until the last page
+      const active: Patient[] = [];
+      let url: string | null = `${API_URL}/patients/?is_active=true&page_size=200`;
+      while (url) {
+        const response: Response = await fetch(url, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json'
+          }
+        });
+        if (!response.ok) {
+          console.error('Failed to fetch patients');
+          return;
         }
-      });
-      
-      if (response.ok) {
         const data = await response.json();
-        // Filter only active patients
-        setPatients(data.filter((p: Patient) => p.is_active));
-      } else {
-        console.error('Failed to fetch patients');
+        active.push(...data.results);
+        url = data.next;
       }
+      setPatients(active);
     } catch (error) {
       console.error('Error fetching patients:', error);
     } finally {
@@ -50,17 +50,20 @@ export default function VitalSignsRegisterScreen() {
         return;
       }
 
-      const response = await fetch(`${API_URL}/patients/${patientId}/`, {
-        method: 'PATCH',
+      const response = await fetch(`${API_URL}/patients/${patientId}/vitals/`, {
+        method: 'POST',
         headers: { 
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}` // Add authentication token
         },
+        // Readings are appended to the patient's vital signs series; the patient keeps the latest one
         body: JSON.stringify({
-          blood_pressure: bloodPressure,
-          heart_rate: parseInt(heartRate),
-          oxygen_saturation: parseInt(oxygenSaturation),
-          electromyography: electromyography,
+          readings: [{
+            blood_pressure: bloodPressure,
+            heart_rate: parseInt(heartRate),
+            oxygen_saturation: parseInt(oxygenSaturation),
+            electromyography: electromyography,
+          }],
         }),
       });
 
@@ -0,0 +1,140 @@
+"""
+Conditional GET support backed by per-table version tokens.
+
+Every tracked table has a version token and a last-modified time kept in
+the cache named by ``settings.TABLE_VERSION_CACHE``. Model signals replace
+the token after each committed write, so a viewset can build its ETag from the token alone and answer a
+matching ``If-None-Match`` with 304 before running the list query or the
+serializer. Code paths that write without signals (bulk_create,
+bulk_update, queryset.update) must call ``bump_table_version`` themselves.
+
+That cache must be shared by all workers (the default, CACHES['shared']):
+with a per-process cache, a write handled by one worker would not change
+the ETag another worker hands out, and that worker would keep answering
+304 with stale data.
+"""
+
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_TIMEOUT = None  # versions never expire on their own
+
+
+def _cache():
+    return caches[getattr(settings, 'TABLE_VERSION_CACHE', 'shared')]
+
+
+def _cache_key(label):
+    return f'table-version:{label}'
+
+
+def table_label(model):
+    return model._meta.label_lower
+
+
+def bump_table_version(*labels):
+    cache = _cache()
+    keys = [_cache_key(label) for label in labels]
+    previous = cache.get_many(keys)
+    now = timezone.now().replace(microsecond=0)
+    # Last-Modified has whole seconds: each version must be at least a second past the previous one, or a
+    # client that read the previous version earlier in the same second would get a 304 for this one
+    cache.set_many({
+        key: (uuid.uuid4().hex, max(now, previous[key][1] + timedelta(seconds=1)) if key in previous else now)
+        for key in keys
+    }, VERSION_TIMEOUT)
+
+
+def get_table_versions(labels):
+    """Return {label: (token, modified_at)}, starting a new version for any label the cache lost."""
+    cache = _cache()
+    keys = {_cache_key(label): label for label in labels}
+    found = cache.get_many(keys)
+    missing = [label for key, label in keys.items() if key not in found]
+    if missing:
+        # Unknown state counts as a change, so clients can never keep a stale copy
+        now = timezone.now().replace(microsecond=0)
+        for label in missing:
+            entry = (uuid.uuid4().hex, now)
+            cache.add(_cache_key(label), entry, VERSION_TIMEOUT)
+        found = cache.get_many(keys)
+    return {keys[key]: value for key, value in found.items()}
+
+
+def track_model_changes(model, m2m_fields=()):
+    """Bump ``model``'s table version after every committed save/delete (and m2m change)."""
+    label = table_label(model)
+
+    def bump(**kwargs):
+        transaction.on_commit(lambda: bump_table_version(label))
+
+    # weak=False: the receiver is a closure that would otherwise be collected
+    post_save.connect(bump, sender=model, weak=False, dispatch_uid=f'table-version-save:{label}')
+    post_delete.connect(bump, sender=model, weak=False, dispatch_uid=f'table-version-delete:{label}')
+    for field_name in m2m_fields:
+        through = getattr(model, field_name).through
+        m2m_changed.connect(bump, sender=through, weak=False,
+                            dispatch_uid=f'table-version-m2m:{label}.{field_name}')
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified for list and retrieve, checked before any query runs.
+
+    ``conditional_models`` lists the models whose writes can change the
+    response. The ETag also covers the requesting user and role, the full
+    path with query string and the negotiated media type, since all of them
+    change the body.
+    """
+    conditional_models = ()
+
+    def get_conditional_state(self, request):
+        labels = sorted(table_label(model) for model in self.conditional_models)
+        versions = get_table_versions(labels)
+        user = request.user
+        media_type = getattr(request, 'accepted_media_type', '')
+        fingerprint = '|'.join(
+            [str(user.pk), str(getattr(user, 'role', '')), request.get_full_path(), media_type]
+            + [f'{label}={versions[label][0]}' for label in labels]
+        )
+        etag = 'W/"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+        last_modified = max(modified for _, modified in versions.values())
+        return etag, last_modified
+
+    def not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # Weak comparison, as RFC 9110 requires for If-None-Match
+            candidates = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+            return '*' in candidates or etag.removeprefix('W/') in candidates
+        # Only second resolution, so clients should prefer the ETag
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and int(last_modified.timestamp()) <= since
+
+    def conditional(self, request, respond):
+        etag, last_modified = self.get_conditional_state(request)
+        if self.not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = respond()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,116 @@
+"""
+Primary/replica database routing.
+
+Writes, and every read that is not explicitly marked safe for a replica,
+go to the primary (``default``). Viewsets using ``ReplicaReadMixin`` mark
+their GET/HEAD requests safe, so lists, retrieves and message threads are
+spread over ``settings.DATABASE_REPLICAS``. Two things send such a request
+back to the primary, so nobody reads data older than what they just saw:
+
+* the user wrote through a viewset in the last ``REPLICA_STICKY_SECONDS``
+  (read-your-writes), and
+* one of the view's ``conditional_models`` tables changed in that window,
+  since the ETag would already carry the new version while a lagging
+  replica could still return the old rows.
+
+Anything that runs outside such a request (auth, signals, the in-memory
+index loaders, management commands) reads from the primary.
+"""
+
+import contextvars
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from .conditional import get_table_versions, table_label
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def replica_reads_enabled():
+    return _replica_reads.get()
+
+
+@contextmanager
+def replica_reads():
+    """Let reads inside the block go to a replica."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        # The database cache backend holds state that must never lag behind (see CACHES['shared'])
+        if replicas and _replica_reads.get() and model._meta.app_label != 'django_cache':
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _pin_key(user_pk):
+    return f'db-primary-pin:{user_pk}'
+
+
+def _pin_cache():
+    # Shared, so the pin holds whichever worker serves the user's next read
+    return caches['shared']
+
+
+def pin_to_primary(user):
+    _pin_cache().set(_pin_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return _pin_cache().get(_pin_key(user.pk), False)
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from a replica unless the user or the view's tables changed recently."""
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _replica_reads.set(False)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+        user = getattr(request, 'user', None)
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400
+                and user is not None and user.is_authenticated):
+            pin_to_primary(user)
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks run first and always read from the primary
+        super().initial(request, *args, **kwargs)
+        _replica_reads.set(self.can_read_from_replica(request))
+
+    def can_read_from_replica(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()) or request.method not in ('GET', 'HEAD'):
+            return False
+        if request.user.is_authenticated and is_pinned_to_primary(request.user):
+            return False
+        models = getattr(self, 'conditional_models', ())
+        if models:
+            recent = timezone.now() - timedelta(seconds=settings.REPLICA_STICKY_SECONDS)
+            versions = get_table_versions([table_label(model) for model in models])
+            if any(modified_at >= recent for _, modified_at in versions.values()):
+                return False
+        return True
@@ -0,0 +1,234 @@
+"""
+Compiled read path for list endpoints.
+
+A ModelSerializer builds field objects, model instances and attribute
+lookups for every row it renders. For plain list views all of that can be
+worked out once: ``get_read_plan`` inspects the serializer a single time per
+(serializer class, role) and produces a plan of value columns and converters.
+Rows then come straight from ``queryset.values()`` and are converted with
+the serializer's own field objects, so the JSON is byte-identical to the
+regular ModelSerializer output.
+
+Serializers with fields the plan does not understand (custom methods,
+nested serializers, dotted sources) simply keep using the regular path.
+"""
+
+import itertools
+import threading
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework import fields as drf_fields
+from rest_framework import relations
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .instrumentation import timed
+
+def _is_identity(field, model_field):
+    """True when field.to_representation returns database values unchanged."""
+    representation = type(field).to_representation
+    if representation is drf_fields.CharField.to_representation:
+        return model_field.get_internal_type() in ('CharField', 'TextField')
+    if representation is drf_fields.IntegerField.to_representation:
+        return model_field.get_internal_type() in (
+            'IntegerField', 'BigIntegerField', 'SmallIntegerField', 'PositiveIntegerField',
+            'PositiveBigIntegerField', 'PositiveSmallIntegerField', 'AutoField', 'BigAutoField',
+        )
+    if representation is drf_fields.BooleanField.to_representation:
+        return model_field.get_internal_type() == 'BooleanField'
+    if representation is drf_fields.JSONField.to_representation:
+        return not field.binary
+    if representation is drf_fields.ChoiceField.to_representation:
+        # str choices over a text column map back to themselves
+        return (model_field.get_internal_type() in ('CharField', 'TextField')
+                and all(isinstance(key, str) for key in field.choice_strings_to_values.values()))
+    return False
+
+
+def _is_iso_datetime(field):
+    return (type(field).to_representation is drf_fields.DateTimeField.to_representation
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT) is not None
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601
+            and 'timezone' not in vars(field))
+
+
+class _ISODateTime:
+    """DateTimeField converter bound to the active time zone once per render."""
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self, tz):
+        fallback = self.field.to_representation
+
+        def convert(value):
+            # Aware values from the database take the fast path, anything else
+            # goes through the serializer field itself
+            if tz is None or isinstance(value, str) or not timezone.is_aware(value):
+                return fallback(value)
+            value = value.astimezone(tz).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return convert
+
+
+class ReadPlan:
+    def __init__(self, model, columns, converters, many_to_many):
+        self.model = model
+        self.columns = columns
+        # (output name, column, converter or None) in serializer field order
+        self.converters = converters
+        # (output name, related manager name) for many-to-many primary key lists
+        self.many_to_many = many_to_many
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    @timed('serialize')
+    def render(self, rows):
+        rows = list(rows)
+        related = self._load_many_to_many(rows)
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        converters = [
+            (name, column, convert.bind(tz) if isinstance(convert, _ISODateTime) else convert)
+            for name, column, convert in self.converters
+        ]
+        results = []
+        for row in rows:
+            data = {}
+            for name, column, convert in converters:
+                if column is None:
+                    data[name] = related[name].get(row['pk'], [])
+                    continue
+                value = row[column]
+                if value is None:
+                    data[name] = None
+                elif convert is None:
+                    data[name] = value
+                else:
+                    data[name] = convert(value)
+            results.append(data)
+        return results
+
+    def iter_render(self, rows, chunk_size=500):
+        """Render an iterable of value rows lazily, ``chunk_size`` rows at a time."""
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield from self.render(chunk)
+
+    def _load_many_to_many(self, rows):
+        related = {}
+        if not self.many_to_many:
+            return related
+        pks = [row['pk'] for row in rows]
+        for name, accessor in self.many_to_many:
+            field = self.model._meta.get_field(accessor)
+            remote = field.related_model
+            # Same join shape and order as prefetch_related(accessor)
+            query_name = field.related_query_name()
+            values = remote._default_manager.filter(**{f'{query_name}__in': pks}).values_list(query_name, 'pk')
+            grouped = {}
+            for owner_pk, remote_pk in values:
+                grouped.setdefault(owner_pk, []).append(remote_pk)
+            related[name] = grouped
+        return related
+
+
+def _compile(serializer):
+    model = serializer.Meta.model
+    opts = model._meta
+    columns = ['pk']
+    converters = []
+    many_to_many = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        source = field.source
+        if source == '*' or '.' in source:
+            return None
+
+        if isinstance(field, relations.ManyRelatedField):
+            if not isinstance(field.child_relation, relations.PrimaryKeyRelatedField) or field.child_relation.pk_field:
+                return None
+            many_to_many.append((name, source))
+            converters.append((name, None, None))
+            continue
+
+        try:
+            model_field = opts.get_field(source)
+        except Exception:
+            return None
+        if not model_field.concrete or model_field.many_to_many:
+            return None
+
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            if field.pk_field is not None:
+                return None
+            # values('<fk>') yields the raw id, exactly what the PK-only representation returns
+            columns.append(source)
+            converters.append((name, source, None))
+        elif isinstance(field, relations.RelatedField):
+            return None
+        else:
+            columns.append(source)
+            if _is_identity(field, model_field):
+                convert = None
+            elif _is_iso_datetime(field) and settings.USE_TZ:
+                convert = _ISODateTime(field)
+            else:
+                convert = field.to_representation
+            converters.append((name, source, convert))
+
+    return ReadPlan(model, columns, converters, many_to_many)
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+_UNSUPPORTED = object()
+
+
+def get_read_plan(serializer_class, context, role=None):
+    """Return the cached ReadPlan for ``serializer_class`` and ``role``, or None if it can't be compiled."""
+    key = (serializer_class, role)
+    plan = _plans.get(key)
+    if plan is None:
+        compiled = _compile(serializer_class(context=context))
+        with _plans_lock:
+            plan = _plans.setdefault(key, compiled if compiled is not None else _UNSUPPORTED)
+    return None if plan is _UNSUPPORTED else plan
+
+
+class FastListMixin:
+    """Serve ``list`` through a compiled ReadPlan instead of per-row serializer instances.
+
+    Unpaginated lists are streamed when the negotiated renderer supports it,
+    so the whole result never has to be held in memory at once.
+    """
+    stream_chunk_size = 500
+
+    def get_read_plan_role(self):
+        return getattr(self.request.user, 'role', None)
+
+    def list(self, request, *args, **kwargs):
+        plan = get_read_plan(self.get_serializer_class(), self.get_serializer_context(),
+                             self.get_read_plan_role())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        renderer = getattr(request, 'accepted_renderer', None)
+        if hasattr(renderer, 'streaming_response'):
+            rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+            return renderer.streaming_response(plan.iter_render(rows, self.stream_chunk_size),
+                                               asynchronous=isinstance(request._request, ASGIRequest))
+        return Response(plan.render(queryset))
@@ -0,0 +1,270 @@
+"""
+Per-request performance instrumentation.
+
+InstrumentationMiddleware measures every request's wall time, SQL query
+count and time (through a database execute wrapper) and the time spent in
+code marked with ``timed('serialize')`` or ``timed('crypto')``. The numbers
+go out as a ``Server-Timing`` header and into per-view histograms, which
+``metrics_view`` exports in the Prometheus text format together with
+gauges from registered collectors (cache statistics and the like).
+
+Timings live in a context variable, so code outside a request (management
+commands, worker threads) pays only for one lookup per ``timed`` block.
+Histograms are per process: scrape every worker, or sum them in Prometheus.
+"""
+
+import bisect
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PHASES = ('serialize', 'crypto')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,           # send the Server-Timing header to clients
+    'METRICS_ALLOWED_IPS': None,     # None allows every client to read /metrics
+    'METRICS_TOKEN': '',             # if set, scrapers must send "Authorization: Bearer <token>"
+}
+
+
+def instrumentation_setting(name):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+class RequestTimings:
+    __slots__ = ('sql_count', 'sql_time', 'phases', '_active')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._active = set()
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class timed:
+    """Add the time spent in a block (or decorated function) to the current request's ``phase``.
+
+    Nested blocks of the same phase are only counted once, so wrapping both
+    decrypt_message and the derive_key it calls does not double count.
+    """
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        timings = _current.get()
+        if timings is None or self.phase in timings._active:
+            self._timings = None
+            return self
+        timings._active.add(self.phase)
+        self._timings = timings
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timings = self._timings
+        if timings is not None:
+            timings.phases[self.phase] = timings.phases.get(self.phase, 0.0) + time.perf_counter() - self._start
+            timings._active.discard(self.phase)
+        return False
+
+    def __call__(self, func):
+        phase = self.phase
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class TimedRepresentationMixin:
+    """Serializer mixin that accounts ``to_representation`` to the ``serialize`` phase."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+def _sql_wrapper(timings):
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings.sql_time += time.perf_counter() - start
+            timings.sql_count += 1
+    return wrapper
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def expose(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            base = _format_labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {values[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {cumulative}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_format_labels(label_names, labels)}}} {value}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+VIEW_LABELS = ('view', 'method')
+
+requests_total = Counter('http_requests_total', 'Requests by view, method and status code.')
+request_duration = Histogram('http_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS)
+db_queries = Histogram('http_request_db_queries', 'SQL queries per request.', QUERY_COUNT_BUCKETS)
+db_duration = Histogram('http_request_db_duration_seconds', 'Time in SQL per request.', DURATION_BUCKETS)
+phase_duration = {
+    phase: Histogram(f'http_request_{phase}_duration_seconds', f'Time in {phase} code per request.',
+                     DURATION_BUCKETS)
+    for phase in PHASES
+}
+
+_collectors = {}
+
+
+def register_collector(prefix, stats):
+    """Export ``stats()`` (a dict of numbers) as gauges named ``<prefix>_<key>`` on the metrics endpoint."""
+    _collectors[prefix] = stats
+
+
+def reset_metrics():
+    requests_total.reset()
+    for histogram in (request_duration, db_queries, db_duration, *phase_duration.values()):
+        histogram.reset()
+
+
+def render_metrics():
+    lines = requests_total.expose(VIEW_LABELS + ('status',))
+    for histogram in (request_duration, db_queries, db_duration, *phase_duration.values()):
+        lines.extend(histogram.expose(VIEW_LABELS))
+    for prefix, stats in sorted(_collectors.items()):
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'{prefix}_{key}'
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    # REMOTE_ADDR is the peer of this process: behind a reverse proxy every request comes from the
+    # proxy, so the address list alone lets anyone through it. METRICS_TOKEN holds there.
+    allowed = instrumentation_setting('METRICS_ALLOWED_IPS')
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    token = instrumentation_setting('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class InstrumentationMiddleware:
+    """Times each request and its SQL; put it first in MIDDLEWARE so the whole stack is measured."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not instrumentation_setting('ENABLED'):
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_wrapper(timings)))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        labels = (match.view_name if match else 'unmatched', request.method)
+        requests_total.inc(labels + (str(response.status_code),))
+        request_duration.observe(labels, total)
+        db_queries.observe(labels, timings.sql_count)
+        db_duration.observe(labels, timings.sql_time)
+        for phase, seconds in timings.phases.items():
+            phase_duration[phase].observe(labels, seconds)
+
+        if instrumentation_setting('SERVER_TIMING'):
+            # Streaming bodies are produced after this point, so their time is not included
+            entries = [f'db;dur={timings.sql_time * 1000:.2f};desc="{timings.sql_count} queries"']
+            entries += [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in timings.phases.items()]
+            entries.append(f'total;dur={total * 1000:.2f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,152 @@
+"""
+Response renderers and parsers.
+
+FastJSONRenderer produces the same bytes as DRF's JSONRenderer but encodes
+with orjson when it is installed, and can stream a list row by row so large
+unpaginated lists never sit in memory as one body. Under ASGI the stream is
+handed over as an async iterator: given a sync one, Django would collect the
+whole body into a list before sending it. MessagePackRenderer and
+MessagePackParser let mobile clients on weak links negotiate a compact
+binary encoding with ``Accept: application/msgpack``.
+"""
+
+import datetime
+import decimal
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is only needed when a client asks for it
+    msgpack = None
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_drf_encoder = JSONEncoder()
+
+if orjson is not None:
+    # Datetimes, dataclasses and subclasses of str/int/dict/list go through DRF's
+    # encoder so the output matches JSONRenderer byte for byte
+    _ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+                       | orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_NON_STR_KEYS)
+
+
+def _orjson_default(obj):
+    # Subclasses of builtins arrive here because of OPT_PASSTHROUGH_SUBCLASS
+    # (ReturnDict, ReturnList, ErrorDetail, lazy strings, IntEnum, ...)
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, int) and not isinstance(obj, bool):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, (list, tuple)):
+        return list(obj)
+    return _drf_encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in JSONRenderer using orjson for compact output, with row streaming for lists."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_orjson_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Anything orjson can't express exactly (e.g. >64-bit ints) uses the stock encoder
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes the two line terminators that are invalid in JavaScript strings
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+    def encode_row(self, row):
+        return self.render(row)
+
+    def stream(self, rows):
+        """Yield a JSON array of ``rows`` in ~64 KB chunks."""
+        buffer = bytearray(b'[')
+        first = True
+        for row in rows:
+            if not first:
+                buffer += b','
+            first = False
+            buffer += self.encode_row(row)
+            if len(buffer) >= STREAM_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b']'
+        yield bytes(buffer)
+
+    def streaming_response(self, rows, asynchronous=False):
+        content_type = f'{self.media_type}; charset={self.charset}' if self.charset else self.media_type
+        chunks = self.stream(rows)
+        if asynchronous:
+            chunks = _iterate_in_thread(chunks)
+        return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+async def _iterate_in_thread(chunks):
+    # Each chunk is produced in the request's sync thread, which holds its database connection
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Releases the row cursor when the client disconnects mid-body
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def _msgpack_default(obj):
+    # Same textual forms the JSON renderer would produce
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+        return _drf_encoder.default(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return _drf_encoder.default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if msgpack is None:
+            raise RuntimeError('MessagePackRenderer requires the msgpack package')
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if msgpack is None:
+            raise ParseError('MessagePack is not supported by this server')
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
@@ -10,8 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import base64
+import hashlib
+from copy import deepcopy
 from pathlib import Path
 from datetime import timedelta
+from decouple import config, Csv
+from .sqlite import embedded_options
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -32,12 +37,14 @@ ALLOWED_HOSTS = ['*']
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver with websocket support
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -46,10 +53,12 @@ INSTALLED_APPS = [
     'ambulance',
     'dmessages',
     'hospital',
+    'benchmarks',  # load-test data generator and driver (bench_seed, bench_load, bench_compare)
 ]
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+    'Django_config.instrumentation.InstrumentationMiddleware',  # first, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,15 +86,98 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Django_config.wsgi.application'
+ASGI_APPLICATION = 'Django_config.asgi.application'
+
+# Channel layer used to fan out direct messages to websocket consumers.
+# The in-memory layer only works within one process; for several workers swap in
+# a shared layer, e.g. {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [...]}}
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settinf/settings/#auth-password-validators
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Selected from the environment (or a .env file): DB_ENGINE=postgres uses the POSTGRES_*
+# variables of docker-compose.yml, anything else the local SQLite file.
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgres':
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config('POSTGRES_DB', default='er_db'),
+        'USER': config('POSTGRES_USER', default='ER'),
+        'PASSWORD': config('POSTGRES_PASSWORD', default=''),
+        'HOST': config('POSTGRES_HOST', default='localhost'),
+        'PORT': config('POSTGRES_PORT', default=5432, cast=int),
+        'CONN_HEALTH_CHECKS': True,  # check reused connections before handing them out
+        'OPTIONS': {'connect_timeout': config('POSTGRES_CONNECT_TIMEOUT', default=5, cast=int)},
+    }
+    if config('DB_POOL', default=True, cast=bool):
+        # psycopg connection pool shared by all threads of a worker (CONN_MAX_AGE must stay 0)
+        PRIMARY_DATABASE['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+    else:
+        # Persistent connection per thread instead
+        PRIMARY_DATABASE['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+    DATABASES = {'default': PRIMARY_DATABASE}
+    # Read replicas as host[:port], comma separated; same database, user and pool settings
+    for i, replica in enumerate(config('POSTGRES_REPLICAS', default='', cast=Csv())):
+        host, _, port = replica.partition(':')
+        DATABASES[f'replica_{i}'] = {
+            **deepcopy(PRIMARY_DATABASE), 'HOST': host, 'PORT': int(port or PRIMARY_DATABASE['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+        }
     }
+    # Single-box field deployments: WAL, mmap, bigger cache, busy timeout (see Django_config.sqlite)
+    if config('SQLITE_EMBEDDED', default=False, cast=bool):
+        DATABASES['default']['OPTIONS'] = embedded_options(
+            busy_timeout=config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+            mmap_size=config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+            cache_size_kib=config('SQLITE_CACHE_SIZE_KIB', default=64 * 1024, cast=int),
+        )
+
+# Writes wrapped in retry_on_busy try again this many times when SQLite stays locked
+SQLITE_BUSY_RETRIES = 3
+SQLITE_BUSY_RETRY_DELAY = 0.05  # seconds, doubled on each attempt
+
+# Safe requests on the API viewsets read from a replica (see Django_config.db_routers)
+DATABASE_ROUTERS = ['Django_config.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# After a write (by the user, or to the tables a view reads) reads stay on the primary this long
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+# 'default' is per process. 'shared' is for state every worker must see: the
+# per-table versions behind ETags (Django_config.conditional) and the login
+# verification codes (users.verification). It uses Redis when SHARED_CACHE_REDIS_URL
+# is set (needs the redis package), otherwise a table in the primary database
+# created by migrate.
+SHARED_CACHE_REDIS_URL = config('SHARED_CACHE_REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'emergency-default',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': SHARED_CACHE_REDIS_URL,
+    } if SHARED_CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'emergency_shared_cache',
+    },
 }
+TABLE_VERSION_CACHE = 'shared'
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -126,12 +218,21 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # Same JSON as rest_framework's JSONRenderer, encoded with orjson and streamed for
+    # large unpaginated lists; clients may ask for MessagePack with Accept: application/msgpack
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'Django_config.renderers.FastJSONRenderer',
+        'Django_config.renderers.MessagePackRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',  
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'Django_config.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -160,3 +261,80 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'EMAIL-HOST-USER-HERE'
 EMAIL_HOST_PASSWORD = 'HOST-PASSWORD-HERE'
 DEFAULT_FROM_EMAIL = 'DEFAULT-FROM-EMAIL-HERE'
+
+# Direct messages: derived (legacy) and unwrapped conversation keys are cached in memory
+# (see dmessages.utils.key_cache and dmessages.envelope.data_key_cache)
+DMESSAGES_KEY_CACHE_SIZE = 1024
+DMESSAGES_KEY_CACHE_TTL = 3600  # seconds
+# How long a server keeps sealing with a conversation's key version after rotate_message_keys adds a newer one
+DMESSAGES_ACTIVE_KEY_TTL = 60  # seconds
+
+# Master keys that wrap the per-conversation message keys: id -> base64 of 32 random bytes.
+# New conversation keys are wrapped with DMESSAGES_MASTER_KEY_ID. Set DMESSAGES_MASTER_KEY in
+# production; the fallback is derived from SECRET_KEY and only meant for development.
+DMESSAGES_MASTER_KEY_ID = config('DMESSAGES_MASTER_KEY_ID', default='k1')
+DMESSAGES_MASTER_KEYS = {
+    DMESSAGES_MASTER_KEY_ID: config(
+        'DMESSAGES_MASTER_KEY',
+        default=base64.b64encode(hashlib.sha256(f'dmessages-master-key:{SECRET_KEY}'.encode()).digest()).decode(),
+    ),
+}
+# Retired master keys still needed to unwrap older conversation keys, as "id:base64,id:base64"
+for _entry in config('DMESSAGES_RETIRED_MASTER_KEYS', default='', cast=Csv()):
+    _key_id, _, _key = _entry.partition(':')
+    DMESSAGES_MASTER_KEYS.setdefault(_key_id, _key)
+
+# Hospital spatial index grid cell size, in degrees (see hospital.spatial.GeoGridIndex)
+HOSPITAL_INDEX_CELL_SIZE = 0.1
+
+# Ambulance fleet spatial index grid cell size, in degrees (see ambulance.index.AmbulanceIndex)
+AMBULANCE_INDEX_CELL_SIZE = 0.1
+# Each worker keeps its own fleet index and only sees its own commits, so it is rebuilt from the
+# database once it is this many seconds old to pick up moves and status changes made by other workers
+AMBULANCE_INDEX_MAX_AGE = config('AMBULANCE_INDEX_MAX_AGE', default=30, cast=int)
+
+# Ambulance GPS telemetry buffer (see ambulance.telemetry.TelemetryBuffer)
+AMBULANCE_TELEMETRY = {
+    'FLUSH_INTERVAL': 1.0,  # seconds between background flushes, 0 flushes on every request
+    'MAX_BUFFER': 5000,     # fixes held before the request thread flushes inline
+    'BATCH_SIZE': 1000,
+    'MAX_PENDING': 50000,   # fixes kept for retry after failed flushes, older ones are dead-lettered
+}
+
+# Login verification codes (see users.verification), kept in CACHES rather than on the user row
+LOGIN_VERIFICATION = {
+    'CACHE': 'shared',  # a per-process cache fails logins that land on another worker (see users.checks)
+    'TTL': 600,
+    'MAX_ATTEMPTS': 5,
+}
+
+# Outgoing email queue (see users.outbox). Set WORKERS to 0 and run
+# `manage.py process_email_outbox --loop` to deliver from a separate process.
+# Bodies are blanked once sent or given up on; schedule `manage.py purge_email_outbox`
+# to delete those rows after RETENTION seconds.
+EMAIL_OUTBOX = {
+    'WORKERS': config('EMAIL_OUTBOX_WORKERS', default=2, cast=int),
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 30,
+    'POLL_INTERVAL': 5,
+    'CLAIM_TIMEOUT': 300,
+    'RETENTION': 7 * 86400,
+}
+
+# Per-process cache of authenticated users (see users.authentication.UserCache)
+USER_AUTH_CACHE = {
+    'TTL': 30,  # seconds
+    'MAX_SIZE': 10000,
+}
+
+# Per-request timing: Server-Timing header and Prometheus metrics at /metrics
+# (see Django_config.instrumentation)
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    # Checked against REMOTE_ADDR, which is the proxy's address behind a reverse proxy:
+    # set METRICS_TOKEN there, scrapers then send "Authorization: Bearer <token>"
+    'METRICS_ALLOWED_IPS': ['127.0.0.1', '::1'],  # None to let any address scrape
+    'METRICS_TOKEN': config('METRICS_TOKEN', default=''),
+}
@@ -0,0 +1,69 @@
+"""
+SQLite embedded mode: per-connection tuning and retry on a busy database.
+
+``embedded_options()`` is the ``OPTIONS`` dict settings.py uses when
+SQLITE_EMBEDDED is set. Every new connection switches to WAL journaling
+(readers no longer block the writer or each other), ``synchronous=NORMAL``
+(fsync at checkpoints rather than on every commit, still safe in WAL mode),
+memory-mapped reads and a larger page cache. Transactions start with
+BEGIN IMMEDIATE so a writer waits in the busy handler for the lock instead
+of failing when its read transaction has to upgrade.
+
+Writers still get "database is locked" once the busy timeout runs out;
+``retry_on_busy`` retries such a write a few times with backoff.
+"""
+
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+BUSY_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+def embedded_options(busy_timeout=20, mmap_size=256 * 1024 * 1024, cache_size_kib=64 * 1024):
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA mmap_size={mmap_size}',
+        f'PRAGMA cache_size=-{cache_size_kib}',  # negative: KiB rather than pages
+        'PRAGMA temp_store=MEMORY',
+    ]
+    return {
+        'timeout': busy_timeout,  # seconds the busy handler waits for a lock
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join(pragmas),
+    }
+
+
+def is_busy_error(exc):
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in BUSY_MESSAGES)
+
+
+def retry_on_busy(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Call ``func`` again when SQLite reports the database locked.
+
+    Only retries when the call is not nested in another transaction: then
+    the failed attempt has been rolled back completely and is safe to repeat.
+    Attempts and backoff come from SQLITE_BUSY_RETRIES and
+    SQLITE_BUSY_RETRY_DELAY.
+    """
+    if func is None:
+        return lambda func: retry_on_busy(func, using=using)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'SQLITE_BUSY_RETRIES', 3)
+        delay = getattr(settings, 'SQLITE_BUSY_RETRY_DELAY', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (attempt == retries or not is_busy_error(exc)
+                        or connections[using].in_atomic_block):
+                    raise
+            # Exponential backoff with jitter so the retrying writers do not collide again
+            time.sleep(delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return wrapper
@@ -0,0 +1,73 @@
+"""
+Test helpers shared by the app test suites.
+"""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+
+def is_cache_query(sql):
+    tables = [config['LOCATION'] for config in settings.CACHES.values()
+              if config['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache']
+    # The database cache wraps its writes in atomic(), which inside a TestCase means savepoints
+    return sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT')) or any(f'"{table}"' in sql for table in tables)
+
+
+class QueryBudgetMixin:
+    """Assertions that keep endpoints from regressing into N+1 queries.
+
+    ``assertQueryBudget`` fails when a block issues more than ``budget`` SQL
+    queries. ``assertConstantQueries`` runs the same request against a small
+    and a large data set and fails unless both use the same number of queries
+    within the budget, which is what catches per-row lookups.
+
+    Lookups in a database cache table (the ETag versions in CACHES['shared'])
+    and savepoints are not counted: they are a fixed cost per request that depends on the
+    cache backend, and with Redis they are no SQL at all.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        counted = [query for query in context.captured_queries if not is_cache_query(query['sql'])]
+        executed = len(counted)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(counted, start=1)
+            )
+            self.fail(f'{executed} queries executed, budget is {budget}\n{queries}')
+
+    def assertConstantQueries(self, budget, request, grow, small=2, large=20, using='default'):
+        """``grow(n)`` adds ``n`` more rows, ``request()`` performs the call under test."""
+        counts = []
+        for size in (small, large - small):
+            grow(size)
+            with self.assertQueryBudget(budget, using=using) as context:
+                response = request()
+                if response.streaming:
+                    # Streamed lists run their queries while the body is consumed
+                    response.streamed_content = b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+            counts.append(sum(1 for query in context.captured_queries if not is_cache_query(query['sql'])))
+        self.assertEqual(
+            counts[0], counts[1],
+            f'query count grew with result size ({small} rows: {counts[0]}, {large} rows: {counts[1]})',
+        )
+
+
+class FastListMixinAssertions:
+    """Checks that a FastListMixin list renders exactly what the ModelSerializer would."""
+
+    def assertSameAsSerializer(self, rows, serializer_class, instances, user):
+        """``rows`` is the response data, or the raw body of a streamed response."""
+        context = {'request': SimpleNamespace(user=user)}
+        expected = JSONRenderer().render(serializer_class(instances, many=True, context=context).data)
+        if not isinstance(rows, bytes):
+            rows = JSONRenderer().render(rows)
+        self.assertEqual(rows, expected)
@@ -0,0 +1,165 @@
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.core.cache import cache, caches
+from django.db import OperationalError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from ambulance.models import Ambulance
+from hospital.models import Hospital
+from patients.models import Patient
+from users.models import User
+from .conditional import _cache_key, table_label
+from .db_routers import replica_reads_enabled
+from .instrumentation import reset_metrics
+from .sqlite import embedded_options, retry_on_busy
+from .testing import is_cache_query
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        Patient.objects.create(created_by=self.crew, triage_code='red')
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+
+    def timings(self, response):
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/patients/')
+        timings = self.timings(response)
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        self.assertEqual(set(timings), {'db', 'serialize', 'crypto', 'total'})
+        self.assertGreater(float(timings['serialize']['dur']), 0)
+        self.assertEqual(float(timings['crypto']['dur']), 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/patients/')
+        self.client.get('/api/patients/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('http_requests_total{view="patient-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{view="patient-list",method="GET"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{view="patient-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('# TYPE dmessages_key_cache_hits gauge', body)
+
+    def test_disabled(self):
+        with self.settings(INSTRUMENTATION={'ENABLED': False}):
+            response = self.client.get('/api/patients/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('patient-list', self.client.get('/metrics').content.decode())
+
+    def test_metrics_allowed_ips(self):
+        with self.settings(INSTRUMENTATION={'METRICS_ALLOWED_IPS': ['10.0.0.1']}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    def test_metrics_token(self):
+        # Behind a local proxy every scrape arrives from an allowed address; only the token tells them apart
+        with self.settings(INSTRUMENTATION={'METRICS_ALLOWED_IPS': ['127.0.0.1'], 'METRICS_TOKEN': 's3cret'}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+
+# The "replica" is the default database itself, so queries work and each one records where it was routed
+@override_settings(DATABASE_REPLICAS=['default'], REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['shared'].clear()
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.patient = Patient.objects.create(created_by=self.crew, triage_code='red')
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+        # Tables last changed long ago
+        long_ago = datetime.now(dt_timezone.utc) - timedelta(hours=1)
+        caches['shared'].set_many({_cache_key(table_label(model)): ('v1', long_ago)
+                        for model in (Patient, Hospital, Ambulance, User)})
+
+    def replica_reads(self, method, path, data=None):
+        """Return, per SQL query of the request, whether replica reads were enabled."""
+        routed = []
+
+        def record(execute, sql, params, many, context):
+            # ETag version lookups in the shared cache table always go to the primary
+            if not is_cache_query(sql):
+                routed.append(replica_reads_enabled())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 400)
+        self.assertTrue(routed)
+        return routed
+
+    def test_reads_use_replica(self):
+        self.assertTrue(all(self.replica_reads('get', '/api/patients/')))
+        self.assertTrue(all(self.replica_reads('get', f'/api/patients/{self.patient.id}/')))
+
+    def test_writes_use_primary_and_pin_the_user(self):
+        self.assertFalse(any(self.replica_reads('patch', f'/api/patients/{self.patient.id}/',
+                                                {'triage_code': 'green'})))
+        self.assertFalse(any(self.replica_reads('get', f'/api/patients/{self.patient.id}/')))
+        # Other users are not pinned by someone else's write
+        self.client.force_authenticate(User.objects.create_user(username='er', password='pass', role='hospital'))
+        self.assertTrue(all(self.replica_reads('get', '/api/patients/')))
+
+    def test_recent_table_change_uses_primary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.create(created_by=self.crew, triage_code='green')
+        self.assertFalse(any(self.replica_reads('get', '/api/patients/')))
+
+
+@override_settings(SQLITE_BUSY_RETRIES=2, SQLITE_BUSY_RETRY_DELAY=0)
+class RetryOnBusyTests(SimpleTestCase):
+    def failing(self, error, failures):
+        calls = []
+
+        @retry_on_busy
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise error
+            return 'done'
+        return write, calls
+
+    def test_retries_locked_database(self):
+        write, calls = self.failing(OperationalError('database is locked'), 2)
+        self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_retries(self):
+        write, calls = self.failing(OperationalError('database is locked'), 3)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.failing(OperationalError('no such table: x'), 1)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class EmbeddedOptionsTests(SimpleTestCase):
+    def test_pragmas_are_set_on_a_new_connection(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': str(Path(tmp.name) / 'embedded.sqlite3'),
+                                   'OPTIONS': embedded_options(busy_timeout=7)}, alias='embedded')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 7000})
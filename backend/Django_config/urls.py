@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
+from .instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,4 +11,5 @@ urlpatterns = [
     path('api/', include('dmessages.urls')),
     path('api/hospital/', include('hospital.urls')),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
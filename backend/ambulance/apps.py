@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AmbulanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ambulance'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from Django_config.instrumentation import register_collector
+        from .telemetry import telemetry_buffer
+        register_collector('ambulance_telemetry', telemetry_buffer.stats)
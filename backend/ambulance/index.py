@@ -0,0 +1,102 @@
+import threading
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from hospital.spatial import GeoGridIndex
+from .models import Ambulance
+
+
+class AmbulanceIndex:
+    """Spatial index over the fleet, partitioned by status.
+
+    Each status gets its own grid, so a dispatch query for ``available`` units
+    never has to skip over dispatched or offline vehicles.
+    """
+
+    def __init__(self, cell_size=0.1):
+        self.cell_size = cell_size
+        self._partitions = {}
+        self._status = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._status)
+
+    def __contains__(self, pk):
+        return pk in self._status
+
+    def upsert(self, pk, lat, long, status):
+        with self._lock:
+            previous = self._status.get(pk)
+            if previous is not None and previous != status:
+                self._partitions[previous].remove(pk)
+            partition = self._partitions.get(status)
+            if partition is None:
+                partition = self._partitions[status] = GeoGridIndex(self.cell_size)
+            partition.upsert(pk, lat, long)
+            self._status[pk] = status
+
+    def move(self, pk, lat, long):
+        # Position-only update that keeps the unit in its current status partition
+        with self._lock:
+            status = self._status.get(pk)
+            if status is not None:
+                self._partitions[status].upsert(pk, lat, long)
+
+    def remove(self, pk):
+        with self._lock:
+            status = self._status.pop(pk, None)
+            if status is not None:
+                self._partitions[status].remove(pk)
+
+    def nearest(self, lat, long, k=1, status='available', max_distance_km=None):
+        with self._lock:
+            partition = self._partitions.get(status)
+        if partition is None:
+            return []
+        return partition.nearest(lat, long, k, max_distance_km=max_distance_km)
+
+
+_index = None
+_built_at = 0.0
+_build_lock = threading.Lock()
+
+
+def _expired():
+    return time.monotonic() - _built_at > getattr(settings, 'AMBULANCE_INDEX_MAX_AGE', 30)
+
+
+def get_ambulance_index():
+    """Return the process-wide fleet index, loading it from the database on first use.
+
+    Signals only reach the index of the worker that made the commit, so positions
+    and statuses written by other workers show up when the index is rebuilt after
+    ``AMBULANCE_INDEX_MAX_AGE`` seconds. Callers must re-check what they pick from it.
+    """
+    global _index, _built_at
+    if _index is None or _expired():
+        with _build_lock:
+            if _index is None or _expired():
+                index = AmbulanceIndex(cell_size=getattr(settings, 'AMBULANCE_INDEX_CELL_SIZE', 0.1))
+                # Signals keep the index in step with commits on the primary, so build it from there too
+                rows = Ambulance.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'location_lat', 'location_long', 'status')
+                for pk, lat, long, status in rows.iterator():
+                    index.upsert(pk, lat, long, status)
+                _index, _built_at = index, time.monotonic()
+    return _index
+
+
+def index_ambulance(pk, lat, long, status):
+    if _index is not None:
+        _index.upsert(pk, lat, long, status)
+
+
+def unindex_ambulance(pk):
+    if _index is not None:
+        _index.remove(pk)
+
+
+def reset_ambulance_index():
+    global _index
+    with _build_lock:
+        _index = None
@@ -0,0 +1,83 @@
+#compares the status-partitioned fleet index with a naive full scan for k-nearest dispatch
+#all seeded rows are rolled back when the command finishes
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from ambulance.index import AmbulanceIndex
+from ambulance.models import Ambulance
+from hospital.spatial import haversine_km
+from benchmarks.transactions import rolled_back
+
+
+class Command(BaseCommand):
+    help = 'Benchmark k-nearest available ambulance lookup: spatial index vs full scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=10000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('-k', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        # Bounding box the fleet and incidents are spread over (default: north-east Italy)
+        parser.add_argument('--bbox', default='44.5,10.5,46.5,13.5',
+                            help='min_lat,min_long,max_lat,max_long')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        min_lat, min_long, max_lat, max_long = (float(v) for v in options['bbox'].split(','))
+        statuses = ['available'] * 6 + ['dispatched'] * 3 + ['offline']
+        Ambulance.objects.bulk_create([
+            Ambulance(
+                plate_number=f'BENCH-{i:06d}',
+                location_lat=round(rng.uniform(min_lat, max_lat), 6),
+                location_long=round(rng.uniform(min_long, max_long), 6),
+                status=rng.choice(statuses),
+            )
+            for i in range(options['vehicles'])
+        ], batch_size=2000)
+
+        t0 = time.perf_counter()
+        index = AmbulanceIndex()
+        for pk, lat, long, status in Ambulance.objects.values_list(
+                'id', 'location_lat', 'location_long', 'status').iterator():
+            index.upsert(pk, lat, long, status)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        k = options['k']
+        points = [
+            (rng.uniform(min_lat, max_lat), rng.uniform(min_long, max_long))
+            for _ in range(options['queries'])
+        ]
+
+        naive, indexed = [], []
+        for lat, long in points:
+            t0 = time.perf_counter()
+            rows = Ambulance.objects.filter(status='available').values_list(
+                'id', 'location_lat', 'location_long')
+            expected = sorted(
+                (haversine_km(lat, long, float(p_lat), float(p_long)), pk)
+                for pk, p_lat, p_long in rows
+            )[:k]
+            naive.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            result = index.nearest(lat, long, k, status='available')
+            indexed.append(time.perf_counter() - t0)
+
+            if [pk for _, pk in result] != [pk for _, pk in expected]:
+                self.stderr.write(f'mismatch at ({lat}, {long})')
+
+        self.stdout.write(f"vehicles: {options['vehicles']}, queries: {len(points)}, k: {k}")
+        self.stdout.write(f'index build: {build_ms:.1f} ms')
+        self.report('full scan', naive)
+        self.report('index', indexed)
+        self.stdout.write(f'speedup (p50): {statistics.median(naive) / statistics.median(indexed):.0f}x')
+
+    def report(self, label, timings):
+        timings = sorted(t * 1e6 for t in timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'{label:>10}: p50 {statistics.median(timings):10.1f} us   p95 {p95:10.1f} us')
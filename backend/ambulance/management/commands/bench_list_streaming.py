@@ -0,0 +1,54 @@
+#peak Python memory of GET /api/ambulances/ as the fleet grows, streamed vs fully rendered
+#all seeded rows are rolled back when the command finishes
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from ambulance.models import Ambulance
+from ambulance.views import AmbulanceViewSet
+from benchmarks.transactions import rolled_back
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory and time of the ambulance list, streamed vs rendered in one piece'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,50000')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run([int(s) for s in options['sizes'].split(',')])
+
+    def measure(self, fn):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        size = fn()
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, peak, elapsed
+
+    def run(self, sizes):
+        factory = AmbulanceViewSet.as_view({'get': 'list'})
+        seeded = 0
+        self.stdout.write(f"{'rows':>8} {'body MB':>8} {'streamed peak MB':>17} {'buffered peak MB':>17}")
+        for size in sorted(sizes):
+            Ambulance.objects.bulk_create([
+                Ambulance(plate_number=f'STREAM-{i:07d}', location_lat=45.4, location_long=11.87)
+                for i in range(seeded, size)
+            ], batch_size=5000)
+            seeded = size
+
+            def streamed():
+                response = factory(APIRequestFactory().get('/api/ambulances/'))
+                return sum(len(chunk) for chunk in response.streaming_content)
+
+            def buffered():
+                rows = AmbulanceViewSet.serializer_class(
+                    AmbulanceViewSet.queryset.all(), many=True).data
+                return len(JSONRenderer().render(rows))
+
+            body, stream_peak, _ = self.measure(streamed)
+            _, buffer_peak, _ = self.measure(buffered)
+            self.stdout.write(f'{size:>8} {body / 2**20:>8.1f} {stream_peak / 2**20:>17.1f} {buffer_peak / 2**20:>17.1f}')
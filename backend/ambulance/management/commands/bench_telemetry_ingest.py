@@ -0,0 +1,73 @@
+#measures sustained fixes/second through the telemetry endpoint including the bulk flushes
+#all seeded rows are rolled back when the command finishes
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from ambulance.index import reset_ambulance_index
+from ambulance.models import Ambulance, AmbulanceLocation
+from ambulance.telemetry import TelemetryBuffer
+from ambulance import views
+from users.models import User
+from benchmarks.transactions import rolled_back
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batched GPS telemetry ingest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ambulances', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--batch', type=int, default=50, help='fixes per request')
+        parser.add_argument('--max-buffer', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        original = views.telemetry_buffer
+        # Flush inline when the buffer fills so every fix is written inside the timed window
+        views.telemetry_buffer = TelemetryBuffer(flush_interval=3600, max_buffer=options['max_buffer'])
+        try:
+            with rolled_back():
+                self.run(options)
+        finally:
+            views.telemetry_buffer = original
+            reset_ambulance_index()
+
+    def run(self, options):
+        rng = random.Random(1)
+        ambulances = Ambulance.objects.bulk_create([
+            Ambulance(plate_number=f'TEL-{i:05d}', location_lat=45.4, location_long=11.87)
+            for i in range(options['ambulances'])
+        ])
+        reset_ambulance_index()
+        ids = [a.pk for a in ambulances]
+        view = views.AmbulanceViewSet.as_view({'post': 'telemetry'})
+        factory = APIRequestFactory()
+        # one crew on every unit, fixes are only accepted from a unit's own staff
+        crew = User.objects.create_user(username='bench-telemetry', role='ambulance')
+        crew.ambulances.set(ambulances)
+        start = timezone.now()
+        buffer = views.telemetry_buffer
+
+        total = 0
+        t0 = time.perf_counter()
+        for r in range(options['requests']):
+            fixes = [{
+                'ambulance': rng.choice(ids),
+                'lat': 45.4 + rng.uniform(-0.2, 0.2),
+                'long': 11.87 + rng.uniform(-0.2, 0.2),
+                'recorded_at': (start + timedelta(milliseconds=r * 1000 + i)).isoformat(),
+            } for i in range(options['batch'])]
+            request = factory.post('/api/ambulances/telemetry/', {'fixes': fixes}, format='json')
+            force_authenticate(request, crew)
+            response = view(request)
+            assert response.status_code == 202, response.data
+            total += len(fixes)
+        buffer.flush()
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(f"requests: {options['requests']} x {options['batch']} fixes from {len(ids)} ambulances")
+        self.stdout.write(f'history rows: {AmbulanceLocation.objects.filter(ambulance_id__in=ids).count()}')
+        self.stdout.write(f'flushes: {buffer.flushes}')
+        self.stdout.write(f'throughput: {total / elapsed:.0f} fixes/s ({elapsed:.2f} s)')
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0004_remove_ambulance_staff_ambulance_staff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ambulance',
+            name='last_fix_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AmbulanceLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('location_long', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('recorded_at', models.DateTimeField()),
+                ('ambulance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='ambulance.ambulance')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ambulance', 'recorded_at'], name='ambulance_location_track_idx')],
+            },
+        ),
+    ]
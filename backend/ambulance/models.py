@@ -16,6 +16,23 @@ class Ambulance(models.Model):
         default='available'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    last_fix_at = models.DateTimeField(null=True, blank=True) # timestamp of the GPS fix currently in location_lat/long
     
     def __str__(self):
-        return self.plate_number
\ No newline at end of file
+        return self.plate_number
+
+
+class AmbulanceLocation(models.Model):
+    # append-only GPS history written in bulk by the telemetry buffer (see telemetry.py)
+    ambulance = models.ForeignKey(Ambulance, on_delete=models.CASCADE, related_name='locations')
+    location_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    location_long = models.DecimalField(max_digits=9, decimal_places=6)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ambulance', 'recorded_at'], name='ambulance_location_track_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ambulance_id} @ {self.recorded_at}"
\ No newline at end of file
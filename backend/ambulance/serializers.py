@@ -1,8 +1,9 @@
 # Converts ambulance model to/from JSON for REST API
 from rest_framework import serializers
+from Django_config.instrumentation import TimedRepresentationMixin
 from .models import Ambulance
 
-class AmbulanceSerializer(serializers.ModelSerializer):
+class AmbulanceSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Ambulance
         fields = '__all__'
@@ -14,4 +15,11 @@ class AmbulanceSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"location_lat": "Latitude is required"})
         if 'location_long' not in data:
             raise serializers.ValidationError({"location_long": "Longitude is required"})
-        return data
\ No newline at end of file
+        return data
+
+class LocationFixSerializer(serializers.Serializer):
+    # one timestamped GPS fix in a telemetry batch; deliberately not a ModelSerializer
+    ambulance = serializers.IntegerField()
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    long = serializers.FloatField(min_value=-180, max_value=180)
+    recorded_at = serializers.DateTimeField()
\ No newline at end of file
@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from Django_config.conditional import track_model_changes
+from .index import index_ambulance, unindex_ambulance
+from .models import Ambulance
+
+
+@receiver(post_save, sender=Ambulance)
+def update_ambulance_index(sender, instance, **kwargs):
+    # Capture the values now; the instance may change again before the commit
+    values = (instance.pk, instance.location_lat, instance.location_long, instance.status)
+    transaction.on_commit(lambda: index_ambulance(*values))
+
+
+@receiver(post_delete, sender=Ambulance)
+def remove_from_ambulance_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: unindex_ambulance(pk))
+
+
+track_model_changes(Ambulance, m2m_fields=['staff'])
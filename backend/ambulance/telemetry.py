@@ -0,0 +1,183 @@
+#buffers incoming GPS fixes and writes them to the database in bulk
+import atexit
+import logging
+import threading
+from collections import deque
+from decimal import Decimal
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from Django_config.conditional import bump_table_version, table_label
+from Django_config.sqlite import retry_on_busy
+from .index import get_ambulance_index
+from .models import Ambulance, AmbulanceLocation
+
+logger = logging.getLogger(__name__)
+
+COORD_QUANTUM = Decimal('0.000001')
+
+
+class TelemetryBuffer:
+    """Coalesces GPS fixes in memory and flushes them in batches.
+
+    Each flush bulk-inserts every buffered fix into AmbulanceLocation and
+    writes only the newest fix per ambulance back to the Ambulance row, so a
+    vehicle reporting every second costs one row update per flush instead of
+    one per fix. Flushes run on a single background thread, which keeps
+    Ambulance row writes from contending with each other.
+
+    Fixes for ambulances that no longer exist are dropped at write time. If
+    a flush fails anyway (the database is down, say) its fixes go back to
+    the front of the buffer for the next flush; past ``max_pending`` the
+    oldest ones are moved to ``dead_letter`` and logged instead of growing
+    the buffer without bound.
+
+    With ``flush_interval=0`` every ``add`` flushes synchronously, which is
+    what the tests use.
+    """
+
+    def __init__(self, flush_interval=1.0, max_buffer=5000, batch_size=1000, max_pending=50000):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.dead_letter = deque(maxlen=max_pending)
+        self._fixes = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._fixes)
+
+    def add(self, fixes):
+        """Queue ``(ambulance_id, lat, long, recorded_at)`` tuples for the next flush."""
+        with self._lock:
+            self._fixes.extend(fixes)
+            pending = len(self._fixes)
+        if self.flush_interval <= 0:
+            self.flush()
+        elif pending >= self.max_buffer:
+            # Back-pressure: over the limit the caller pays for the flush
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ambulance-telemetry', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Telemetry flush failed')
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                fixes, self._fixes = self._fixes, []
+            if not fixes:
+                return 0
+
+            try:
+                latest = {}
+                for fix in fixes:
+                    current = latest.get(fix[0])
+                    if current is None or fix[3] > current[3]:
+                        latest[fix[0]] = fix
+                changed, unknown = self._write(fixes, latest)
+            except Exception:
+                self.failed_flushes += 1
+                self._requeue(fixes)
+                raise
+            if unknown:
+                dropped = sum(1 for fix in fixes if fix[0] in unknown)
+                logger.warning('Dropped %d telemetry fix(es) for deleted ambulances %s', dropped, sorted(unknown))
+                self.dropped += dropped
+
+            # bulk_update skips post_save, so move the units in the dispatch index (and bump the table version) directly
+            index = get_ambulance_index()
+            for ambulance in changed:
+                index.move(ambulance.pk, ambulance.location_lat, ambulance.location_long)
+
+            self.flushed += len(fixes)
+            self.flushes += 1
+            return len(fixes)
+
+    def _requeue(self, fixes):
+        with self._lock:
+            self._fixes[:0] = fixes
+            overflow = len(self._fixes) - self.max_pending
+            if overflow > 0:
+                self.dead_letter.extend(self._fixes[:overflow])
+                del self._fixes[:overflow]
+        if overflow > 0:
+            logger.error('Telemetry buffer full after failed flushes: %d fix(es) moved to the dead letter queue',
+                         overflow)
+
+    @retry_on_busy
+    def _write(self, fixes, latest):
+        """Write ``fixes``; returns (ambulances moved, ids of ambulances that no longer exist)."""
+        # A single transaction, so a retry after a locked database starts over cleanly
+        with transaction.atomic():
+            # Only move an ambulance forward in time; late fixes go to history only
+            ambulances = list(Ambulance.objects.filter(pk__in=latest).only('id', 'last_fix_at'))
+            # One deleted ambulance must not fail the foreign keys of the whole batch
+            known = {ambulance.pk for ambulance in ambulances}
+            rows = [AmbulanceLocation(ambulance_id=a, location_lat=lat, location_long=long, recorded_at=at)
+                    for a, lat, long, at in fixes if a in known]
+            AmbulanceLocation.objects.bulk_create(rows, batch_size=self.batch_size)
+            changed = []
+            for ambulance in ambulances:
+                _, lat, long, at = latest[ambulance.pk]
+                if ambulance.last_fix_at is None or at > ambulance.last_fix_at:
+                    ambulance.location_lat = lat
+                    ambulance.location_long = long
+                    ambulance.last_fix_at = at
+                    changed.append(ambulance)
+            Ambulance.objects.bulk_update(
+                changed, ['location_lat', 'location_long', 'last_fix_at'], batch_size=self.batch_size,
+            )
+            if changed:
+                transaction.on_commit(lambda: bump_table_version(table_label(Ambulance)))
+        return changed, set(latest) - known
+
+    def stats(self):
+        return {'pending': len(self._fixes), 'flushed': self.flushed, 'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes, 'dropped': self.dropped,
+                'dead_letter': len(self.dead_letter)}
+
+
+def quantize(value):
+    return Decimal(str(value)).quantize(COORD_QUANTUM)
+
+
+_config = getattr(settings, 'AMBULANCE_TELEMETRY', {})
+telemetry_buffer = TelemetryBuffer(
+    flush_interval=_config.get('FLUSH_INTERVAL', 1.0),
+    max_buffer=_config.get('MAX_BUFFER', 5000),
+    batch_size=_config.get('BATCH_SIZE', 1000),
+    max_pending=_config.get('MAX_PENDING', 50000),
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        telemetry_buffer.flush()
+    except Exception:
+        logger.exception('Telemetry flush at exit failed')
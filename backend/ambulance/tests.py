@@ -1,3 +1,267 @@
-from django.test import TestCase
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
+import warnings
+from asgiref.sync import sync_to_async
+from django.db import OperationalError
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.test import APIClient
+from Django_config.testing import QueryBudgetMixin, FastListMixinAssertions
+from hospital.spatial import haversine_km
+from users.models import User
+from .index import get_ambulance_index, reset_ambulance_index
+from .models import Ambulance, AmbulanceLocation
+from .serializers import AmbulanceSerializer
+from .telemetry import TelemetryBuffer, telemetry_buffer
 
-# Create your tests here.
+
+class AmbulanceQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        reset_ambulance_index()
+        self.crew = [User.objects.create_user(username=f'crew{i}', password='pass', role='ambulance')
+                     for i in range(3)]
+        self.client = APIClient()
+
+    def add_ambulances(self, n):
+        # on_commit callbacks keep the in-memory index current, run them inside the test transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            start = Ambulance.objects.count()
+            for i in range(start, start + n):
+                ambulance = Ambulance.objects.create(
+                    plate_number=f'AMB-{i}', location_lat=45.4 + i / 1000, location_long=11.87,
+                )
+                ambulance.staff.set(self.crew)
+
+    def test_list(self):
+        # ambulances + prefetched staff
+        self.assertConstantQueries(2, lambda: self.client.get('/api/ambulances/'), self.add_ambulances)
+
+    def test_detail(self):
+        self.add_ambulances(1)
+        ambulance = Ambulance.objects.get()
+        with self.assertQueryBudget(2):
+            response = self.client.get(f'/api/ambulances/{ambulance.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_dispatch(self):
+        # index build on first use is a one-off, warm it before measuring
+        self.add_ambulances(1)
+        self.client.get('/api/ambulances/dispatch/?lat=45.4&long=11.87')
+        self.assertConstantQueries(
+            2, lambda: self.client.get('/api/ambulances/dispatch/?lat=45.4&long=11.87&k=50'),
+            self.add_ambulances,
+        )
+
+
+
+class AmbulanceFastListTests(FastListMixinAssertions, TestCase):
+    def test_list_matches_model_serializer(self):
+        crew = [User.objects.create_user(username=f'crew{i}', password='pass', role='ambulance') for i in range(3)]
+        Ambulance.objects.create(plate_number='A', location_lat=45.123456, location_long=-11.5).staff.set(crew)
+        Ambulance.objects.create(plate_number='B', location_lat=0, location_long=0, status='offline')
+        response = APIClient().get('/api/ambulances/')
+        self.assertTrue(response.streaming)
+        self.assertSameAsSerializer(b''.join(response.streaming_content), AmbulanceSerializer,
+                                    Ambulance.objects.prefetch_related('staff'), None)
+
+    async def test_list_streams_asynchronously_under_asgi(self):
+        await Ambulance.objects.abulk_create(
+            Ambulance(plate_number=f'AMB-{i}', location_lat=45.4 + i / 1000, location_long=11.87) for i in range(1000)
+        )
+        response = await AsyncClient().get('/api/ambulances/')
+        self.assertTrue(response.is_async)
+        # a sync iterator would be collected into one list, with a warning, before the first byte is sent
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            chunks = [chunk async for chunk in response]
+        self.assertGreater(len(chunks), 1)
+        await sync_to_async(self.assertSameAsSerializer)(b''.join(chunks), AmbulanceSerializer,
+                                                         Ambulance.objects.prefetch_related('staff'), None)
+
+    def test_list_as_messagepack(self):
+        import msgpack
+        Ambulance.objects.create(plate_number='A', location_lat=45.123456, location_long=-11.5)
+        response = APIClient().get('/api/ambulances/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)[0]['location_lat'], '45.123456')
+
+
+class DispatchTests(TestCase):
+    def setUp(self):
+        reset_ambulance_index()
+        self.addCleanup(reset_ambulance_index)
+        get_ambulance_index()  # built now, so the commits below are what keeps it current
+        rng = random.Random(7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.units = [
+                Ambulance.objects.create(plate_number=f'AMB-{i}', status=('available', 'dispatched', 'offline')[i % 3],
+                                         location_lat=round(45 + rng.uniform(-0.5, 0.5), 6),
+                                         location_long=round(11.8 + rng.uniform(-0.5, 0.5), 6))
+                for i in range(60)
+            ]
+        self.client = APIClient()
+
+    def dispatch(self, **params):
+        response = self.client.get('/api/ambulances/dispatch/', {'lat': 45.0, 'long': 11.8, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def brute_force(self, status, k):
+        ranked = sorted((haversine_km(45.0, 11.8, float(unit.location_lat), float(unit.location_long)), unit.id)
+                        for unit in Ambulance.objects.filter(status=status))
+        return ranked[:k]
+
+    def test_nearest_first_like_brute_force(self):
+        for status, k in (('available', 5), ('offline', 20), ('dispatched', 50)):
+            results = self.dispatch(status=status, k=k)
+            expected = self.brute_force(status, k)
+            self.assertEqual([row['id'] for row in results], [pk for _, pk in expected])
+            for row, (distance, _) in zip(results, expected):
+                self.assertAlmostEqual(row['distance_km'], distance, places=3)
+
+    def test_only_the_requested_status(self):
+        for status in ('available', 'dispatched', 'offline'):
+            self.assertEqual({row['status'] for row in self.dispatch(status=status, k=50)}, {status})
+        self.assertEqual(len(self.dispatch(k=50)), 20)
+        response = self.client.get('/api/ambulances/dispatch/', {'lat': 45, 'long': 11.8, 'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_status_change_moves_the_unit_between_partitions(self):
+        nearest = self.dispatch(k=1)[0]['id']
+        unit = Ambulance.objects.get(pk=nearest)
+        with self.captureOnCommitCallbacks(execute=True):
+            unit.status = 'dispatched'
+            unit.save()
+        self.assertNotIn(nearest, [row['id'] for row in self.dispatch(k=50)])
+        self.assertIn(nearest, [row['id'] for row in self.dispatch(status='dispatched', k=50)])
+
+    def test_stale_index_entries_are_refilled(self):
+        # update() skips the signals, so the index still lists these units as available
+        stale = [pk for _, pk in self.brute_force('available', 5)]
+        Ambulance.objects.filter(pk__in=stale).update(status='offline')
+        results = self.dispatch(k=3)
+        self.assertEqual([row['id'] for row in results], [pk for _, pk in self.brute_force('available', 3)])
+        self.assertFalse(set(stale) & {row['id'] for row in results})
+
+    def test_distances_come_from_the_database_row(self):
+        # Moved by another worker: this index still has the old position
+        nearest = self.brute_force('available', 1)[0][1]
+        Ambulance.objects.filter(pk=nearest).update(location_lat=45.3)
+        results = self.dispatch(k=5)
+        expected = self.brute_force('available', 5)
+        self.assertEqual([row['id'] for row in results], [pk for _, pk in expected])
+        for row, (distance, _) in zip(results, expected):
+            self.assertAlmostEqual(row['distance_km'], distance, places=3)
+
+    def test_index_is_rebuilt_once_expired(self):
+        unit = Ambulance.objects.filter(status='offline').first()
+        Ambulance.objects.filter(pk=unit.pk).update(status='available', location_lat=45.0, location_long=11.8)
+        self.assertNotIn(unit.id, [row['id'] for row in self.dispatch(k=1)])
+        with override_settings(AMBULANCE_INDEX_MAX_AGE=-1):
+            self.assertEqual(self.dispatch(k=1)[0]['id'], unit.id)
+
+
+class TelemetryTests(TestCase):
+    def setUp(self):
+        reset_ambulance_index()
+        self.addCleanup(reset_ambulance_index)
+        # Flush on every request instead of on the background thread
+        patcher = mock.patch.object(telemetry_buffer, 'flush_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ambulance = Ambulance.objects.create(plate_number='AMB-1', location_lat=45.4, location_long=11.87)
+            self.other = Ambulance.objects.create(plate_number='AMB-2', location_lat=45.5, location_long=11.9)
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.crew.ambulances.set([self.ambulance, self.other])
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+        self.t0 = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def fix(self, ambulance, lat, long, seconds):
+        return {'ambulance': ambulance.id, 'lat': lat, 'long': long,
+                'recorded_at': (self.t0 + timedelta(seconds=seconds)).isoformat()}
+
+    def post(self, *fixes):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/ambulances/telemetry/', {'fixes': list(fixes)}, format='json')
+
+    def test_ingest_writes_history_and_moves_the_unit(self):
+        response = self.post(self.fix(self.ambulance, 45.0, 11.0, 0))
+        self.assertEqual(response.status_code, 202)
+        self.ambulance.refresh_from_db()
+        self.assertEqual((self.ambulance.location_lat, self.ambulance.location_long),
+                         (Decimal('45.000000'), Decimal('11.000000')))
+        self.assertEqual(self.ambulance.last_fix_at, self.t0)
+        self.assertEqual(AmbulanceLocation.objects.filter(ambulance=self.ambulance).count(), 1)
+        # The dispatch index follows the move without a post_save
+        self.assertEqual(get_ambulance_index().nearest(45.0, 11.0, 1)[0][1], self.ambulance.id)
+
+    def test_coalesces_fixes_per_ambulance(self):
+        self.post(self.fix(self.ambulance, 45.1, 11.1, 2), self.fix(self.ambulance, 45.3, 11.3, 3),
+                  self.fix(self.ambulance, 45.2, 11.2, 1), self.fix(self.other, 46.0, 12.0, 1))
+        self.ambulance.refresh_from_db()
+        self.assertEqual(self.ambulance.location_lat, Decimal('45.300000'))
+        self.assertEqual(self.ambulance.last_fix_at, self.t0 + timedelta(seconds=3))
+        self.assertEqual(sorted(AmbulanceLocation.objects.filter(ambulance=self.ambulance)
+                                .values_list('location_lat', flat=True)),
+                         [Decimal('45.100000'), Decimal('45.200000'), Decimal('45.300000')])
+        self.assertEqual(Ambulance.objects.get(pk=self.other.pk).location_lat, Decimal('46.000000'))
+
+    def test_late_fix_only_goes_to_history(self):
+        self.post(self.fix(self.ambulance, 45.3, 11.3, 10))
+        self.post(self.fix(self.ambulance, 45.1, 11.1, 5))
+        self.ambulance.refresh_from_db()
+        self.assertEqual((self.ambulance.location_lat, self.ambulance.last_fix_at),
+                         (Decimal('45.300000'), self.t0 + timedelta(seconds=10)))
+        self.assertEqual(AmbulanceLocation.objects.filter(ambulance=self.ambulance).count(), 2)
+
+    def test_deleted_ambulance_does_not_poison_the_batch(self):
+        buffer = TelemetryBuffer(flush_interval=0)
+        gone = self.other.id
+        self.other.delete()
+        with self.assertLogs('ambulance.telemetry', 'WARNING'):
+            buffer.add([(gone, Decimal('46'), Decimal('12'), self.t0),
+                        (self.ambulance.id, Decimal('45.2'), Decimal('11.2'), self.t0)])
+        self.assertEqual((buffer.dropped, len(buffer)), (1, 0))
+        self.assertEqual(list(AmbulanceLocation.objects.values_list('ambulance_id', flat=True)), [self.ambulance.id])
+
+    def test_failed_flush_is_requeued_then_dead_lettered(self):
+        buffer = TelemetryBuffer(flush_interval=0, max_pending=2)
+        fixes = [(self.ambulance.id, Decimal('45'), Decimal('11'), self.t0 + timedelta(seconds=i)) for i in range(3)]
+        with mock.patch.object(buffer, '_write', side_effect=OperationalError('database is down')):
+            with self.assertRaises(OperationalError):
+                buffer.add(fixes[:1])
+            self.assertEqual((len(buffer), buffer.failed_flushes), (1, 1))
+            with self.assertRaises(OperationalError), self.assertLogs('ambulance.telemetry', 'ERROR'):
+                buffer.add(fixes[1:])
+        # The oldest fix went to the dead letter queue, the newer ones are written by the next flush
+        self.assertEqual(list(buffer.dead_letter), fixes[:1])
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(AmbulanceLocation.objects.count(), 2)
+
+    def test_requires_authentication(self):
+        response = APIClient().post('/api/ambulances/telemetry/', {'fixes': [self.fix(self.ambulance, 45, 11, 0)]},
+                                    format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_unknown_ambulances(self):
+        response = self.post({'ambulance': 9999, 'lat': 45, 'long': 11, 'recorded_at': self.t0.isoformat()})
+        self.assertEqual((response.status_code, response.data['ambulances']), (400, [9999]))
+
+    def test_accepts_units_this_worker_has_not_indexed(self):
+        get_ambulance_index()
+        # Registered by another worker: this process never ran the on_commit index update
+        unit = Ambulance.objects.create(plate_number='AMB-3', location_lat=45.6, location_long=11.9)
+        unit.staff.add(self.crew)
+        self.assertEqual(self.post(self.fix(unit, 45.0, 11.0, 0)).status_code, 202)
+        self.assertEqual(AmbulanceLocation.objects.filter(ambulance=unit).count(), 1)
+
+    def test_only_the_crew_reports_a_position(self):
+        self.crew.ambulances.remove(self.other)
+        response = self.post(self.fix(self.ambulance, 45.0, 11.0, 0), self.fix(self.other, 45.0, 11.0, 0))
+        self.assertEqual((response.status_code, response.data['ambulances']), (403, [self.other.id]))
+        self.client.force_authenticate(User.objects.create_user(username='nurse', password='pass', role='hospital'))
+        self.assertEqual(self.post(self.fix(self.ambulance, 45.0, 11.0, 0)).status_code, 403)
+        self.assertFalse(AmbulanceLocation.objects.exists())
@@ -1,8 +1,99 @@
 #provides full CRUD REST API endpoints for ambulance (GET, POST, PUT, DELETE)
+from django.db.models import Exists, OuterRef
 from rest_framework.viewsets import ModelViewSet
+from Django_config.conditional import ConditionalGetMixin
+from Django_config.db_routers import ReplicaReadMixin
+from Django_config.fast_serializers import FastListMixin
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
 from .models import Ambulance
-from .serializers import AmbulanceSerializer
+from .serializers import AmbulanceSerializer, LocationFixSerializer
+from .telemetry import telemetry_buffer, quantize
+from .index import get_ambulance_index
+from hospital.spatial import haversine_km
 
-class AmbulanceViewSet(ModelViewSet):
-    queryset = Ambulance.objects.all()
-    serializer_class = AmbulanceSerializer
\ No newline at end of file
+STATUS_VALUES = {choice for choice, _ in Ambulance._meta.get_field('status').choices}
+# Dispatch asks the index for this many times k units, so a few stale entries don't leave the answer short
+DISPATCH_OVERFETCH = 2
+DISPATCH_MAX_FETCH = 400
+
+class AmbulanceViewSet(ReplicaReadMixin, ConditionalGetMixin, FastListMixin, ModelViewSet):
+    # staff is a many-to-many, prefetch it so listing the fleet is two queries total
+    queryset = Ambulance.objects.prefetch_related('staff')
+    conditional_models = [Ambulance]
+    serializer_class = AmbulanceSerializer
+
+    #k nearest ambulances (available by default) to an incident point, from the in-memory fleet index
+    #(named dispatch_candidates because APIView.dispatch must not be overridden)
+    @action(detail=False, methods=['get'], url_path='dispatch')
+    def dispatch_candidates(self, request):
+        try:
+            lat = float(request.query_params['lat'])
+            long = float(request.query_params['long'])
+            k = int(request.query_params.get('k', 5))
+        except (KeyError, ValueError):
+            return Response({'error': 'lat and long are required numbers, k must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= long <= 180):
+            return Response({'error': 'lat/long out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        wanted_status = request.query_params.get('status', 'available')
+        if wanted_status not in STATUS_VALUES:
+            return Response({'error': f'status must be one of {sorted(STATUS_VALUES)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        k = max(1, min(k, 50))
+
+        index = get_ambulance_index()
+        results, checked, fetch = [], set(), k * DISPATCH_OVERFETCH
+        while True:
+            matches = index.nearest(lat, long, fetch, status=wanted_status)
+            unchecked = [(distance, pk) for distance, pk in matches if pk not in checked]
+            ambulances = Ambulance.objects.prefetch_related('staff').in_bulk([pk for _, pk in unchecked])
+            for _, pk in unchecked:
+                checked.add(pk)
+                ambulance = ambulances.get(pk)
+                # The index is updated on commit and may lag other workers; skip units whose status changed
+                if ambulance is None or ambulance.status != wanted_status:
+                    continue
+                data = AmbulanceSerializer(ambulance).data
+                # and rank by the position just loaded, not the indexed one
+                data['distance_km'] = round(haversine_km(lat, long, float(ambulance.location_lat),
+                                                         float(ambulance.location_long)), 3)
+                results.append(data)
+            # Refill from further out until k fresh units are found or the partition runs out
+            if len(results) >= k or len(matches) < fetch or fetch >= DISPATCH_MAX_FETCH:
+                break
+            fetch = min(fetch * 2, DISPATCH_MAX_FETCH)
+        results.sort(key=lambda data: data['distance_km'])
+        return Response(results[:k])
+
+    #batched GPS ingest: fixes are buffered and written in bulk, see telemetry.py
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def telemetry(self, request):
+        fixes = request.data.get('fixes') if isinstance(request.data, dict) else request.data
+        if not isinstance(fixes, list) or not fixes:
+            return Response({'error': 'fixes must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = LocationFixSerializer(data=fixes, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        # Checked against the database, the in-memory index of this worker may not know a unit registered elsewhere
+        ids = {fix['ambulance'] for fix in serializer.validated_data}
+        crewed = dict(Ambulance.objects.filter(pk__in=ids).annotate(crewed=Exists(
+            Ambulance.staff.through.objects.filter(ambulance_id=OuterRef('pk'), user_id=request.user.pk)
+        )).values_list('pk', 'crewed'))
+        unknown = sorted(ids - crewed.keys())
+        if unknown:
+            return Response({'error': 'Unknown ambulances', 'ambulances': unknown},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Only a unit's own crew reports its position
+        foreign = sorted(pk for pk, is_crew in crewed.items() if not is_crew)
+        if foreign:
+            return Response({'error': 'Not on the staff of these ambulances', 'ambulances': foreign},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        telemetry_buffer.add([
+            (fix['ambulance'], quantize(fix['lat']), quantize(fix['long']), fix['recorded_at'])
+            for fix in serializer.validated_data
+        ])
+        return Response({'accepted': len(serializer.validated_data)}, status=status.HTTP_202_ACCEPTED)
\ No newline at end of file
@@ -0,0 +1,144 @@
+#seeded synthetic data for load tests: users, hospitals, ambulances, patients and messages
+import random
+import uuid
+from dataclasses import dataclass
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from Django_config.conditional import bump_table_version, table_label
+from ambulance.index import reset_ambulance_index
+from ambulance.models import Ambulance
+from dmessages.models import Message
+from dmessages.envelope import data_key_cache, encrypt_for_conversation
+from dmessages.inbox import rebuild_inbox
+from hospital.index import reset_hospital_index
+from hospital.models import Hospital
+from patients.models import Patient
+from users.models import OutboxEmail, User
+
+# Every generated row carries one of these markers so clear_benchmark_data never touches real data
+USERNAME_PREFIX = 'bench_'
+EMAIL_DOMAIN = 'bench.invalid'
+TAG = 'BENCH-'
+PASSWORD = 'bench-password'
+
+TRIAGE_CODES = [code for code, _ in Patient.TRIAGE_CHOICES]
+SYMPTOMS = [category for category, _ in Patient.SYMPTOM_CATEGORIES]
+
+
+@dataclass
+class Scale:
+    hospitals: int = 5
+    ambulances: int = 20
+    ambulance_staff: int = 40
+    hospital_staff: int = 10
+    patients: int = 500
+    messages: int = 2000
+
+    def times(self, factor):
+        return Scale(**{name: max(1, int(value * factor)) for name, value in vars(self).items()})
+
+
+def seeded_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def random_point(rng):
+    # North-east Italy, where the hospitals in the demo data are
+    return round(rng.uniform(44.5, 46.5), 6), round(rng.uniform(10.5, 13.5), 6)
+
+
+def random_patient_fields(rng):
+    return {
+        'name': f'{TAG}patient',
+        'triage_code': rng.choice(TRIAGE_CODES),
+        'symptoms': rng.sample(SYMPTOMS, rng.randint(0, 2)),
+        'heart_rate': rng.randint(45, 160),
+        'oxygen_saturation': rng.randint(80, 100),
+        'blood_pressure': f'{rng.randint(90, 180)}/{rng.randint(50, 110)}',
+    }
+
+
+def generate(scale, seed=42, batch_size=1000):
+    """Insert a reproducible data set of the given ``Scale``; the same seed gives the same rows."""
+    rng = random.Random(seed)
+    # Hash once: a PBKDF2 hash per user would dominate the seeding time
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        users = []
+        for role, count in (('ambulance', scale.ambulance_staff), ('hospital', scale.hospital_staff)):
+            for i in range(count):
+                username = f'{USERNAME_PREFIX}{role}_{i}'
+                users.append(User(id=seeded_uuid(rng), username=username, email=f'{username}@{EMAIL_DOMAIN}',
+                                  role=role, password=password))
+        User.objects.bulk_create(users, batch_size=batch_size)
+        crews = [user for user in users if user.role == 'ambulance']
+
+        hospitals = Hospital.objects.bulk_create([
+            Hospital(name=f'{TAG}hospital-{i}', hosp_lat=lat, hosp_long=long, address='benchmark')
+            for i, (lat, long) in enumerate(random_point(rng) for _ in range(scale.hospitals))
+        ], batch_size=batch_size)
+
+        ambulances = Ambulance.objects.bulk_create([
+            Ambulance(plate_number=f'{TAG}{i:05d}', location_lat=lat, location_long=long,
+                      status=rng.choice(['available', 'available', 'dispatched', 'offline']))
+            for i, (lat, long) in enumerate(random_point(rng) for _ in range(scale.ambulances))
+        ], batch_size=batch_size)
+        Ambulance.staff.through.objects.bulk_create([
+            Ambulance.staff.through(ambulance_id=ambulances[i % len(ambulances)].id, user_id=crew.id)
+            for i, crew in enumerate(crews)
+        ], batch_size=batch_size)
+
+        Patient.objects.bulk_create([
+            Patient(patient_id=f'{TAG}{i:06d}', hasID=True, created_by=rng.choice(crews),
+                    hospital=rng.choice(hospitals), assigned_ambulance=rng.choice(ambulances),
+                    is_active=rng.random() < 0.7, **random_patient_fields(rng))
+            for i in range(scale.patients)
+        ], batch_size=batch_size)
+
+        # Everyone talks to a few regular peers, as on a real shift; each conversation gets one data key
+        conversations = [(user, peer) for user in users for peer in rng.sample(users, 3) if peer is not user]
+        messages = []
+        for _ in range(scale.messages):
+            sender, receiver = rng.choice(conversations)
+            if rng.random() < 0.5:
+                sender, receiver = receiver, sender
+            text = f'{TAG}message {rng.getrandbits(32):08x}'
+            messages.append(Message(id=seeded_uuid(rng), sender=sender, receiver=receiver,
+                                    encrypted_message=encrypt_for_conversation(text, sender.id, receiver.id)))
+        Message.objects.bulk_create(messages, batch_size=batch_size)
+        rebuild_inbox()
+
+        transaction.on_commit(_invalidate)
+
+    return {
+        'users': len(users),
+        'hospitals': len(hospitals),
+        'ambulances': len(ambulances),
+        'patients': scale.patients,
+        'messages': len(messages),
+    }
+
+
+def clear_benchmark_data():
+    """Delete everything ``generate`` and the load driver created."""
+    with transaction.atomic():
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        # Patients created during a load run only point back to the bench users
+        Patient.objects.filter(created_by__in=users).delete()
+        Patient.objects.filter(patient_id__startswith=TAG).delete()
+        Ambulance.objects.filter(plate_number__startswith=TAG).delete()
+        Hospital.objects.filter(name__startswith=TAG).delete()
+        OutboxEmail.objects.filter(recipients__icontains=f'@{EMAIL_DOMAIN}').delete()
+        deleted, _ = users.delete()  # cascades to their messages
+        transaction.on_commit(_invalidate)
+    return deleted
+
+
+def _invalidate():
+    # Bulk queries skip post_save/post_delete: drop this process's in-memory indexes and
+    # conversation keys (they reload lazily) and the cached ETag versions of the touched tables
+    reset_hospital_index()
+    reset_ambulance_index()
+    data_key_cache.clear()
+    bump_table_version(*(table_label(model) for model in (User, Hospital, Ambulance, Patient)))
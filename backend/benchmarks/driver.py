@@ -0,0 +1,294 @@
+"""
+Scripted load driver for the REST API.
+
+Worker threads pick weighted scenarios (login/verify, patient list/create,
+ambulance updates, message send/decrypt) and record latency, status and
+SQL query count for every request. Requests go either through Django
+in-process (``InProcessTransport``) or over HTTP to a running server
+(``HTTPTransport``, which reads the count from the Server-Timing header).
+"""
+
+import http.client
+import json
+import math
+import platform
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from ambulance.models import Ambulance
+from dmessages.models import Message
+from users.models import OutboxEmail, User
+from .datagen import PASSWORD, USERNAME_PREFIX, random_patient_fields, random_point
+
+
+class InProcessTransport:
+    """Calls the Django handler directly in this thread; counts SQL queries per request."""
+    counts_queries = True
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        data = json.dumps(body) if body is not None else None
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(method, path, data or '', content_type='application/json', **headers)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, content, len(queries)
+
+
+SERVER_TIMING_QUERIES = re.compile(r'(?:^|,)\s*db;[^,]*desc="(\d+) queries"')
+
+
+def queries_from_server_timing(header):
+    # InstrumentationMiddleware reports the SQL count as `db;dur=..;desc="N queries"`
+    match = SERVER_TIMING_QUERIES.search(header or '')
+    return int(match.group(1)) if match else None
+
+
+class HTTPTransport:
+    """Keep-alive HTTP connection to a running server; SQL counts come from its Server-Timing header."""
+    counts_queries = True
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body) if body is not None else None
+        try:
+            self.connection.request(method, self.prefix + path, body=data, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read(), queries_from_server_timing(response.getheader('Server-Timing'))
+        except Exception:
+            self.connection.close()  # reconnect on the next request
+            raise
+
+
+class Recorder:
+    def __init__(self, record_from=0.0):
+        self.record_from = record_from  # perf_counter() before which requests are warm-up only
+        self.samples = {}  # label -> list of (seconds, status, sql count)
+        self._lock = threading.Lock()
+
+    def add(self, label, started, seconds, status, queries):
+        if started < self.record_from:
+            return
+        with self._lock:
+            self.samples.setdefault(label, []).append((seconds, status, queries))
+
+
+class Session:
+    """One worker's view of the seeded data plus a transport; scenarios call ``call``."""
+
+    def __init__(self, transport, recorder, fixtures, rng, own_users=None):
+        self.transport = transport
+        self.recorder = recorder
+        self.fixtures = fixtures
+        self.rng = rng
+        # Users only this worker logs in as, so two workers never overwrite each other's verification code
+        self.own_users = own_users or fixtures.users
+
+    def call(self, label, method, path, body=None, user=None):
+        token = self.fixtures.tokens[user.id] if user is not None else None
+        start = time.perf_counter()
+        try:
+            status, content, queries = self.transport.request(method, path, body, token)
+        except Exception:
+            status, content, queries = 0, b'', None
+        self.recorder.add(label, start, time.perf_counter() - start, status, queries)
+        return status, content
+
+    def crew(self):
+        return self.rng.choice(self.fixtures.crews)
+
+    def anyone(self):
+        return self.rng.choice(self.fixtures.users)
+
+
+class Fixtures:
+    """Seeded users (with access tokens) and ambulances the scenarios act on."""
+
+    def __init__(self):
+        self.users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('username'))
+        if len(self.users) < 2:
+            raise ValueError('No benchmark data, run `manage.py bench_seed` first')
+        self.crews = [user for user in self.users if user.role == 'ambulance']
+        self.tokens = {user.id: str(RefreshToken.for_user(user).access_token) for user in self.users}
+        self.ambulances = list(Ambulance.objects.filter(staff__in=self.crews).distinct().values_list(
+            'id', 'plate_number'))
+        # Reuse the seeded conversations so message keys come from the cache as they would in production
+        by_id = {user.id: user for user in self.users}
+        pairs = (Message.objects.filter(sender__in=self.users).values_list('sender_id', 'receiver_id')
+                 .distinct().order_by('sender_id', 'receiver_id'))
+        self.conversations = [(by_id[s], by_id[r]) for s, r in pairs if s in by_id and r in by_id]
+
+
+# Scenarios: each performs one user action, which may be more than one request
+
+LOGIN_CODE = re.compile(r'verification code is: (\d+)')
+
+
+def login_verify(session):
+    user = session.rng.choice(session.own_users)
+    status, _ = session.call('POST /api/login/', 'POST', '/api/login/',
+                             {'username': user.username, 'password': PASSWORD})
+    if status != 200:
+        return
+    # The code only exists in the server's cache and in the queued email, so read it from the outbox
+    # (delivery blanks the body: the server must run with its outbox workers off)
+    body = (OutboxEmail.objects.filter(recipients__icontains=f'"{user.email}"').order_by('-id')
+            .values_list('body', flat=True).first())
+    match = LOGIN_CODE.search(body or '')
+    code = match.group(1) if match else None
+    session.call('POST /api/verify-login/', 'POST', '/api/verify-login/',
+                 {'username': user.username, 'verification_code': code})
+
+
+def patient_list(session):
+    session.call('GET /api/patients/', 'GET', '/api/patients/?is_active=true&page_size=50', user=session.anyone())
+
+
+def patient_create(session):
+    session.call('POST /api/patients/', 'POST', '/api/patients/', random_patient_fields(session.rng),
+                 user=session.crew())
+
+
+def ambulance_update(session):
+    ambulance_id, plate = session.rng.choice(session.fixtures.ambulances)
+    lat, long = random_point(session.rng)
+    session.call('PATCH /api/ambulances/{id}/', 'PATCH', f'/api/ambulances/{ambulance_id}/',
+                 {'plate_number': plate, 'location_lat': lat, 'location_long': long}, user=session.crew())
+
+
+def message_send_decrypt(session):
+    sender, receiver = session.rng.choice(session.fixtures.conversations)
+    status, content = session.call('POST /api/messages/', 'POST', '/api/messages/',
+                                   {'receiver': str(receiver.id), 'plain_message': 'load test'}, user=sender)
+    if status != 201:
+        return
+    message_id = json.loads(content)['id']
+    session.call('GET /api/messages/{id}/decrypt/', 'GET', f'/api/messages/{message_id}/decrypt/', user=receiver)
+
+
+SCENARIOS = {
+    'login_verify': (login_verify, 1),
+    'patient_list': (patient_list, 4),
+    'patient_create': (patient_create, 2),
+    'ambulance_update': (ambulance_update, 3),
+    'message_send_decrypt': (message_send_decrypt, 2),
+}
+
+
+def run_load(transport_factory, scenarios=None, concurrency=4, duration=10.0, requests=None, seed=42, warmup=0.0):
+    """Run the weighted scenarios from ``concurrency`` threads until ``duration`` seconds or ``requests`` actions.
+
+    The first ``warmup`` seconds fill caches (derived message keys, users,
+    indexes) and are not recorded.
+    """
+    names = list(scenarios or SCENARIOS)
+    functions = [SCENARIOS[name][0] for name in names]
+    weights = [SCENARIOS[name][1] for name in names]
+    fixtures = Fixtures()
+    recorder = Recorder()
+    budget = {'left': requests}
+    budget_lock = threading.Lock()
+    deadline = None
+
+    def take():
+        now = time.perf_counter()
+        if budget['left'] is None:
+            return now < deadline
+        if now < recorder.record_from:
+            return True
+        with budget_lock:
+            budget['left'] -= 1
+            return budget['left'] >= 0
+
+    def worker(index):
+        session = Session(transport_factory(), recorder, fixtures, random.Random(seed + index),
+                          fixtures.users[index::concurrency])
+        try:
+            while take():
+                session.rng.choices(functions, weights)[0](session)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started_at = timezone.now()
+    start = recorder.record_from = time.perf_counter() + warmup
+    deadline = start + duration
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return summarize(recorder, elapsed, started_at, {
+        'concurrency': concurrency, 'duration': duration, 'requests': requests, 'seed': seed, 'warmup': warmup,
+        'scenarios': names,
+    })
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder, elapsed, started_at, options):
+    endpoints = {}
+    total = errors = 0
+    for label, samples in sorted(recorder.samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+        failed = sum(1 for _, status, _ in samples if not 200 <= status < 400)
+        queries = [count for _, _, count in samples if count is not None]
+        endpoints[label] = {
+            'count': len(samples),
+            'errors': failed,
+            'rps': round(len(samples) / elapsed, 2),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p95': round(percentile(latencies, 0.95), 3),
+                'p99': round(percentile(latencies, 0.99), 3),
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'sql': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+            } if queries else None,
+        }
+        total += len(samples)
+        errors += failed
+    return {
+        'meta': {
+            'started_at': started_at.isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            **options,
+        },
+        'totals': {
+            'requests': total,
+            'errors': errors,
+            'elapsed_s': round(elapsed, 3),
+            'rps': round(total / elapsed, 2),
+        },
+        'endpoints': endpoints,
+    }
@@ -0,0 +1,54 @@
+#compares two bench_load JSON reports and fails when an endpoint got slower than the threshold
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Compare two bench_load reports (baseline first) and flag latency, throughput and SQL regressions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('candidate')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='percent change in p95 latency or rps counted as a regression')
+
+    def handle(self, *args, **options):
+        baseline, candidate = (self.load(options[name]) for name in ('baseline', 'candidate'))
+        threshold = options['threshold']
+        regressions = []
+
+        self.stdout.write(f"{'endpoint':<34}{'p95 base':>10}{'p95 new':>10}{'change':>9}"
+                          f"{'rps change':>12}{'sql base':>10}{'sql new':>9}")
+        for label, new in candidate['endpoints'].items():
+            old = baseline['endpoints'].get(label)
+            if old is None:
+                self.stdout.write(f'{label:<34} (new endpoint)')
+                continue
+            p95_change = self.change(old['latency_ms']['p95'], new['latency_ms']['p95'])
+            rps_change = self.change(old['rps'], new['rps'])
+            old_sql = old['sql']['mean'] if old['sql'] else None
+            new_sql = new['sql']['mean'] if new['sql'] else None
+            self.stdout.write(f"{label:<34}{old['latency_ms']['p95']:>10.2f}{new['latency_ms']['p95']:>10.2f}"
+                              f"{p95_change:>+8.1f}%{rps_change:>+11.1f}%"
+                              f"{'-' if old_sql is None else old_sql:>10}{'-' if new_sql is None else new_sql:>9}")
+            if p95_change > threshold:
+                regressions.append(f'{label}: p95 {p95_change:+.1f}%')
+            if rps_change < -threshold:
+                regressions.append(f'{label}: rps {rps_change:+.1f}%')
+            # Means wobble with cache hits and misses; half a query more per request is a real change
+            if old_sql is not None and new_sql is not None and new_sql - old_sql >= 0.5:
+                regressions.append(f'{label}: SQL queries {old_sql} -> {new_sql}')
+
+        if regressions:
+            raise CommandError('regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write('no regressions')
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'cannot read {path}: {exc}')
+
+    def change(self, old, new):
+        return (new - old) / old * 100 if old else 0.0
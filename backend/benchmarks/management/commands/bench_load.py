@@ -0,0 +1,56 @@
+#drives a scripted mix of API calls against the seeded data and saves latency/throughput/SQL stats as JSON
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from benchmarks.driver import SCENARIOS, HTTPTransport, InProcessTransport, run_load
+
+
+class Command(BaseCommand):
+    help = 'Run the API load driver (in-process, or against --url) and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='base URL of a running server, e.g. http://127.0.0.1:8000; '
+                                          'default calls Django in-process and also counts SQL queries')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+        parser.add_argument('--requests', type=int, help='stop after this many scenario runs instead')
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='limit to these scenarios (repeatable), default all')
+        parser.add_argument('--warmup', type=float, default=2.0, help='unrecorded seconds to warm caches first')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='write the JSON report here')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            factory = lambda: HTTPTransport(options['url'])
+        else:
+            factory = InProcessTransport
+
+        # In-process logins must not send real mail; the locmem backend keeps the outbox path intact.
+        # Queued codes are read back from the outbox, and delivery would blank them: keep them pending
+        # (a server under --url needs EMAIL_OUTBOX_WORKERS=0 for the same reason)
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                               EMAIL_OUTBOX={'WORKERS': 0}):
+            try:
+                report = run_load(factory, options['scenario'], options['concurrency'], options['duration'],
+                                  options['requests'], options['seed'], options['warmup'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        report['meta']['target'] = options['url'] or 'in-process'
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"report written to {options['output']}")
+
+    def print_report(self, report):
+        totals = report['totals']
+        self.stdout.write(f"{report['meta']['target']} on {report['meta']['database']}: {totals['requests']} requests "
+                          f"in {totals['elapsed_s']} s, {totals['rps']} req/s, {totals['errors']} errors")
+        self.stdout.write(f"{'endpoint':<34}{'count':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'sql':>7}")
+        for label, stats in report['endpoints'].items():
+            latency = stats['latency_ms']
+            sql = f"{stats['sql']['mean']:.1f}" if stats['sql'] else '-'
+            self.stdout.write(f"{label:<34}{stats['count']:>7}{stats['rps']:>9.1f}{latency['p50']:>9.2f}"
+                              f"{latency['p95']:>9.2f}{latency['p99']:>9.2f}{sql:>7}")
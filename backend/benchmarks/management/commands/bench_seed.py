@@ -0,0 +1,26 @@
+#inserts the synthetic benchmark data set (kept, unlike the per-app bench_* commands) for bench_load
+import time
+from django.core.management.base import BaseCommand
+from benchmarks.datagen import Scale, clear_benchmark_data, generate
+
+
+class Command(BaseCommand):
+    help = 'Seed reproducible synthetic users, hospitals, ambulances, patients and messages for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='multiplier on the base data set (5 hospitals, 20 ambulances, 50 staff, '
+                                 '500 patients, 2000 messages)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help='only delete existing benchmark data')
+
+    def handle(self, *args, **options):
+        deleted = clear_benchmark_data()
+        if deleted:
+            self.stdout.write(f'removed {deleted} rows of previous benchmark data')
+        if options['clear']:
+            return
+        t0 = time.perf_counter()
+        counts = generate(Scale().times(options['scale']), seed=options['seed'])
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(f'seeded {summary} in {time.perf_counter() - t0:.1f} s')
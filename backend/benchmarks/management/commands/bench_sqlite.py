@@ -0,0 +1,86 @@
+#concurrency benchmark for SQLite: mixed patient creates and list reads with the default settings vs embedded mode
+#each mode runs in a child process on a fresh temporary database file, so the real database is never touched
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from benchmarks.datagen import Scale, generate
+from benchmarks.driver import InProcessTransport, run_load
+
+MODES = {'default': '0', 'embedded': '1'}  # value of SQLITE_EMBEDDED
+SCENARIOS = ['patient_create', 'patient_list']
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite with default settings and in embedded mode under concurrent patient writes and reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+        parser.add_argument('--patients', type=int, default=2000, help='patients seeded before the run')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='write both reports as JSON here')
+        parser.add_argument('--run-mode', choices=sorted(MODES), help='internal: run one mode in this process')
+
+    def handle(self, *args, **options):
+        if options['run_mode']:
+            self.run_mode(options)
+            return
+
+        reports = {}
+        for mode, embedded in MODES.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {**os.environ, 'DB_ENGINE': 'sqlite', 'SQLITE_EMBEDDED': embedded,
+                       'SQLITE_PATH': str(Path(tmp) / 'bench.sqlite3')}
+                argv = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'bench_sqlite',
+                        '--run-mode', mode]
+                for name in ('concurrency', 'duration', 'patients', 'seed'):
+                    argv += [f'--{name}', str(options[name])]
+                self.stdout.write(f'running {mode} mode ...')
+                result = subprocess.run(argv, env=env, capture_output=True, text=True)
+                if result.returncode:
+                    raise CommandError(f'{mode} run failed:\n{result.stderr}')
+                reports[mode] = json.loads(result.stdout)
+
+        self.print_comparison(reports)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(reports, f, indent=2)
+            self.stdout.write(f"reports written to {options['output']}")
+
+    def run_mode(self, options):
+        call_command('migrate', verbosity=0)
+        t0 = time.perf_counter()
+        generate(Scale(patients=options['patients'], messages=0), seed=options['seed'])
+        seeded = time.perf_counter() - t0
+        pragmas = {name: connection.cursor().execute(f'PRAGMA {name}').fetchone()[0]
+                   for name in ('journal_mode', 'synchronous', 'busy_timeout')}
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                               EMAIL_OUTBOX={'WORKERS': 0}):
+            report = run_load(InProcessTransport, SCENARIOS, options['concurrency'], options['duration'],
+                              seed=options['seed'], warmup=1.0)
+        report['meta'].update(pragmas=pragmas, seed_s=round(seeded, 2))
+        # stdout is the JSON report the parent process reads
+        self.stdout.write(json.dumps(report))
+
+    def print_comparison(self, reports):
+        self.stdout.write(f"{'mode':<10}{'endpoint':<22}{'count':>7}{'rps':>9}{'errors':>8}"
+                          f"{'p50':>9}{'p95':>9}{'p99':>10}")
+        for mode, report in reports.items():
+            for label, stats in report['endpoints'].items():
+                latency = stats['latency_ms']
+                self.stdout.write(f"{mode:<10}{label:<22}{stats['count']:>7}{stats['rps']:>9.1f}{stats['errors']:>8}"
+                                  f"{latency['p50']:>9.2f}{latency['p95']:>9.2f}{latency['p99']:>10.2f}")
+        for mode, report in reports.items():
+            totals, pragmas = report['totals'], report['meta']['pragmas']
+            self.stdout.write(f"{mode}: {totals['rps']} req/s, {totals['errors']} errors "
+                              f"(journal_mode={pragmas['journal_mode']}, synchronous={pragmas['synchronous']}, "
+                              f"busy_timeout={pragmas['busy_timeout']} ms)")
@@ -0,0 +1,41 @@
+from django.test import TransactionTestCase, override_settings
+from dmessages.envelope import data_key_cache
+from dmessages.models import Message
+from patients.models import Patient
+from users.models import User
+from .datagen import Scale, clear_benchmark_data, generate
+from .driver import InProcessTransport, SCENARIOS, run_load
+
+TINY = Scale(hospitals=2, ambulances=3, ambulance_staff=4, hospital_staff=2, patients=20, messages=30)
+
+
+# Worker threads use their own database connections, so the data has to be committed
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX={'WORKERS': 0})
+class LoadDriverTests(TransactionTestCase):
+    def setUp(self):
+        # Table flushes between tests bypass the delete signals that evict cached conversation keys
+        data_key_cache.clear()
+
+    def test_seed_is_reproducible_and_clearable(self):
+        generate(TINY, seed=7)
+        users = list(User.objects.order_by('username').values_list('id', 'username'))
+        messages = set(Message.objects.values_list('id', flat=True))
+        clear_benchmark_data()
+        self.assertFalse(User.objects.exists())
+        generate(TINY, seed=7)
+        self.assertEqual(list(User.objects.order_by('username').values_list('id', 'username')), users)
+        self.assertEqual(set(Message.objects.values_list('id', flat=True)), messages)
+        self.assertEqual(Patient.objects.count(), TINY.patients)
+
+    def test_every_scenario_runs_and_is_reported(self):
+        generate(TINY, seed=7)
+        # One worker: threads writing to the shared in-memory test database hit SQLite table locks
+        report = run_load(InProcessTransport, concurrency=1, requests=120, seed=3)
+        self.assertEqual(report['totals']['errors'], 0)
+        labels = set(report['endpoints'])
+        self.assertEqual(len(labels), 7, labels)  # login, verify and message send/decrypt are two requests each
+        for stats in report['endpoints'].values():
+            self.assertLessEqual(stats['latency_ms']['p50'], stats['latency_ms']['p99'])
+            self.assertIsNotNone(stats['sql'])
+        self.assertEqual(set(report['meta']['scenarios']), set(SCENARIOS))
@@ -0,0 +1,11 @@
+#bench commands seed their rows inside rolled_back(), so nothing they create reaches the database
+from contextlib import contextmanager
+from django.db import transaction
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Run the block in a transaction that is rolled back when it exits, normally or not."""
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
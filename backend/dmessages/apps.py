@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class DMessagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dmessages'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from Django_config.instrumentation import register_collector
+        from .envelope import data_key_cache
+        from .utils import key_cache
+        register_collector('dmessages_key_cache', key_cache.stats)
+        register_collector('dmessages_data_key_cache', data_key_cache.stats)
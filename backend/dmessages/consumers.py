@@ -0,0 +1,25 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+
+def user_group_name(user_id):
+    return f'dm_user_{user_id}'
+
+
+class MessageConsumer(AsyncJsonWebsocketConsumer):
+    # One long-lived socket per device; new messages are pushed to every socket of the receiver
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group_name = user_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def message_created(self, event):
+        await self.send_json({'type': 'message.created', 'message': event['message']})
@@ -0,0 +1,155 @@
+"""
+Envelope encryption for direct messages.
+
+Every conversation gets a random 256-bit data key, stored in
+ConversationKey wrapped (AES-GCM) under a server master key from
+``settings.DMESSAGES_MASTER_KEYS``. Unwrapped keys are cached, so
+encrypting or decrypting a message is a single AES-GCM operation.
+
+Ciphertexts in this format are ``"v1:" + base64(key id + nonce + tag +
+ciphertext)``; the key id is the ConversationKey primary key and, with the
+version prefix, is authenticated as associated data. Anything without the
+prefix is a legacy base64 ``nonce + tag + ciphertext`` blob and is still
+decrypted with the PBKDF2 key derived from the two user ids.
+"""
+
+import base64
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from Django_config.instrumentation import timed
+from .models import ConversationKey
+from .utils import (
+    CONVERSATION_SALT, NONCE_SIZE, TAG_SIZE, DerivedKeyCache, conversation_secret, decrypt_message,
+    decode_envelope, is_envelope, seal, unseal_raw,
+)
+
+DATA_KEY_SIZE = 32
+
+data_key_cache = DerivedKeyCache(
+    maxsize=getattr(settings, 'DMESSAGES_KEY_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'DMESSAGES_KEY_CACHE_TTL', 3600),
+)
+
+
+def conversation_pair(user_a_id, user_b_id):
+    # Same order as conversation_secret, so both directions share one key
+    a, b = str(user_a_id), str(user_b_id)
+    return min(a, b), max(a, b)
+
+
+def master_key(key_id):
+    try:
+        key = base64.b64decode(settings.DMESSAGES_MASTER_KEYS[key_id])
+    except KeyError:
+        raise ImproperlyConfigured(f'Unknown dmessages master key id {key_id!r}')
+    if len(key) != DATA_KEY_SIZE:
+        raise ImproperlyConfigured(f'dmessages master key {key_id!r} must be {DATA_KEY_SIZE} bytes')
+    return key
+
+
+def _wrap_aad(user_low_id, user_high_id, version):
+    # Binds a wrapped key to its row: it cannot be copied to another conversation or version
+    return f'{user_low_id}:{user_high_id}:{version}'.encode()
+
+
+def wrap_key(data_key, master_key_id, aad):
+    cipher = AES.new(master_key(master_key_id), AES.MODE_GCM, nonce=get_random_bytes(NONCE_SIZE))
+    cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(data_key)
+    return cipher.nonce + tag + ciphertext
+
+
+def unwrap_key(row):
+    blob = bytes(row.wrapped_key)
+    nonce, tag, ciphertext = blob[:NONCE_SIZE], blob[NONCE_SIZE:NONCE_SIZE + TAG_SIZE], blob[NONCE_SIZE + TAG_SIZE:]
+    cipher = AES.new(master_key(row.master_key_id), AES.MODE_GCM, nonce=nonce)
+    cipher.update(_wrap_aad(row.user_low_id, row.user_high_id, row.version))
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+def rewrap_key(row, master_key_id):
+    """Wrap the row's data key under another master key; the caller saves the row."""
+    row.wrapped_key = wrap_key(unwrap_key(row), master_key_id,
+                               _wrap_aad(row.user_low_id, row.user_high_id, row.version))
+    row.master_key_id = master_key_id
+
+
+def create_conversation_key(user_a_id, user_b_id, version=1):
+    """Insert a new wrapped data key for the conversation, or return the row another request just created."""
+    low, high = conversation_pair(user_a_id, user_b_id)
+    master_key_id = settings.DMESSAGES_MASTER_KEY_ID
+    row = ConversationKey(
+        user_low_id=low, user_high_id=high, version=version, master_key_id=master_key_id,
+        wrapped_key=wrap_key(get_random_bytes(DATA_KEY_SIZE), master_key_id, _wrap_aad(low, high, version)),
+    )
+    try:
+        with transaction.atomic():
+            row.save()
+    except IntegrityError:
+        return ConversationKey.objects.get(user_low_id=low, user_high_id=high, version=version)
+    return row
+
+
+def _remember_active_key(low, high, row, key):
+    # Kept briefly: a new key version from rotate_message_keys must reach every server soon
+    data_key_cache.put(('active', low, high), (row.pk, key), ttl=getattr(settings, 'DMESSAGES_ACTIVE_KEY_TTL', 60))
+    # Messages are read back right after they are sent: have the key ready for that too
+    data_key_cache.put(('id', row.pk), (low, high, key))
+
+
+def active_key(user_a_id, user_b_id):
+    """(key id, data key) new messages of the conversation are encrypted with: its newest version."""
+    low, high = conversation_pair(user_a_id, user_b_id)
+    cached = data_key_cache.get(('active', low, high))
+    if cached is not None:
+        return cached
+    row = ConversationKey.objects.filter(user_low_id=low, user_high_id=high).order_by('-version').first()
+    if row is None:
+        row = create_conversation_key(low, high)
+        key = unwrap_key(row)
+        # The new row commits or rolls back with the caller's transaction; caching it before then could
+        # hand a rolled back key (and an id the database may reuse) to every later message
+        transaction.on_commit(lambda: _remember_active_key(low, high, row, key))
+    else:
+        key = unwrap_key(row)
+        _remember_active_key(low, high, row, key)
+    return row.pk, key
+
+
+def key_by_id(key_id):
+    """(user_low_id, user_high_id, data key) of a ConversationKey row."""
+    def load():
+        row = ConversationKey.objects.get(pk=key_id)
+        return str(row.user_low_id), str(row.user_high_id), unwrap_key(row)
+    return data_key_cache.get_or_load(('id', key_id), load)
+
+
+def forget_key(row):
+    data_key_cache.discard(('id', row.pk))
+    data_key_cache.discard(('active', str(row.user_low_id), str(row.user_high_id)))
+
+
+@timed('crypto')
+def encrypt_for_conversation(plain_text, user_a_id, user_b_id):
+    key_id, key = active_key(user_a_id, user_b_id)
+    return seal(plain_text, key_id, key)
+
+
+@timed('crypto')
+def decrypt_for_conversation(enc_text, user_a_id, user_b_id):
+    if not is_envelope(enc_text):
+        return decrypt_message(enc_text, conversation_secret(user_a_id, user_b_id), CONVERSATION_SALT)
+    key_id, raw = decode_envelope(enc_text)
+    pair = conversation_pair(user_a_id, user_b_id)
+    low, high, key = key_by_id(key_id)
+    if (low, high) != pair:
+        # The cached entry may be for a row that was rolled back and whose id got reused
+        data_key_cache.discard(('id', key_id))
+        low, high, key = key_by_id(key_id)
+        if (low, high) != pair:
+            raise ValueError('Message key belongs to another conversation')
+    return unseal_raw(raw, key)
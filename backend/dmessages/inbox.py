@@ -0,0 +1,76 @@
+#per-conversation inbox counters (InboxEntry): last message time and unread count, updated as messages change
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import InboxEntry, Message
+
+
+def _bump(owner_id, peer_id, timestamp, unread):
+    changes = {'last_message_at': Greatest('last_message_at', Value(timestamp, output_field=DateTimeField()))}
+    if unread:
+        changes['unread_count'] = F('unread_count') + 1
+    entries = InboxEntry.objects.filter(owner_id=owner_id, peer_id=peer_id)
+    if entries.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            InboxEntry.objects.create(owner_id=owner_id, peer_id=peer_id, last_message_at=timestamp,
+                                      unread_count=int(unread))
+    except IntegrityError:
+        # The first message the other way round created the row in the meantime
+        entries.update(**changes)
+
+
+def record_message(message):
+    """Count a new message in the sender's and the receiver's inbox."""
+    _bump(message.sender_id, message.receiver_id, message.timestamp, unread=False)
+    if message.receiver_id != message.sender_id:
+        _bump(message.receiver_id, message.sender_id, message.timestamp, unread=message.read_at is None)
+
+
+def mark_read(user, peer_id):
+    """Mark everything ``peer_id`` sent to ``user`` as read; returns how many messages were unread."""
+    with transaction.atomic():
+        marked = Message.objects.filter(sender_id=peer_id, receiver=user, read_at__isnull=True).update(
+            read_at=timezone.now())
+        if marked:
+            # Subtract what was marked rather than zeroing: a message arriving meanwhile stays unread
+            InboxEntry.objects.filter(owner=user, peer_id=peer_id).update(
+                unread_count=Greatest(F('unread_count') - marked, 0))
+    return marked
+
+
+def forget_message(message):
+    """Take a deleted message out of both inboxes."""
+    a, b = message.sender_id, message.receiver_id
+    if message.read_at is None and a != b:
+        InboxEntry.objects.filter(owner_id=b, peer_id=a, unread_count__gt=0).update(
+            unread_count=F('unread_count') - 1)
+    entries = InboxEntry.objects.filter(Q(owner_id=a, peer_id=b) | Q(owner_id=b, peer_id=a))
+    if not entries.filter(last_message_at__lte=message.timestamp).exists():
+        return
+    latest = (Message.objects.filter(Q(sender_id=a, receiver_id=b) | Q(sender_id=b, receiver_id=a))
+              .aggregate(last=Max('timestamp'))['last'])
+    if latest is None:
+        entries.delete()
+    else:
+        entries.update(last_message_at=latest)
+
+
+def rebuild_inbox():
+    """Recompute every InboxEntry from the messages table (after bulk loads that skip signals)."""
+    summary = {}
+    rows = (Message.objects.values('sender_id', 'receiver_id')
+            .annotate(last=Max('timestamp'), unread=Count('pk', filter=Q(read_at__isnull=True))))
+    for row in rows.iterator():
+        sender, receiver = row['sender_id'], row['receiver_id']
+        for owner, peer, unread in ((sender, receiver, 0), (receiver, sender, row['unread'])):
+            last, count = summary.get((owner, peer), (row['last'], 0))
+            summary[owner, peer] = (max(last, row['last']), count + (unread if owner != peer else 0))
+    with transaction.atomic():
+        InboxEntry.objects.all().delete()
+        InboxEntry.objects.bulk_create([
+            InboxEntry(owner_id=owner, peer_id=peer, last_message_at=last, unread_count=unread)
+            for (owner, peer), (last, unread) in summary.items()
+        ], batch_size=500)
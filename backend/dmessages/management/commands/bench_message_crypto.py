@@ -0,0 +1,65 @@
+#micro-benchmark for per-message encrypt/decrypt cost: legacy PBKDF2 keys with and without the cache vs envelope keys
+#the users and conversation keys the envelope run needs are rolled back afterwards
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from dmessages.envelope import data_key_cache, decrypt_for_conversation, encrypt_for_conversation
+from dmessages.utils import (
+    encrypt_message, decrypt_message, conversation_secret, key_cache, CONVERSATION_SALT,
+)
+from users.models import User
+from benchmarks.transactions import rolled_back
+
+
+class Command(BaseCommand):
+    help = 'Measure per-message encrypt+decrypt cost for legacy derived keys and per-conversation envelope keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument('--conversations', type=int, default=5)
+
+    def run(self, secrets, n, use_cache):
+        start = time.perf_counter()
+        for i in range(n):
+            secret = secrets[i % len(secrets)]
+            enc = encrypt_message('benchmark message', secret, CONVERSATION_SALT, use_cache=use_cache)
+            decrypt_message(enc, secret, CONVERSATION_SALT, use_cache=use_cache)
+        return (time.perf_counter() - start) / n
+
+    def run_envelope(self, pairs, n):
+        start = time.perf_counter()
+        for i in range(n):
+            a, b = pairs[i % len(pairs)]
+            decrypt_for_conversation(encrypt_for_conversation('benchmark message', a, b), a, b)
+        return (time.perf_counter() - start) / n
+
+    def handle(self, *args, **options):
+        n = options['messages']
+        secrets = [
+            conversation_secret(uuid.uuid4(), uuid.uuid4())
+            for _ in range(options['conversations'])
+        ]
+        key_cache.clear()
+        uncached = self.run(secrets, n, use_cache=False)
+        cached = self.run(secrets, n, use_cache=True)
+        stats = key_cache.stats()
+
+        data_key_cache.clear()
+        with rolled_back():
+            users = User.objects.bulk_create([
+                User(username=f'bench-crypto-{uuid.uuid4().hex[:12]}', role='ambulance')
+                for _ in range(options['conversations'] + 1)
+            ])
+            pairs = [(users[0].id, user.id) for user in users[1:]]
+            # First message per conversation creates and wraps its key
+            cold = self.run_envelope(pairs, len(pairs))
+            envelope = self.run_envelope(pairs, n)
+        data_key_cache.clear()
+
+        self.stdout.write(f'messages: {n}, conversations: {len(secrets)}')
+        self.stdout.write(f'legacy uncached:          {uncached * 1000:.3f} ms/message')
+        self.stdout.write(f'legacy cached:            {cached * 1000:.3f} ms/message')
+        self.stdout.write(f'envelope, new key:        {cold * 1000:.3f} ms/message')
+        self.stdout.write(f'envelope, cached key:     {envelope * 1000:.3f} ms/message')
+        self.stdout.write(f'speedup (legacy uncached / envelope): {uncached / envelope:.1f}x')
+        self.stdout.write(f"legacy cache: hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.2%}")
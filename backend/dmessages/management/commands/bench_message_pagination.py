@@ -0,0 +1,78 @@
+#seeds messages at growing table sizes and times the keyset-paginated list endpoint
+#all seeded rows are rolled back when the command finishes
+import statistics
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from dmessages.models import Message
+from dmessages.views import MessageViewSet
+from users.models import User
+from benchmarks.transactions import rolled_back
+
+
+class Command(BaseCommand):
+    help = 'Time /api/messages/ first and deep pages as the Message table grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma separated table sizes to measure at')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(','))
+        with rolled_back():
+            self.run(sizes, options)
+
+    def run(self, sizes, options):
+        users = User.objects.bulk_create([
+            User(username=f'bench_msg_{i}', role='ambulance') for i in range(options['users'])
+        ])
+        me = users[0]
+        view = MessageViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        field = Message._meta.get_field('timestamp')
+        start = timezone.now() - timedelta(days=365)
+        seeded = 0
+
+        self.stdout.write(f"{'rows':>10} {'first page p50 ms':>18} {'deep page p50 ms':>17}")
+        field.auto_now_add = False
+        try:
+            for size in sizes:
+                while seeded < size:
+                    batch = []
+                    for i in range(seeded, min(size, seeded + options['batch'])):
+                        batch.append(Message(
+                            sender=users[i % len(users)],
+                            receiver=users[(i * 7 + 1) % len(users)],
+                            encrypted_message='x' * 64,
+                            timestamp=start + timedelta(seconds=i),
+                        ))
+                    Message.objects.bulk_create(batch)
+                    seeded += len(batch)
+
+                first = self.time_request(factory, view, me, {}, options['repeat'])
+                # Walk to a page halfway through the user's history for the deep measurement
+                mine = Message.objects.filter(sender=me).order_by('timestamp', 'id')
+                middle = mine[mine.count() // 2] if mine.exists() else None
+                params = {}
+                if middle is not None:
+                    params['cursor'] = MessageViewSet.pagination_class().encode_cursor(middle)
+                deep = self.time_request(factory, view, me, params, options['repeat'])
+                self.stdout.write(f'{size:>10} {first:>18.3f} {deep:>17.3f}')
+        finally:
+            field.auto_now_add = True
+
+    def time_request(self, factory, view, user, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            request = factory.get('/api/messages/', params)
+            force_authenticate(request, user=user)
+            t0 = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(timings)
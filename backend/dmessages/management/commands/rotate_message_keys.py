@@ -0,0 +1,58 @@
+#re-encrypts stored messages: legacy PBKDF2 messages to conversation keys, or everything to a new key version
+#resumable: progress is checkpointed after every chunk, rerun the same command to continue an interrupted run
+#a rotation is complete only once every server seals with the new key, see the --new-key-version help
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from dmessages.rotation import Checkpoint, MessageRotation, rewrap_conversation_keys
+
+
+class Command(BaseCommand):
+    help = 'Re-encrypt direct messages under their conversation keys in keyset-ordered chunks across a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='crypto worker processes; 0 runs everything in this process')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='messages per keyset chunk and bulk update')
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR / 'rotate_message_keys.checkpoint.json'))
+        parser.add_argument('--restart', action='store_true', help='ignore an unfinished checkpoint')
+        parser.add_argument('--new-key-version', action='store_true',
+                            help='give every conversation a new data key and re-encrypt all its messages. '
+                                 'Servers keep sealing with the old key for up to DMESSAGES_ACTIVE_KEY_TTL '
+                                 'seconds, so the run waits that long after the last new key and then '
+                                 're-seals the messages sent meanwhile; the rotation is complete only when '
+                                 'the command returns')
+        parser.add_argument('--rewrap-keys', action='store_true',
+                            help='first re-wrap conversation keys under DMESSAGES_MASTER_KEY_ID')
+
+    def handle(self, *args, **options):
+        if options['rewrap_keys']:
+            rewrapped = rewrap_conversation_keys(settings.DMESSAGES_MASTER_KEY_ID)
+            self.stdout.write(f'rewrapped {rewrapped} conversation key(s) under {settings.DMESSAGES_MASTER_KEY_ID}')
+
+        checkpoint = Checkpoint.load(options['checkpoint'], {'new_key_version': options['new_key_version']},
+                                     restart=options['restart'])
+        if checkpoint.resumed:
+            self.stdout.write(f"resuming after message {checkpoint.state['last_id']} "
+                              f"({checkpoint.state['scanned']} already scanned)")
+        rotation = MessageRotation(checkpoint, workers=options['workers'], chunk_size=options['chunk_size'],
+                                   new_key_version=options['new_key_version'], progress=self.progress)
+        if options['new_key_version']:
+            self.stdout.write(f'after the pass, waiting {settings.DMESSAGES_ACTIVE_KEY_TTL}s for servers to pick up '
+                              f'the new keys before sweeping messages sent during the run')
+        stats = rotation.run_in_pool()
+
+        elapsed = stats['elapsed']
+        rate = stats['scanned'] / elapsed if elapsed else 0.0
+        self.stdout.write(f"done: scanned {stats['scanned']}, rewritten {stats['rewritten']}, "
+                          f"failed {stats['failed']} in {elapsed:.1f}s ({rate:.0f} msgs/s)")
+        total = checkpoint.state
+        if checkpoint.resumed and total['scanned'] != stats['scanned']:
+            self.stdout.write(f"whole run: scanned {total['scanned']}, rewritten {total['rewritten']}, "
+                              f"failed {total['failed']}")
+
+    def progress(self, stats):
+        for message_id, error in stats['errors']:
+            self.stderr.write(f'message {message_id}: {error}')
+        self.stdout.write(f"scanned {stats['scanned']}, rewritten {stats['rewritten']}, failed {stats['failed']} "
+                          f"({stats['rate']:.0f} msgs/s)")
@@ -0,0 +1,38 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from users.authentication import CachedJWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed, TokenError
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    auth = CachedJWTAuthentication()
+    try:
+        validated = auth.get_validated_token(raw_token)
+        return auth.get_user(validated)
+    except (InvalidToken, AuthenticationFailed, TokenError):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Authenticates websocket connections with the same access tokens as the REST API.
+
+    The token is read from the ``token`` query parameter, or from a
+    ``Authorization: Bearer <token>`` header for clients that can send one.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token = None
+        query = parse_qs(scope.get('query_string', b'').decode())
+        if query.get('token'):
+            raw_token = query['token'][0]
+        else:
+            headers = dict(scope.get('headers', []))
+            auth_header = headers.get(b'authorization', b'').decode().split()
+            if len(auth_header) == 2 and auth_header[0] == 'Bearer':
+                raw_token = auth_header[1]
+        scope['user'] = await get_user_for_token(raw_token) if raw_token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
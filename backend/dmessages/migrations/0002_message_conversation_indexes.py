@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dmessages', '0001_initial'),
+        ('patients', '0005_patient_assigned_ambulance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'timestamp'], name='message_receiver_idx'),
+        ),
+    ]
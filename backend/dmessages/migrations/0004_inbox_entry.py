@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def backfill_inbox(apps, schema_editor):
+    # There is no read state for older messages: count them as read when they were sent
+    Message = apps.get_model('dmessages', 'Message')
+    InboxEntry = apps.get_model('dmessages', 'InboxEntry')
+    Message.objects.filter(read_at__isnull=True).update(read_at=F('timestamp'))
+    last = {}
+    for row in Message.objects.values('sender_id', 'receiver_id').annotate(last=Max('timestamp')).iterator():
+        for owner, peer in ((row['sender_id'], row['receiver_id']), (row['receiver_id'], row['sender_id'])):
+            last[owner, peer] = max(last.get((owner, peer), row['last']), row['last'])
+    InboxEntry.objects.bulk_create(
+        [InboxEntry(owner_id=owner, peer_id=peer, last_message_at=at) for (owner, peer), at in last.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dmessages', '0003_conversation_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+                ('peer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-last_message_at'], name='inbox_owner_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'peer'), name='inbox_entry_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -9,4 +9,50 @@ class Message(models.Model):
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, null=True, blank=True)
     encrypted_message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    timestamp = models.DateTimeField(auto_now_add=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_conversation_idx'),
+            models.Index(fields=['receiver', 'timestamp'], name='message_receiver_idx'),
+        ]
+
+
+class ConversationKey(models.Model):
+    """Random AES data key of a conversation, stored wrapped (AES-GCM) under a server master key.
+
+    The two users are kept in the order conversation_pair() gives, so each
+    conversation has exactly one row per key version.
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    version = models.PositiveIntegerField(default=1)
+    master_key_id = models.CharField(max_length=32)
+    wrapped_key = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high', 'version'], name='conversation_key_version_unique'),
+        ]
+
+
+class InboxEntry(models.Model):
+    """Inbox summary of one conversation as seen by ``owner``.
+
+    Kept up to date by dmessages.inbox as messages are sent, read and
+    deleted, so the inbox is one indexed read however long the threads are.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_entries')
+    peer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'peer'], name='inbox_entry_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-last_message_at'], name='inbox_owner_recent_idx'),
+        ]
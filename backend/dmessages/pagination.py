@@ -0,0 +1,97 @@
+import base64
+import json
+import uuid
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination on (timestamp, id), oldest first or newest first.
+
+    The cursor is the (timestamp, id) of the last row of the previous page, so
+    each page is a single index range scan no matter how deep the client is.
+    ``?ordering=-timestamp`` walks the same index backwards from the newest
+    message; the next link keeps the parameter.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, message):
+        # Rows are model instances, or dicts when the list is served from .values()
+        if isinstance(message, dict):
+            position = [message['timestamp'].isoformat(), str(message['id'])]
+        else:
+            position = [message.timestamp.isoformat(), str(message.id)]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, message_id = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            timestamp = parse_datetime(timestamp)
+            message_id = uuid.UUID(message_id)
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        if timestamp is None:
+            raise NotFound('Invalid cursor')
+        return timestamp, message_id
+
+    def newest_first(self, request):
+        return request.query_params.get(self.ordering_query_param) == '-timestamp'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        newest_first = self.newest_first(request)
+        if position is not None:
+            timestamp, message_id = position
+            if newest_first:
+                after = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+            else:
+                after = Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+            queryset = queryset.filter(after)
+        ordering = ('-timestamp', '-id') if newest_first else ('timestamp', 'id')
+        page = list(queryset.order_by(*ordering)[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,224 @@
+"""
+Bulk re-encryption of the message corpus (format migration and key rotation).
+
+Messages are read in primary key order, one keyset chunk at a time. For
+every message that is not yet sealed with its conversation's active data
+key, the parent process looks up the source and target keys (a cache hit
+after the first message of a conversation) and hands the rows to a process
+pool. The workers (dmessages.utils.reseal_rows) do the crypto, including
+the PBKDF2 derivation legacy messages need, on batches of whole
+conversations so each key is derived once per worker. Results are written
+back with one bulk_update per chunk, and the last committed id goes to a
+checkpoint file, so an interrupted run resumes where it stopped.
+
+Messages sent while the run is going can land behind the cursor (ids are
+random UUIDs) and, with a new key version, may still be sealed under the old
+one by servers whose cached active key has not expired. Once the keyset pass
+is done the run waits out DMESSAGES_ACTIVE_KEY_TTL after the last new key and
+then sweeps every message sent since it started.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from .envelope import active_key, conversation_pair, create_conversation_key, key_by_id, rewrap_key, unwrap_key
+from .models import ConversationKey, Message
+from .utils import conversation_secret, envelope_key_id, reseal_rows
+
+
+class Checkpoint:
+    """Progress of one run in a JSON file, rewritten atomically after every committed chunk."""
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def load(cls, path, options, restart=False):
+        if path and not restart and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if not state.get('finished') and state.get('options') == options:
+                return cls(path, state)
+        return cls(path, {
+            'options': options,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'last_id': None,
+            'scanned': 0,
+            'rewritten': 0,
+            'failed': 0,
+            'finished': False,
+        })
+
+    @property
+    def resumed(self):
+        return self.state['last_id'] is not None
+
+    def save(self, **changes):
+        self.state.update(changes)
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def rewrap_conversation_keys(master_key_id, batch_size=500):
+    """Re-wrap every ConversationKey not under ``master_key_id``; the data keys (and messages) stay the same."""
+    rewrapped = 0
+    queryset = ConversationKey.objects.exclude(master_key_id=master_key_id).order_by('pk')
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not rows:
+            return rewrapped
+        for row in rows:
+            rewrap_key(row, master_key_id)
+        with transaction.atomic():
+            ConversationKey.objects.bulk_update(rows, ['wrapped_key', 'master_key_id'])
+        rewrapped += len(rows)
+        last_pk = rows[-1].pk
+
+
+class MessageRotation:
+    """Re-seals every message under its conversation's active key (a new key version with ``new_key_version``)."""
+
+    def __init__(self, checkpoint, workers=4, chunk_size=2000, new_key_version=False, progress=None,
+                 sleep=time.sleep):
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.new_key_version = new_key_version
+        self.progress = progress or (lambda stats: None)
+        self.sleep = sleep
+        self.started_at = datetime.fromisoformat(checkpoint.state['started_at'])
+        self._targets = {}
+        self._last_new_key = None
+
+    def target_key(self, sender_id, receiver_id):
+        pair = conversation_pair(sender_id, receiver_id)
+        target = self._targets.get(pair)
+        if target is None:
+            key_id, key = active_key(*pair)
+            if self.new_key_version:
+                row = ConversationKey.objects.get(pk=key_id)
+                # On resume, a version created earlier in this run is already the new one
+                if row.created_at < self.started_at:
+                    row = create_conversation_key(*pair, version=row.version + 1)
+                    key_id, key = row.pk, unwrap_key(row)
+                if self._last_new_key is None or row.created_at > self._last_new_key:
+                    self._last_new_key = row.created_at
+            target = self._targets[pair] = (key_id, key)
+        return target
+
+    def plan(self, rows):
+        """Work items for the pool, one list per conversation, for the rows not on their target key yet."""
+        by_conversation = {}
+        for message_id, sender_id, receiver_id, enc_text in rows:
+            target_id, target_key = self.target_key(sender_id, receiver_id)
+            source_id = envelope_key_id(enc_text)
+            if source_id == target_id:
+                continue
+            if source_id is None:
+                source_key, secret = None, conversation_secret(sender_id, receiver_id)
+            else:
+                source_key, secret = key_by_id(source_id)[2], None
+            by_conversation.setdefault(conversation_pair(sender_id, receiver_id), []).append(
+                (message_id, enc_text, secret, source_key, target_id, target_key))
+        return list(by_conversation.values())
+
+    def batches(self, groups):
+        # Whole conversations per batch, about two batches per worker so they finish together
+        target = max(1, sum(map(len, groups)) // max(1, self.workers * 2))
+        batch = []
+        for group in groups:
+            batch.extend(group)
+            if len(batch) >= target:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def reseal(self, rows, executor=None):
+        """Re-seal ``rows`` not on their target key yet; returns (rewritten count, [(message id, error)])."""
+        batches = list(self.batches(self.plan(rows)))
+        results = (executor.map if executor else map)(reseal_rows, batches)
+        updates, errors = [], []
+        for done, batch_failed in results:
+            updates.extend(Message(pk=pk, encrypted_message=enc) for pk, enc in done)
+            errors.extend(batch_failed)
+        with transaction.atomic():
+            Message.objects.bulk_update(updates, ['encrypted_message'], batch_size=500)
+        return len(updates), errors
+
+    def sweep(self, executor=None):
+        """Re-seal the messages sent since the run started, wherever they landed relative to the cursor."""
+        if self._last_new_key is not None:
+            # Until then a server may still seal new messages with the active key it cached before the rotation
+            ttl = timedelta(seconds=getattr(settings, 'DMESSAGES_ACTIVE_KEY_TTL', 60))
+            self.sleep(max(0.0, (self._last_new_key + ttl - datetime.now(timezone.utc)).total_seconds()))
+        messages = (Message.objects.filter(timestamp__gte=self.started_at).order_by('pk')
+                    .values_list('pk', 'sender_id', 'receiver_id', 'encrypted_message'))
+        last_id, rewritten, errors = None, 0, []
+        while True:
+            rows = list((messages.filter(pk__gt=last_id) if last_id else messages)[:self.chunk_size])
+            if not rows:
+                return rewritten, errors
+            done, failed = self.reseal(rows, executor)
+            rewritten += done
+            errors.extend(failed)
+            last_id = rows[-1][0]
+
+    def run(self, executor=None):
+        state = self.checkpoint.state
+        messages = Message.objects.order_by('pk').values_list('pk', 'sender_id', 'receiver_id', 'encrypted_message')
+        started = time.perf_counter()
+        scanned = rewritten = failed = 0
+        while True:
+            # Keyset chunk: an index range scan from the last committed id, however far in we are
+            queryset = messages.filter(pk__gt=state['last_id']) if state['last_id'] else messages
+            rows = list(queryset[:self.chunk_size])
+            if not rows:
+                break
+            updated, errors = self.reseal(rows, executor)
+
+            scanned += len(rows)
+            rewritten += updated
+            failed += len(errors)
+            self.checkpoint.save(
+                last_id=str(rows[-1][0]),
+                scanned=state['scanned'] + len(rows),
+                rewritten=state['rewritten'] + updated,
+                failed=state['failed'] + len(errors),
+            )
+            elapsed = time.perf_counter() - started
+            self.progress({
+                'scanned': scanned, 'rewritten': rewritten, 'failed': failed, 'errors': errors,
+                'elapsed': elapsed, 'rate': scanned / elapsed if elapsed else 0.0,
+            })
+        swept, errors = self.sweep(executor)
+        rewritten += swept
+        failed += len(errors)
+        self.checkpoint.save(finished=True, rewritten=state['rewritten'] + swept,
+                             failed=state['failed'] + len(errors))
+        elapsed = time.perf_counter() - started
+        if swept or errors:
+            self.progress({
+                'scanned': scanned, 'rewritten': rewritten, 'failed': failed, 'errors': errors,
+                'elapsed': elapsed, 'rate': scanned / elapsed if elapsed else 0.0,
+            })
+        return {'scanned': scanned, 'rewritten': rewritten, 'failed': failed, 'elapsed': elapsed}
+
+    def run_in_pool(self):
+        if self.workers <= 0:
+            return self.run()
+        # Workers only do crypto; forked ones must not share this process's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return self.run(executor)
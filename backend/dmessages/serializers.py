@@ -1,9 +1,11 @@
 from rest_framework import serializers
+from Django_config.instrumentation import TimedRepresentationMixin
 from .models import Message
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     sender = serializers.PrimaryKeyRelatedField(read_only=True)
     encrypted_message = serializers.CharField(read_only=True)
+    read_at = serializers.DateTimeField(read_only=True)
 
     class Meta:
         model = Message
@@ -0,0 +1,59 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.models import User
+from .consumers import user_group_name
+from .envelope import decrypt_for_conversation, forget_key
+from .inbox import forget_message, record_message
+from .models import ConversationKey, Message
+
+
+def message_payload(message):
+    return {
+        'id': str(message.id),
+        'sender': str(message.sender_id),
+        'receiver': str(message.receiver_id),
+        'patient': message.patient_id,
+        'timestamp': message.timestamp.isoformat(),
+        'decrypted': decrypt_for_conversation(message.encrypted_message, message.sender_id, message.receiver_id),
+    }
+
+
+def push_message(message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        user_group_name(message.receiver_id),
+        {'type': 'message.created', 'message': message_payload(message)},
+    )
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    # Only push once the row is committed so receivers never see a rolled back message;
+    # robust: a channel layer outage is logged instead of failing the already committed send
+    if created:
+        transaction.on_commit(lambda: push_message(instance), robust=True)
+
+
+@receiver(post_save, sender=Message)
+def count_new_message(sender, instance, created, **kwargs):
+    if created:
+        record_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def uncount_deleted_message(sender, instance, origin=None, **kwargs):
+    # A deleted user takes its inbox entries, on both sides, along with its messages
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    forget_message(instance)
+
+
+@receiver(post_delete, sender=ConversationKey)
+def forget_deleted_key(sender, instance, **kwargs):
+    # Keep a cached key from outliving its row (users being deleted cascade to their keys)
+    transaction.on_commit(lambda: forget_key(instance))
@@ -1,3 +1,485 @@
-from django.test import TestCase
+import base64
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from Django_config.asgi import application
+from Django_config.testing import QueryBudgetMixin, FastListMixinAssertions
+from users.models import User
+from .envelope import (
+    active_key, create_conversation_key, data_key_cache, decrypt_for_conversation, encrypt_for_conversation, unwrap_key,
+)
+from .inbox import rebuild_inbox
+from .models import ConversationKey, InboxEntry, Message
+from .rotation import Checkpoint, MessageRotation
+from .serializers import MessageSerializer
+from .utils import DerivedKeyCache, encrypt_message, conversation_secret, envelope_key_id, seal, CONVERSATION_SALT
 
-# Create your tests here.
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class MessagePushTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.receiver = User.objects.create_user(username='er', password='pass', role='hospital')
+
+    def send_message(self, text):
+        client = APIClient()
+        client.force_authenticate(self.sender)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/messages/', {
+                'receiver': str(self.receiver.id),
+                'plain_message': text,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    async def test_new_message_is_pushed_to_receiver(self):
+        token = str(AccessToken.for_user(self.receiver))
+        communicator = WebsocketCommunicator(application, f'/ws/messages/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        response = await sync_to_async(self.send_message)('patient arriving in 5')
+        event = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(event['type'], 'message.created')
+        self.assertEqual(event['message']['id'], str(response.data['id']))
+        self.assertEqual(event['message']['decrypted'], 'patient arriving in 5')
+        await communicator.disconnect()
+
+    def test_push_failure_does_not_fail_the_send(self):
+        layer = mock.Mock(group_send=mock.AsyncMock(side_effect=ConnectionError('redis down')))
+        with mock.patch('dmessages.signals.get_channel_layer', return_value=layer), self.assertLogs(level='ERROR'):
+            response = self.send_message('patient arriving in 5')
+        layer.group_send.assert_awaited_once()
+        self.assertTrue(Message.objects.filter(pk=response.data['id']).exists())
+
+    async def test_unauthenticated_socket_is_rejected(self):
+        communicator = WebsocketCommunicator(application, '/ws/messages/')
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+
+class DerivedKeyCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = DerivedKeyCache(maxsize=2, ttl=60, clock=lambda: self.now)
+        self.loads = []
+
+    def load(self, cache_key):
+        def load():
+            self.loads.append(cache_key)
+            return f'key-{cache_key}'
+        return self.cache.get_or_load(cache_key, load)
+
+    def test_hit_after_first_load(self):
+        self.assertEqual((self.load('a'), self.load('a')), ('key-a', 'key-a'))
+        self.assertEqual(self.loads, ['a'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size'], stats['hit_rate']), (1, 1, 1, 0.5))
+
+    def test_least_recently_used_is_evicted(self):
+        self.load('a')
+        self.load('b')
+        self.load('a')  # b is now the least recently used
+        self.load('c')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_entries_expire_after_ttl(self):
+        self.load('a')
+        self.now = 59.9
+        self.load('a')
+        self.now = 60.0
+        self.load('a')
+        self.assertEqual(self.loads, ['a', 'a'])
+        # Reloading starts a fresh ttl
+        self.now = 119.0
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def test_per_entry_ttl(self):
+        self.cache.put('short', 'key', ttl=5)
+        self.now = 5.0
+        self.assertIsNone(self.cache.get('short'))
+
+    def test_discard_and_clear(self):
+        self.load('a')
+        self.load('b')
+        self.cache.discard('a')
+        self.cache.discard('missing')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+        self.cache.clear()
+        stats = self.cache.stats()
+        self.assertEqual((stats['size'], stats['hits'], stats['misses'], stats['evictions']), (0, 0, 0, 0))
+        self.assertEqual(stats['hit_rate'], 0.0)
+
+    def test_zero_size_caches_nothing(self):
+        cache = DerivedKeyCache(maxsize=0, clock=lambda: self.now)
+        cache.get_or_load('a', lambda: 1)
+        self.assertEqual((cache.get_or_load('a', lambda: 2), cache.stats()['size']), (2, 0))
+
+
+class MessageQueryBudgetTests(QueryBudgetMixin, FastListMixinAssertions, TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.peer = User.objects.create_user(username='er', password='pass', role='hospital')
+        self.secret = conversation_secret(self.me.id, self.peer.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def add_messages(self, n):
+        Message.objects.bulk_create([
+            Message(sender=self.me if i % 2 else self.peer, receiver=self.peer if i % 2 else self.me,
+                    encrypted_message=encrypt_message(f'msg {i}', self.secret, CONVERSATION_SALT))
+            for i in range(n)
+        ])
+
+    def test_list(self):
+        self.assertConstantQueries(1, lambda: self.client.get('/api/messages/'), self.add_messages)
+
+    def test_list_matches_model_serializer(self):
+        self.add_messages(5)
+        response = self.client.get('/api/messages/')
+        self.assertSameAsSerializer(response.data['results'], MessageSerializer,
+                                    Message.objects.order_by('timestamp', 'id'), self.me)
+
+    def test_thread(self):
+        # peer lookup + one page of the conversation
+        self.assertConstantQueries(
+            2, lambda: self.client.get(f'/api/messages/thread/?peer={self.peer.id}'), self.add_messages,
+        )
+
+    def test_detail_and_decrypt(self):
+        self.add_messages(1)
+        message = Message.objects.get()
+        with self.assertQueryBudget(1):
+            self.assertEqual(self.client.get(f'/api/messages/{message.id}/').status_code, 200)
+        with self.assertQueryBudget(1):
+            response = self.client.get(f'/api/messages/{message.id}/decrypt/')
+        self.assertEqual(response.data['decrypted'], 'msg 0')
+        crypto = [entry for entry in response['Server-Timing'].split(', ') if entry.startswith('crypto;')]
+        self.assertGreater(float(crypto[0].split('dur=')[1]), 0)
+
+
+class EnvelopeEncryptionTests(TestCase):
+    def setUp(self):
+        data_key_cache.clear()
+        self.me = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.peer = User.objects.create_user(username='er', password='pass', role='hospital')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_new_messages_use_one_key_per_conversation(self):
+        for text in ('eta 5 min', 'patient stable'):
+            response = self.client.post('/api/messages/', {'receiver': str(self.peer.id), 'plain_message': text},
+                                        format='json')
+            self.assertEqual(response.status_code, 201)
+        reply = encrypt_for_conversation('ok', self.peer.id, self.me.id)
+        self.assertEqual(ConversationKey.objects.count(), 1)
+        self.assertTrue(all(m.startswith('v1:') for m in Message.objects.values_list('encrypted_message', flat=True)))
+        self.assertEqual(decrypt_for_conversation(reply, self.me.id, self.peer.id), 'ok')
+
+        data_key_cache.clear()
+        message = Message.objects.order_by('timestamp').first()
+        self.assertEqual(self.client.get(f'/api/messages/{message.id}/decrypt/').data['decrypted'], 'eta 5 min')
+
+    def test_thread_mixes_legacy_and_envelope_messages(self):
+        secret = conversation_secret(self.me.id, self.peer.id)
+        Message.objects.create(sender=self.peer, receiver=self.me,
+                               encrypted_message=encrypt_message('legacy', secret, CONVERSATION_SALT))
+        Message.objects.create(sender=self.me, receiver=self.peer,
+                               encrypted_message=encrypt_for_conversation('envelope', self.me.id, self.peer.id))
+        response = self.client.get(f'/api/messages/thread/?peer={self.peer.id}')
+        self.assertEqual(sorted(m['decrypted'] for m in response.data['results']), ['envelope', 'legacy'])
+
+    def test_key_of_another_conversation_is_rejected(self):
+        other = User.objects.create_user(username='other', password='pass', role='hospital')
+        enc = encrypt_for_conversation('private', self.me.id, self.peer.id)
+        with self.assertRaises(ValueError):
+            decrypt_for_conversation(enc, self.me.id, other.id)
+
+    def test_wrapped_key_is_bound_to_its_row(self):
+        other = User.objects.create_user(username='other', password='pass', role='hospital')
+        encrypt_for_conversation('a', self.me.id, self.peer.id)
+        encrypt_for_conversation('b', self.me.id, other.id)
+        first, second = ConversationKey.objects.order_by('id')
+        first.wrapped_key = second.wrapped_key
+        with self.assertRaises(ValueError):
+            unwrap_key(first)
+
+    def test_new_key_is_cached_only_once_committed(self):
+        pair = tuple(sorted((str(self.me.id), str(self.peer.id))))
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                encrypt_for_conversation('lost', self.me.id, self.peer.id)
+                raise RuntimeError
+        self.assertFalse(ConversationKey.objects.exists())
+        self.assertEqual(data_key_cache.stats()['size'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enc = encrypt_for_conversation('kept', self.me.id, self.peer.id)
+        row = ConversationKey.objects.get()
+        self.assertEqual(data_key_cache.get(('active', *pair))[0], row.pk)
+        self.assertEqual(decrypt_for_conversation(enc, self.peer.id, self.me.id), 'kept')
+
+    @override_settings(DMESSAGES_ACTIVE_KEY_TTL=60)
+    def test_active_key_is_reloaded_after_a_short_ttl(self):
+        pair = tuple(sorted((str(self.me.id), str(self.peer.id))))
+        now = data_key_cache.clock()
+        with self.captureOnCommitCallbacks(execute=True):
+            encrypt_for_conversation('first', self.me.id, self.peer.id)
+        # A new version written by another process is picked up once the active entry expires
+        first = ConversationKey.objects.get()
+        newer = create_conversation_key(*pair, version=2)
+        with mock.patch.object(data_key_cache, 'clock', return_value=now + 59):
+            self.assertEqual(active_key(*pair)[0], first.pk)
+        with mock.patch.object(data_key_cache, 'clock', return_value=now + 61):
+            self.assertEqual(active_key(*pair)[0], newer.pk)
+            # the key itself stays cached for reading older messages
+            self.assertIsNotNone(data_key_cache.get(('id', first.pk)))
+
+    def test_retired_master_key_still_unwraps(self):
+        with override_settings(DMESSAGES_MASTER_KEY_ID='old', DMESSAGES_MASTER_KEYS={'old': 'A' * 43 + '='}):
+            enc = encrypt_for_conversation('before rotation', self.me.id, self.peer.id)
+        data_key_cache.clear()
+        with override_settings(DMESSAGES_MASTER_KEY_ID='new',
+                               DMESSAGES_MASTER_KEYS={'new': 'B' * 43 + '=', 'old': 'A' * 43 + '='}):
+            self.assertEqual(decrypt_for_conversation(enc, self.me.id, self.peer.id), 'before rotation')
+
+
+class InboxTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.peer = User.objects.create_user(username='er', password='pass', role='hospital')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def send(self, sender, receiver, text='hello'):
+        return Message.objects.create(sender=sender, receiver=receiver,
+                                      encrypted_message=encrypt_for_conversation(text, sender.id, receiver.id))
+
+    def inbox(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/messages/inbox/')
+        self.assertEqual(response.status_code, 200)
+        return {entry['peer']: entry for entry in response.data}
+
+    def test_counts_unread_messages_per_peer(self):
+        response = self.client.post('/api/messages/', {'receiver': str(self.peer.id), 'plain_message': 'eta 5'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        last = self.send(self.me, self.peer)
+        self.send(self.peer, self.peer)
+
+        mine = self.inbox(self.me)[str(self.peer.id)]
+        self.assertEqual((mine['unread_count'], mine['last_message_at']), (0, last.timestamp))
+        theirs = self.inbox(self.peer)
+        self.assertEqual(theirs[str(self.me.id)]['unread_count'], 2)
+        self.assertEqual(theirs[str(self.me.id)]['username'], 'crew')
+        self.assertEqual(theirs[str(self.peer.id)]['unread_count'], 0)
+
+    def test_mark_read(self):
+        self.send(self.me, self.peer)
+        self.send(self.me, self.peer)
+        self.send(self.peer, self.me)
+        self.client.force_authenticate(self.peer)
+        response = self.client.post('/api/messages/read/', {'peer': str(self.me.id)}, format='json')
+        self.assertEqual(response.data['marked_read'], 2)
+        self.assertEqual(self.inbox(self.peer)[str(self.me.id)]['unread_count'], 0)
+        self.assertEqual(self.inbox(self.me)[str(self.peer.id)]['unread_count'], 1)
+        self.assertFalse(Message.objects.filter(receiver=self.peer, read_at__isnull=True).exists())
+        self.assertEqual(self.client.post('/api/messages/read/', {}, format='json').status_code, 400)
+
+    def test_deleting_messages_updates_the_inbox(self):
+        first = self.send(self.me, self.peer)
+        second = self.send(self.me, self.peer)
+        second.delete()
+        entry = self.inbox(self.peer)[str(self.me.id)]
+        self.assertEqual((entry['unread_count'], entry['last_message_at']), (1, first.timestamp))
+        first.delete()
+        self.assertFalse(InboxEntry.objects.exists())
+
+    def test_rebuild_matches_maintained_counters(self):
+        other = User.objects.create_user(username='other', password='pass', role='hospital')
+        for sender, receiver in ((self.me, self.peer), (self.peer, self.me), (other, self.me), (self.me, self.me)):
+            self.send(sender, receiver)
+        self.client.force_authenticate(self.me)
+        self.client.post('/api/messages/read/', {'peer': str(self.peer.id)}, format='json')
+        fields = ('owner_id', 'peer_id', 'last_message_at', 'unread_count')
+        maintained = sorted(InboxEntry.objects.values_list(*fields))
+        rebuild_inbox()
+        self.assertEqual(sorted(InboxEntry.objects.values_list(*fields)), maintained)
+
+    def test_inbox_is_one_query(self):
+        def add_peers(n):
+            for i in range(n):
+                peer = User.objects.create_user(username=f'peer{InboxEntry.objects.count()}-{i}', password='pass',
+                                                role='hospital')
+                self.send(peer, self.me)
+        self.client.force_authenticate(self.me)
+        self.assertConstantQueries(1, lambda: self.client.get('/api/messages/inbox/'), add_peers)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.peer = User.objects.create_user(username='er', password='pass', role='hospital')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        secret = conversation_secret(self.me.id, self.peer.id)
+        Message.objects.bulk_create([
+            Message(sender=self.me, receiver=self.peer,
+                    encrypted_message=encrypt_message(f'msg {i}', secret, CONVERSATION_SALT))
+            for i in range(7)
+        ])
+        # Three messages share each timestamp, so pages must break ties on id
+        base = timezone.now()
+        for i, message in enumerate(Message.objects.order_by('id')):
+            Message.objects.filter(pk=message.pk).update(timestamp=base + timedelta(seconds=i // 3))
+        self.expected = [str(pk) for pk in Message.objects.order_by('timestamp', 'id').values_list('id', flat=True)]
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([str(row['id']) for row in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_pages_cover_every_message_once_in_order(self):
+        pages = self.walk('/api/messages/?page_size=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_exact_last_page_has_no_next_link(self):
+        pages = self.walk('/api/messages/?page_size=7')
+        self.assertEqual(pages, [self.expected])
+
+    def test_newest_first(self):
+        pages = self.walk('/api/messages/?page_size=3&ordering=-timestamp')
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected[::-1])
+
+    def test_thread_pages_break_ties_on_id(self):
+        pages = self.walk(f'/api/messages/thread/?peer={self.peer.id}&page_size=2')
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_bad_cursor_is_not_found(self):
+        def cursor(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+        for bad in ('not-base64!', cursor([timezone.now().isoformat(), 'not-a-uuid']),
+                    cursor([timezone.now().isoformat(), 5]), cursor(['yesterday', self.expected[0]]),
+                    cursor({'id': self.expected[0]})):
+            response = self.client.get('/api/messages/', {'cursor': bad})
+            self.assertEqual(response.status_code, 404, bad)
+
+
+@override_settings(DMESSAGES_ACTIVE_KEY_TTL=0)
+class RotateMessageKeysTests(TestCase):
+    def setUp(self):
+        data_key_cache.clear()
+        self.me = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.peer = User.objects.create_user(username='er', password='pass', role='hospital')
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = str(Path(tmp.name) / 'checkpoint.json')
+
+    def rotate(self, *args):
+        out = StringIO()
+        call_command('rotate_message_keys', '--workers', '0', '--chunk-size', '2', '--checkpoint', self.checkpoint,
+                     *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def legacy(self, text):
+        secret = conversation_secret(self.me.id, self.peer.id)
+        return Message.objects.create(sender=self.me, receiver=self.peer,
+                                      encrypted_message=encrypt_message(text, secret, CONVERSATION_SALT))
+
+    def plain_texts(self):
+        return sorted(decrypt_for_conversation(m.encrypted_message, m.sender_id, m.receiver_id)
+                      for m in Message.objects.all())
+
+    def test_legacy_messages_move_to_the_conversation_key(self):
+        for text in ('one', 'two', 'three'):
+            self.legacy(text)
+        output = self.rotate()
+        self.assertIn('rewritten 3', output)
+        self.assertTrue(all(m.startswith('v1:') for m in Message.objects.values_list('encrypted_message', flat=True)))
+        self.assertEqual(self.plain_texts(), ['one', 'three', 'two'])
+        # Nothing left to do on a second run
+        self.assertIn('rewritten 0', self.rotate())
+
+    def test_new_key_version(self):
+        Message.objects.create(sender=self.me, receiver=self.peer,
+                               encrypted_message=encrypt_for_conversation('old key', self.me.id, self.peer.id))
+        self.legacy('legacy')
+        self.rotate('--new-key-version')
+        self.assertEqual(list(ConversationKey.objects.order_by('version').values_list('version', flat=True)), [1, 2])
+        latest = ConversationKey.objects.get(version=2)
+        self.assertEqual({envelope_key_id(m) for m in Message.objects.values_list('encrypted_message', flat=True)},
+                         {latest.pk})
+        data_key_cache.clear()
+        self.assertEqual(self.plain_texts(), ['legacy', 'old key'])
+
+    def test_resumes_from_checkpoint(self):
+        first, second, third = (self.legacy(text) for text in ('a', 'b', 'c'))
+        done = sorted([first, second, third], key=lambda m: str(m.pk))[:2]
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'options': {'new_key_version': False}, 'started_at': timezone.now().isoformat(),
+                       'last_id': str(done[-1].pk), 'scanned': 2, 'rewritten': 2, 'failed': 0,
+                       'finished': False}, f)
+        output = self.rotate()
+        self.assertIn('resuming after', output)
+        self.assertIn('whole run: scanned 3, rewritten 3', output)
+        rotated = {m.pk for m in Message.objects.all() if m.encrypted_message.startswith('v1:')}
+        self.assertEqual(len(rotated), 1)
+        self.assertNotIn(done[0].pk, rotated)
+
+    def test_rewrap_keys_under_new_master_key(self):
+        keys = {'old': 'A' * 43 + '=', 'new': 'B' * 43 + '='}
+        with override_settings(DMESSAGES_MASTER_KEY_ID='old', DMESSAGES_MASTER_KEYS=keys):
+            Message.objects.create(sender=self.me, receiver=self.peer,
+                                   encrypted_message=encrypt_for_conversation('kept', self.me.id, self.peer.id))
+        with override_settings(DMESSAGES_MASTER_KEY_ID='new', DMESSAGES_MASTER_KEYS=keys):
+            self.assertIn('rewrapped 1', self.rotate('--rewrap-keys'))
+        self.assertEqual(ConversationKey.objects.get().master_key_id, 'new')
+        data_key_cache.clear()
+        with override_settings(DMESSAGES_MASTER_KEYS={'new': keys['new']}):
+            self.assertEqual(self.plain_texts(), ['kept'])
+
+    @override_settings(DMESSAGES_ACTIVE_KEY_TTL=30)
+    def test_sweeps_messages_sealed_with_the_old_key_during_the_run(self):
+        old_key_id, old_key = active_key(self.me.id, self.peer.id)
+        Message.objects.create(sender=self.me, receiver=self.peer, encrypted_message=seal('before', old_key_id, old_key))
+        waits = []
+
+        def stale_server(seconds):
+            # Another server still has the old key as active, and the new id may sort before the cursor
+            waits.append(seconds)
+            Message.objects.create(sender=self.me, receiver=self.peer,
+                                   encrypted_message=seal('during', old_key_id, old_key))
+
+        checkpoint = Checkpoint.load(None, {'new_key_version': True})
+        stats = MessageRotation(checkpoint, workers=0, new_key_version=True, sleep=stale_server).run()
+        self.assertTrue(0 < waits[0] <= 30)
+        self.assertEqual((stats['scanned'], stats['rewritten']), (1, 2))
+        new_key_id = ConversationKey.objects.get(version=2).pk
+        self.assertEqual({envelope_key_id(m) for m in Message.objects.values_list('encrypted_message', flat=True)},
+                         {new_key_id})
+        self.assertTrue(checkpoint.state['finished'])
@@ -1,24 +1,197 @@
 import base64
 import os
+import struct
+import threading
+import time
+from collections import OrderedDict
 from Crypto.Cipher import AES
 from Crypto.Protocol.KDF import PBKDF2
+from Crypto.Random import get_random_bytes
 from django.conf import settings
+from Django_config.instrumentation import timed
 
-def derive_key(password, salt, iterations=100_000):
+CONVERSATION_SALT = b"static_salt_for_demo"  # For better security, use a user-based salt
+
+# Envelope ciphertexts (dmessages.envelope): "v1:" + base64(key id + nonce + tag + ciphertext)
+FORMAT_PREFIX = 'v1:'
+KEY_ID = struct.Struct('>Q')
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def conversation_secret(user_a_id, user_b_id):
+    # Same secret for both directions of a conversation
+    a, b = str(user_a_id), str(user_b_id)
+    return f"{min(a, b)}:{max(a, b)}"
+
+
+class DerivedKeyCache:
+    """Bounded LRU cache of PBKDF2-derived keys with a per-entry TTL.
+
+    Derived keys only depend on (password, salt, iterations), so repeated
+    messages in the same conversation can reuse them instead of paying for
+    100k PBKDF2 rounds every time. ``get_or_load`` caches any other
+    expensive key material (dmessages.envelope keeps unwrapped data keys in one).
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_derive(self, password, salt, iterations, derive):
+        return self.get_or_load((password, bytes(salt), iterations), lambda: derive(password, salt, iterations))
+
+    def get_or_load(self, cache_key, load):
+        key = self.get(cache_key)
+        if key is None:
+            # Derive outside the lock so a slow derivation doesn't block other conversations
+            key = load()
+            self.put(cache_key, key)
+        return key
+
+    def get(self, cache_key):
+        """The cached value, or None (counted as a miss) if it is absent or expired."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        return None
+
+    def put(self, cache_key, key, ttl=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[cache_key] = (key, self.clock() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, cache_key):
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+key_cache = DerivedKeyCache(
+    maxsize=getattr(settings, 'DMESSAGES_KEY_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'DMESSAGES_KEY_CACHE_TTL', 3600),
+)
+
+
+def _pbkdf2(password, salt, iterations):
     return PBKDF2(password, salt, dkLen=32, count=iterations)
 
-def encrypt_message(plain_text, password, salt):
-    key = derive_key(password, salt)
+
+@timed('crypto')
+def derive_key(password, salt, iterations=100_000, use_cache=True):
+    if not use_cache:
+        return _pbkdf2(password, salt, iterations)
+    return key_cache.get_or_derive(password, salt, iterations, _pbkdf2)
+
+
+@timed('crypto')
+def encrypt_message(plain_text, password, salt, use_cache=True):
+    key = derive_key(password, salt, use_cache=use_cache)
     cipher = AES.new(key, AES.MODE_GCM)
     nonce = cipher.nonce
     ciphertext, tag = cipher.encrypt_and_digest(plain_text.encode())
     return base64.b64encode(nonce + tag + ciphertext).decode()
 
-def decrypt_message(enc_text, password, salt):
+@timed('crypto')
+def decrypt_with_key(enc_text, key):
     enc = base64.b64decode(enc_text)
     nonce = enc[:16]
     tag = enc[16:32]
     ciphertext = enc[32:]
-    key = derive_key(password, salt)
     cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-    return cipher.decrypt_and_verify(ciphertext, tag).decode() 
\ No newline at end of file
+    return cipher.decrypt_and_verify(ciphertext, tag).decode()
+
+@timed('crypto')
+def decrypt_message(enc_text, password, salt, use_cache=True):
+    key = derive_key(password, salt, use_cache=use_cache)
+    return decrypt_with_key(enc_text, key)
+
+
+def is_envelope(enc_text):
+    return enc_text.startswith(FORMAT_PREFIX)
+
+
+def decode_envelope(enc_text):
+    raw = base64.b64decode(enc_text[len(FORMAT_PREFIX):])
+    return KEY_ID.unpack_from(raw)[0], raw
+
+
+def envelope_key_id(enc_text):
+    """ConversationKey id of a v1 ciphertext, None for a legacy one."""
+    return decode_envelope(enc_text)[0] if is_envelope(enc_text) else None
+
+
+def seal(plain_text, key_id, key):
+    header = KEY_ID.pack(key_id)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=get_random_bytes(NONCE_SIZE))
+    cipher.update(FORMAT_PREFIX.encode() + header)
+    ciphertext, tag = cipher.encrypt_and_digest(plain_text.encode())
+    return FORMAT_PREFIX + base64.b64encode(header + cipher.nonce + tag + ciphertext).decode()
+
+
+def unseal_raw(raw, key):
+    header, rest = raw[:KEY_ID.size], raw[KEY_ID.size:]
+    nonce, tag, ciphertext = rest[:NONCE_SIZE], rest[NONCE_SIZE:NONCE_SIZE + TAG_SIZE], rest[NONCE_SIZE + TAG_SIZE:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(FORMAT_PREFIX.encode() + header)
+    return cipher.decrypt_and_verify(ciphertext, tag).decode()
+
+
+def unseal(enc_text, key):
+    return unseal_raw(decode_envelope(enc_text)[1], key)
+
+
+def reseal_rows(rows):
+    """Decrypt and re-seal messages; runs in the rotate_message_keys process pool.
+
+    Each row is (message id, ciphertext, legacy secret, source key or None,
+    target key id, target key); legacy rows (no source key) derive their key
+    from the secret, once per conversation thanks to this process's key_cache.
+    Returns ([(message id, new ciphertext)], [(message id, error)]).
+    """
+    done, failed = [], []
+    for message_id, enc_text, secret, source_key, target_id, target_key in rows:
+        try:
+            if source_key is None:
+                plain = decrypt_with_key(enc_text, derive_key(secret, CONVERSATION_SALT))
+            else:
+                plain = unseal(enc_text, source_key)
+            done.append((message_id, seal(plain, target_id, target_key)))
+        except (ValueError, KeyError, UnicodeDecodeError) as exc:
+            failed.append((message_id, f'{type(exc).__name__}: {exc}'))
+    return done, failed
@@ -1,18 +1,33 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
-from .models import Message
+from Django_config.db_routers import ReplicaReadMixin
+from Django_config.fast_serializers import FastListMixin
+from .models import InboxEntry, Message
 from .serializers import MessageSerializer
-from .utils import encrypt_message, decrypt_message
+from .pagination import KeysetPagination
+from .envelope import encrypt_for_conversation, decrypt_for_conversation
+from .inbox import mark_read
+from django.db.models import Q
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from rest_framework.response import Response
+from rest_framework import status
 from rest_framework.decorators import action
 
 User = get_user_model()
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(ReplicaReadMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        # Only the requesting user's conversations; each branch of the OR is
+        # served by one of the composite indexes on Message
+        user = self.request.user
+        return Message.objects.filter(Q(sender=user) | Q(receiver=user))
 
     def perform_create(self, serializer):
         sender = self.request.user
@@ -20,19 +35,72 @@ class MessageViewSet(viewsets.ModelViewSet):
         plain_text = self.request.data['plain_message']
         # Get the receiver as a User object
         receiver = User.objects.get(id=receiver_id)
-        # Encrypt the message
-        shared_secret = f"{min(str(sender.id), str(receiver_id))}:{max(str(sender.id), str(receiver_id))}"
-        salt = b"static_salt_for_demo"  # For better security, use a user-based salt
-        encrypted = encrypt_message(plain_text, shared_secret, salt)
-        # Save the message with sender and receiver as User objects
-        serializer.save(sender=sender, receiver=receiver, encrypted_message=encrypted)
+        # Encrypt the message with the conversation's data key (see dmessages.envelope)
+        encrypted = encrypt_for_conversation(plain_text, sender.id, receiver.id)
+        # Save the message with sender and receiver as User objects; the inbox counters commit with it
+        with transaction.atomic():
+            serializer.save(sender=sender, receiver=receiver, encrypted_message=encrypted)
 
     @action(detail=True, methods=['get'])
     def decrypt(self, request, pk=None):
         message = self.get_object()
-        receiver_id = message.receiver.id
-        sender_id = message.sender.id
-        shared_secret = f"{min(str(sender_id), str(receiver_id))}:{max(str(sender_id), str(receiver_id))}"
-        salt = b"static_salt_for_demo"
-        decrypted = decrypt_message(message.encrypted_message, shared_secret, salt)
+        decrypted = decrypt_for_conversation(message.encrypted_message, message.sender_id, message.receiver_id)
         return Response({'decrypted': decrypted})
+
+    def get_peer(self, peer_id):
+        # (peer, None) or (None, error response)
+        if not peer_id:
+            return None, Response({'error': 'peer is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return User.objects.get(id=peer_id), None
+        except (User.DoesNotExist, ValueError, ValidationError):
+            return None, Response({'error': 'Peer not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        # Last message time and unread count per peer from the maintained InboxEntry rows:
+        # one indexed read, no matter how many messages the conversations hold
+        entries = (InboxEntry.objects.filter(owner=request.user).order_by('-last_message_at')
+                   .values('peer_id', 'peer__username', 'peer__role', 'last_message_at', 'unread_count'))
+        return Response([{
+            'peer': str(entry['peer_id']),
+            'username': entry['peer__username'],
+            'role': entry['peer__role'],
+            'last_message_at': entry['last_message_at'],
+            'unread_count': entry['unread_count'],
+        } for entry in entries])
+
+    @action(detail=False, methods=['post'])
+    def read(self, request):
+        # Mark the peer's messages to the requesting user as read
+        peer, error = self.get_peer(request.data.get('peer'))
+        if error:
+            return error
+        return Response({'marked_read': mark_read(request.user, peer.id)})
+
+    @action(detail=False, methods=['get'])
+    def thread(self, request):
+        # One peer's conversation, decrypted server-side; keys come from the in-memory caches
+        peer, error = self.get_peer(request.query_params.get('peer'))
+        if error:
+            return error
+
+        user = request.user
+        queryset = Message.objects.filter(
+            Q(sender=user, receiver=peer) | Q(sender=peer, receiver=user)
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+
+        results = []
+        for message in page:
+            results.append({
+                'id': str(message.id),
+                'sender': str(message.sender_id),
+                'receiver': str(message.receiver_id),
+                'patient': message.patient_id,
+                'timestamp': message.timestamp,
+                'read_at': message.read_at,
+                'decrypted': decrypt_for_conversation(message.encrypted_message, user.id, peer.id),
+            })
+        return paginator.get_paginated_response(results)
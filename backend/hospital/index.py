@@ -0,0 +1,41 @@
+import threading
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from .models import Hospital
+from .spatial import GeoGridIndex
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def get_hospital_index():
+    """Return the process-wide hospital index, loading it from the database on first use.
+
+    After that it is kept current by the save/delete signals in hospital.signals.
+    """
+    global _index
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                index = GeoGridIndex(cell_size=getattr(settings, 'HOSPITAL_INDEX_CELL_SIZE', 0.1))
+                # Signals keep the index in step with commits on the primary, so build it from there too
+                for pk, lat, long in Hospital.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'hosp_lat', 'hosp_long').iterator():
+                    index.upsert(pk, lat, long)
+                _index = index
+    return _index
+
+
+def index_hospital(hospital):
+    if _index is not None:
+        _index.upsert(hospital.pk, hospital.hosp_lat, hospital.hosp_long)
+
+
+def unindex_hospital(pk):
+    if _index is not None:
+        _index.remove(pk)
+
+
+def reset_hospital_index():
+    global _index
+    with _build_lock:
+        _index = None
@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from Django_config.instrumentation import TimedRepresentationMixin
 from .models import Hospital
 
-class HospitalSerializer(serializers.ModelSerializer):
+class HospitalSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Hospital
         fields = '__all__'
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from Django_config.conditional import track_model_changes
+from .index import index_hospital, unindex_hospital
+from .models import Hospital
+
+
+@receiver(post_save, sender=Hospital)
+def update_hospital_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: index_hospital(instance))
+
+
+@receiver(post_delete, sender=Hospital)
+def remove_from_hospital_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: unindex_hospital(pk))
+
+
+track_model_changes(Hospital)
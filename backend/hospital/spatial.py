@@ -0,0 +1,143 @@
+import heapq
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, long1, lat2, long2):
+    """Great-circle distance in kilometres between two (lat, long) points in degrees."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(long2 - long1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoGridIndex:
+    """In-memory grid index over (lat, long) points supporting incremental updates.
+
+    Points are bucketed into fixed-size lat/long cells. A k-nearest query visits
+    rings of cells around the query point and stops as soon as no unvisited
+    cell can hold anything closer than the current k-th result, so the cost
+    depends on local density and not on the total number of points.
+    """
+
+    def __init__(self, cell_size=0.1):
+        self.cell_size = cell_size
+        self.cols = math.ceil(360 / cell_size)
+        self.rows = math.ceil(180 / cell_size)
+        self._cells = {}
+        self._points = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, lat, long):
+        row = min(self.rows - 1, max(0, int((lat + 90) // self.cell_size)))
+        col = int((long + 180) // self.cell_size) % self.cols
+        return row, col
+
+    def upsert(self, key, lat, long):
+        lat, long = float(lat), float(long)
+        with self._lock:
+            self._discard(key)
+            cell = self._cell(lat, long)
+            self._points[key] = (lat, long, cell)
+            self._cells.setdefault(cell, {})[key] = (lat, long)
+
+    def remove(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = point[2]
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+
+    def _ring(self, row, col, r):
+        if r == 0:
+            yield row, col
+            return
+        seen = set()
+        for dr in range(-r, r + 1):
+            ring_row = row + dr
+            if ring_row < 0 or ring_row >= self.rows:
+                continue
+            if abs(dr) == r:
+                cols = range(col - r, col + r + 1)
+            else:
+                cols = (col - r, col + r)
+            for c in cols:
+                cell = (ring_row, c % self.cols)
+                if cell not in seen:
+                    seen.add(cell)
+                    yield cell
+
+    def _ring_lower_bound_km(self, lat, r):
+        # Any point in ring r or beyond is at least r - 1 whole cells away in latitude or longitude
+        span = math.radians((r - 1) * self.cell_size)
+        lat_bound = EARTH_RADIUS_KM * span
+        max_lat = math.radians(min(90.0, abs(lat) + r * self.cell_size))
+        long_bound = 2 * EARTH_RADIUS_KM * math.asin(
+            min(1.0, math.cos(max_lat) * math.sin(min(span, math.pi) / 2))
+        )
+        return min(lat_bound, long_bound)
+
+    def nearest(self, lat, long, k=1, max_distance_km=None):
+        """Return up to ``k`` ``(distance_km, key)`` pairs ordered by distance."""
+        lat, long = float(lat), float(long)
+        if k <= 0:
+            return []
+        with self._lock:
+            if not self._points:
+                return []
+            row, col = self._cell(lat, long)
+            best = []  # max-heap of (-distance, key)
+            total = len(self._points)
+            visited = 0
+            r = 0
+            while visited < total:
+                if r > 0:
+                    bound = self._ring_lower_bound_km(lat, r)
+                    if max_distance_km is not None and bound > max_distance_km:
+                        break
+                    if len(best) == k and bound > -best[0][0]:
+                        break
+                if (2 * r + 1) ** 2 > total:
+                    # Sparse neighbourhood: rings now cost more than scanning every point
+                    best = []
+                    self._scan(self._points.items(), lat, long, k, max_distance_km, best)
+                    break
+                for cell in self._ring(row, col, r):
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        visited += len(bucket)
+                        self._scan(bucket.items(), lat, long, k, max_distance_km, best)
+                r += 1
+        return sorted((-neg, key) for neg, key in best)
+
+    @staticmethod
+    def _scan(items, lat, long, k, max_distance_km, best):
+        for key, point in items:
+            distance = haversine_km(lat, long, point[0], point[1])
+            if max_distance_km is not None and distance > max_distance_km:
+                continue
+            if len(best) < k:
+                heapq.heappush(best, (-distance, key))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, key))
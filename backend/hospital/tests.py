@@ -1,3 +1,101 @@
+import random
 from django.test import TestCase
+from rest_framework.test import APIClient
+from Django_config.testing import QueryBudgetMixin
+from users.models import User
+from .index import get_hospital_index, reset_hospital_index
+from .models import Hospital
+from .spatial import haversine_km
 
-# Create your tests here.
+
+class HospitalQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        reset_hospital_index()
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_hospitals(self, n):
+        # on_commit callbacks keep the in-memory index current, run them inside the test transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            start = Hospital.objects.count()
+            for i in range(start, start + n):
+                Hospital.objects.create(name=f'H{i}', hosp_lat=45.4 + i / 1000, hosp_long=11.87, address='x')
+
+    def test_list(self):
+        self.assertConstantQueries(1, lambda: self.client.get('/api/hospital/hospitals/'), self.add_hospitals)
+
+    def test_detail(self):
+        self.add_hospitals(1)
+        hospital = Hospital.objects.get()
+        with self.assertQueryBudget(1):
+            response = self.client.get(f'/api/hospital/hospitals/{hospital.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_nearest(self):
+        # index build on first use is a one-off, warm it before measuring
+        self.add_hospitals(1)
+        self.client.get('/api/hospital/hospitals/nearest/?lat=45.4&long=11.87')
+        self.assertConstantQueries(
+            1, lambda: self.client.get('/api/hospital/hospitals/nearest/?lat=45.4&long=11.87&k=50'),
+            self.add_hospitals,
+        )
+
+
+class HospitalNearestTests(TestCase):
+    def setUp(self):
+        reset_hospital_index()
+        self.addCleanup(reset_hospital_index)
+        get_hospital_index()  # built now, so the commits below are what keeps it current
+        rng = random.Random(11)
+        # A dense cluster around the query point plus hospitals spread over the region
+        points = [(45.4 + rng.uniform(-0.05, 0.05), 11.87 + rng.uniform(-0.05, 0.05)) for _ in range(30)]
+        points += [(45.4 + rng.uniform(-3, 3), 11.87 + rng.uniform(-3, 3)) for _ in range(40)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, (lat, long) in enumerate(points):
+                Hospital.objects.create(name=f'H{i}', hosp_lat=round(lat, 6), hosp_long=round(long, 6), address='x')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='crew', password='pass', role='ambulance'))
+
+    def nearest(self, **params):
+        return self.client.get('/api/hospital/hospitals/nearest/', params)
+
+    def brute_force(self, lat, long, k):
+        ranked = sorted((haversine_km(lat, long, float(h.hosp_lat), float(h.hosp_long)), h.id)
+                        for h in Hospital.objects.all())
+        return ranked[:k]
+
+    def test_matches_brute_force(self):
+        for lat, long, k in ((45.4, 11.87, 5), (45.4, 11.87, 50), (47.9, 14.1, 3), (10.0, -60.0, 4)):
+            response = self.nearest(lat=lat, long=long, k=k)
+            self.assertEqual(response.status_code, 200)
+            expected = self.brute_force(lat, long, k)
+            self.assertEqual([row['id'] for row in response.data], [pk for _, pk in expected])
+            for row, (distance, _) in zip(response.data, expected):
+                self.assertAlmostEqual(row['distance_km'], distance, places=3)
+
+    def test_k_is_clamped(self):
+        for k, count in (('0', 1), ('-4', 1), ('7', 7), ('500', 50)):
+            self.assertEqual(len(self.nearest(lat=45.4, long=11.87, k=k).data), count, k)
+        self.assertEqual(len(self.nearest(lat=45.4, long=11.87).data), 5)
+
+    def test_bad_coordinates_are_rejected(self):
+        for params in ({}, {'lat': 45.4}, {'lat': 'north', 'long': 11.87}, {'lat': 91, 'long': 11.87},
+                       {'lat': 45.4, 'long': -180.5}, {'lat': 45.4, 'long': 11.87, 'k': 'many'}):
+            self.assertEqual(self.nearest(**params).status_code, 400, params)
+
+    def test_index_follows_saves_and_deletes(self):
+        far = Hospital.objects.get(name='H69')
+        with self.captureOnCommitCallbacks(execute=True):
+            far.hosp_lat, far.hosp_long = 30.0, 30.0
+            far.save()
+            new = Hospital.objects.create(name='New', hosp_lat=30.01, hosp_long=30.01, address='y')
+        ids = [row['id'] for row in self.nearest(lat=30.0, long=30.0, k=2).data]
+        self.assertEqual(ids, [far.id, new.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            far.delete()
+        ids = [row['id'] for row in self.nearest(lat=30.0, long=30.0, k=2).data]
+        self.assertEqual(ids[0], new.id)
+        self.assertNotIn(far.id, ids)
+        self.assertNotIn(far.id, get_hospital_index())
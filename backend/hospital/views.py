@@ -1,14 +1,20 @@
 from django.shortcuts import render
 from rest_framework.viewsets import ModelViewSet
+from Django_config.conditional import ConditionalGetMixin
+from Django_config.db_routers import ReplicaReadMixin
+from Django_config.fast_serializers import FastListMixin
+from rest_framework.decorators import action
 from .models import Hospital
 from .serializers import HospitalSerializer
+from .index import get_hospital_index
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 
-class HospitalViewSet(ModelViewSet):
+class HospitalViewSet(ReplicaReadMixin, ConditionalGetMixin, FastListMixin, ModelViewSet):
     serializer_class = HospitalSerializer
     permission_classes = [IsAuthenticated]
+    conditional_models = [Hospital]
 #ensure only admins see all hospitals and hospital staff sees only their own 
     def get_queryset(self):
         user = self.request.user
@@ -16,4 +22,30 @@ class HospitalViewSet(ModelViewSet):
             return Hospital.objects.all()
         elif user.role == 'hospital':
             return Hospital.objects.filter(staff=user)
-        return Hospital.objects.none()
\ No newline at end of file
+        return Hospital.objects.none()
+
+    #nearest hospitals to a point, answered from the in-memory spatial index (any authenticated user)
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        try:
+            lat = float(request.query_params['lat'])
+            long = float(request.query_params['long'])
+            k = int(request.query_params.get('k', 5))
+        except (KeyError, ValueError):
+            return Response({'error': 'lat and long are required numbers, k must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= long <= 180):
+            return Response({'error': 'lat/long out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        k = max(1, min(k, 50))
+
+        matches = get_hospital_index().nearest(lat, long, k)
+        hospitals = Hospital.objects.in_bulk([pk for _, pk in matches])
+        results = []
+        for distance, pk in matches:
+            hospital = hospitals.get(pk)
+            if hospital is None:
+                continue
+            data = HospitalSerializer(hospital).data
+            data['distance_km'] = round(distance, 3)
+            results.append(data)
+        return Response(results)
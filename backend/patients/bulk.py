@@ -0,0 +1,100 @@
+#applies a batch of offline patient creates/updates with bulk queries in one transaction
+from django.db import transaction
+from Django_config.conditional import bump_table_version, table_label
+from Django_config.sqlite import retry_on_busy
+from .models import Patient
+from .serializers import PatientSerializer
+
+MAX_BATCH_SIZE = 500
+DB_BATCH_SIZE = 200
+CLIENT_REF_CONSTRAINT = 'patient_client_ref_unique'
+
+
+def is_client_ref_conflict(error):
+    """True if ``error`` is a violation of the (created_by, client_ref) constraint.
+
+    That is the same batch being applied concurrently, which a retry answers
+    with ``duplicate`` results; any other IntegrityError is a real bug.
+    """
+    diag = getattr(error.__cause__, 'diag', None)  # psycopg names the constraint
+    if getattr(diag, 'constraint_name', None):
+        return diag.constraint_name == CLIENT_REF_CONSTRAINT
+    # SQLite lists the columns, MySQL and older drivers the constraint name
+    message = str(error)
+    return CLIENT_REF_CONSTRAINT in message or f'{Patient._meta.db_table}.client_ref' in message
+
+
+@retry_on_busy
+def apply_patient_batch(items, user, context):
+    """Validate and apply ``items``, returning {client_id: result}.
+
+    Each item is ``{"client_id": str, "id": <existing id, optional>, "data": {...}}``.
+    Items without ``id`` are creates, which remember the client id so a batch
+    replayed after a lost response reports ``duplicate`` instead of inserting
+    the patient again. Invalid items are reported and skipped; every valid
+    item is written with one bulk_create and one bulk_update per set of
+    changed fields, so an update never rewrites columns its item left alone.
+    """
+    results = {}
+    creates = []
+    updates = {}
+    update_fields = {}
+
+    create_refs = [item['client_id'] for item in items if item.get('id') is None]
+    applied = dict(Patient.objects.filter(created_by=user, client_ref__in=create_refs)
+                   .values_list('client_ref', 'id'))
+    # created_by is read by the serializer's unique-together check on update
+    existing = Patient.objects.select_related('created_by').in_bulk([item['id'] for item in items if item.get('id') is not None])
+
+    for item in items:
+        client_id, pk, data = item['client_id'], item.get('id'), item.get('data') or {}
+        if pk is None:
+            if client_id in applied:
+                results[client_id] = {'status': 'duplicate', 'id': applied[client_id]}
+                continue
+            serializer = PatientSerializer(data=data, context=context)
+            if not serializer.is_valid():
+                results[client_id] = {'status': 'invalid', 'errors': serializer.errors}
+                continue
+            # created_by is always the crew member syncing, as in PatientViewSet.perform_create
+            fields = {**serializer.validated_data, 'created_by': user, 'client_ref': client_id}
+            patient = Patient(**fields)
+            patient.assign_generated_id()
+            creates.append((client_id, patient))
+            results[client_id] = None  # keeps the item's position; filled in once the row has an id
+        else:
+            patient = existing.get(pk)
+            if patient is None:
+                results[client_id] = {'status': 'not_found', 'id': pk}
+                continue
+            serializer = PatientSerializer(patient, data=data, partial=True, context=context)
+            if not serializer.is_valid():
+                results[client_id] = {'status': 'invalid', 'errors': serializer.errors}
+                continue
+            for attr, value in serializer.validated_data.items():
+                setattr(patient, attr, value)
+            changed = update_fields.setdefault(pk, set())
+            changed.update(serializer.validated_data)
+            previous_id = patient.patient_id
+            patient.assign_generated_id()
+            if patient.patient_id != previous_id:
+                changed.add('patient_id')
+            updates[pk] = patient
+            results[client_id] = {'status': 'updated', 'id': pk, 'patient_id': patient.patient_id}
+
+    with transaction.atomic():
+        if creates:
+            Patient.objects.bulk_create([patient for _, patient in creates], batch_size=DB_BATCH_SIZE)
+        groups = {}
+        for pk, patient in updates.items():
+            if update_fields[pk]:
+                groups.setdefault(tuple(sorted(update_fields[pk])), []).append(patient)
+        for fields, patients in groups.items():
+            Patient.objects.bulk_update(patients, fields, batch_size=DB_BATCH_SIZE)
+        if creates or updates:
+            # Bulk queries skip post_save, so bump the ETag version the Patient signals would have
+            transaction.on_commit(lambda: bump_table_version(table_label(Patient)))
+
+    for client_id, patient in creates:
+        results[client_id] = {'status': 'created', 'id': patient.pk, 'patient_id': patient.patient_id}
+    return results
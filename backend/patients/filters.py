@@ -0,0 +1,76 @@
+from datetime import datetime, time
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+TRUE_VALUES = {'true', '1', 'yes'}
+FALSE_VALUES = {'false', '0', 'no'}
+
+
+def parse_bool(name, value):
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError({name: 'Expected true or false.'})
+
+
+def parse_timestamp(name, value):
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Expected an ISO 8601 date or datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class PatientFilterBackend(BaseFilterBackend):
+    """Query-string filters for the patient list.
+
+    ?is_active=true|false
+    ?triage_code=red,orange
+    ?hospital=<id>  ?assigned_ambulance=<id>  (``null`` matches unassigned)
+    ?created_after=<iso>  ?created_before=<iso>
+    ?search=<text>  (patient id or name, case-insensitive)
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if 'is_active' in params:
+            queryset = queryset.filter(is_active=parse_bool('is_active', params['is_active']))
+
+        if params.get('triage_code'):
+            codes = [code for code in params['triage_code'].split(',') if code]
+            queryset = queryset.filter(triage_code__in=codes)
+
+        for field in ('hospital', 'assigned_ambulance'):
+            value = params.get(field)
+            if value is None or value == '':
+                continue
+            if value == 'null':
+                queryset = queryset.filter(**{f'{field}__isnull': True})
+            elif value.isdigit():
+                queryset = queryset.filter(**{f'{field}_id': int(value)})
+            else:
+                raise ValidationError({field: 'Expected an id or null.'})
+
+        if params.get('created_after'):
+            queryset = queryset.filter(created_at__gte=parse_timestamp('created_after', params['created_after']))
+        if params.get('created_before'):
+            queryset = queryset.filter(created_at__lt=parse_timestamp('created_before', params['created_before']))
+
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(Q(patient_id__icontains=search) | Q(name__icontains=search))
+
+        return queryset
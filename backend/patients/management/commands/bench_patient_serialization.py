@@ -0,0 +1,67 @@
+#compares PatientSerializer(many=True) with the compiled read plan on seeded patients
+#all seeded rows are rolled back when the command finishes
+import random
+import statistics
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from Django_config.fast_serializers import get_read_plan
+from patients.models import Patient
+from patients.serializers import PatientSerializer
+from benchmarks.transactions import rolled_back
+
+
+class Command(BaseCommand):
+    help = 'Benchmark serializing patients with PatientSerializer vs the compiled read plan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--role', default='ambulance')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(7)
+        triage = [code for code, _ in Patient.TRIAGE_CHOICES]
+        symptoms = [code for code, _ in Patient.SYMPTOM_CATEGORIES]
+        Patient.objects.bulk_create([
+            Patient(
+                patient_id=f'BENCH-{i}', hasID=True, name=f'Patient {i}',
+                symptoms=rng.sample(symptoms, 2), triage_code=rng.choice(triage),
+                is_active=rng.random() < 0.5, gender=rng.choice(['M', 'F']),
+                approximate_age=str(rng.randint(1, 95)), blood_pressure='120/80',
+                heart_rate=rng.randint(50, 150), oxygen_saturation=rng.randint(85, 100),
+            )
+            for i in range(options['patients'])
+        ], batch_size=2000)
+
+        context = {'request': SimpleNamespace(user=SimpleNamespace(role=options['role']))}
+        queryset = Patient.objects.order_by('-id')
+        renderer = JSONRenderer()
+
+        def regular():
+            return renderer.render(PatientSerializer(queryset.all(), many=True, context=context).data)
+
+        def compiled():
+            plan = get_read_plan(PatientSerializer, context, options['role'])
+            return renderer.render(plan.render(plan.values(queryset.all())))
+
+        if regular() != compiled():
+            self.stderr.write('output differs between the two paths')
+            return
+
+        results = {}
+        for label, fn in (('ModelSerializer', regular), ('read plan', compiled)):
+            timings = []
+            for _ in range(options['repeat']):
+                t0 = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - t0)
+            results[label] = statistics.median(timings)
+            self.stdout.write(f'{label:>16}: {results[label] * 1000:8.1f} ms for {options["patients"]} patients')
+        self.stdout.write('output: byte-identical')
+        self.stdout.write(f"speedup: {results['ModelSerializer'] / results['read plan']:.1f}x")
@@ -0,0 +1,86 @@
+#benchmark for the per-hospital triage queue: thousands of active cases, reading the head of the queue
+#compares the indexed triage_rank order with sorting the active cases per request; seeded rows are rolled back
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+from hospital.models import Hospital
+from patients.models import TRIAGE_SEVERITY, UNTRIAGED, Patient
+from patients.triage import triage_queue
+from benchmarks.transactions import rolled_back
+
+
+CODES = list(TRIAGE_SEVERITY) + [None]
+
+
+class Command(BaseCommand):
+    help = 'Compare reading the triage queue through its index with sorting active patients per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5000, help='active cases')
+        parser.add_argument('--hospitals', type=int, default=5)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=100, help='rows read from the head of the queue')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        hospitals = Hospital.objects.bulk_create([
+            Hospital(name=f'BENCH-{i}', hosp_lat=45.4, hosp_long=11.87, address='bench')
+            for i in range(options['hospitals'])
+        ])
+        start = timezone.now() - timedelta(hours=12)
+        Patient.objects.bulk_create([
+            Patient(
+                patient_id=f'BENCH-{i:06d}',
+                hospital=rng.choice(hospitals),
+                triage_code=rng.choice(CODES),
+                is_active=True,
+            )
+            for i in range(options['patients'])
+        ], batch_size=2000)
+        # created_at is auto_now_add, so spread the arrivals out afterwards
+        patients = list(Patient.objects.filter(hospital__in=hospitals).only('id', 'created_at'))
+        for patient in patients:
+            patient.created_at = start + timedelta(seconds=rng.uniform(0, 12 * 3600))
+        Patient.objects.bulk_update(patients, ['created_at'], batch_size=2000)
+
+        limit = options['limit']
+        # What the endpoint did before triage_rank: sort the hospital's active cases on every request
+        severity = Case(*[When(triage_code=code, then=Value(rank)) for code, rank in TRIAGE_SEVERITY.items()],
+                        default=Value(UNTRIAGED), output_field=IntegerField())
+        sorted_query, indexed = [], []
+        for _ in range(options['queries']):
+            hospital = rng.choice(hospitals)
+            t0 = time.perf_counter()
+            expected = list(
+                Patient.objects.filter(hospital=hospital, is_active=True)
+                .annotate(severity=severity).order_by('-severity', 'created_at', 'id')
+                .values_list('id', flat=True)[:limit]
+            )
+            sorted_query.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            result = list(triage_queue(hospital.id).values_list('id', flat=True)[:limit])
+            indexed.append(time.perf_counter() - t0)
+            if result != expected:
+                self.stderr.write(f'mismatch for hospital {hospital.id}')
+
+        self.stdout.write(f"active cases: {options['patients']}, hospitals: {len(hospitals)}, "
+                          f"queries: {options['queries']}, limit: {limit}")
+        self.report('ORDER BY', sorted_query)
+        self.report('index', indexed)
+        self.stdout.write(f'speedup (p50): {statistics.median(sorted_query) / statistics.median(indexed):.1f}x')
+        self.stdout.write(f"plan: {triage_queue(hospitals[0].id)[:limit].explain()}")
+
+    def report(self, label, timings):
+        timings = sorted(t * 1e6 for t in timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'{label:>10}: p50 {statistics.median(timings):10.1f} us   p95 {p95:10.1f} us')
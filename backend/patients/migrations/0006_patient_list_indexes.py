@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0005_ambulance_location_history'),
+        ('hospital', '0003_remove_hospital_staff'),
+        ('patients', '0005_patient_assigned_ambulance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['is_active', 'id'], name='patient_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['triage_code', 'id'], name='patient_triage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['hospital', 'id'], name='patient_hospital_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['assigned_ambulance', 'id'], name='patient_ambulance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at'], name='patient_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0005_ambulance_location_history'),
+        ('hospital', '0003_remove_hospital_staff'),
+        ('patients', '0006_patient_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='client_ref',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='patient',
+            constraint=models.UniqueConstraint(fields=('created_by', 'client_ref'), name='patient_client_ref_unique'),
+        ),
+    ]
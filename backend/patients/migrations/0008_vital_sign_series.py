@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_patient_client_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='vitals_recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='VitalSignReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('systolic', models.PositiveSmallIntegerField(null=True)),
+                ('diastolic', models.PositiveSmallIntegerField(null=True)),
+                ('heart_rate', models.PositiveSmallIntegerField(null=True)),
+                ('oxygen_saturation', models.PositiveSmallIntegerField(null=True)),
+                ('electromyography', models.CharField(blank=True, max_length=50, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vital_signs', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'recorded_at'], name='vital_sign_series_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0005_ambulance_location_history'),
+        ('hospital', '0003_remove_hospital_staff'),
+        ('patients', '0008_vital_sign_series'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='triage_rank',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(then=models.Value(4), triage_code='red'), models.When(then=models.Value(3), triage_code='orange'), models.When(then=models.Value(2), triage_code='deepskyblue'), models.When(then=models.Value(1), triage_code='green'), models.When(then=models.Value(0), triage_code='white'), default=models.Value(-1)), output_field=models.SmallIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['hospital', '-triage_rank', 'created_at', 'id'], name='patient_triage_queue_idx'),
+        ),
+    ]
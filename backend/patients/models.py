@@ -4,6 +4,10 @@ from users.models import User
 from hospital.models import Hospital
 from ambulance.models import Ambulance
 
+# Most to least urgent; patients without a code queue after everyone else
+TRIAGE_SEVERITY = {'red': 4, 'orange': 3, 'deepskyblue': 2, 'green': 1, 'white': 0}
+UNTRIAGED = -1
+
 
 class Patient(models.Model):
     SYMPTOM_CATEGORIES = [
@@ -36,6 +40,7 @@ class Patient(models.Model):
     # ambulance = models.ForeignKey(Ambulance, on_delete=models.SET_NULL, null=True, blank=True, related_name='patients')
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     assigned_ambulance = models.ForeignKey(Ambulance, on_delete=models.SET_NULL, null=True, blank=True, related_name='patients')
+    client_ref = models.CharField(max_length=64, blank=True, null=True)  # temporary id from an offline client, see views.bulk
 
 
     #extra infos for patient without ID
@@ -50,12 +55,71 @@ class Patient(models.Model):
     heart_rate = models.IntegerField(blank=True, null=True)  # bpm
     oxygen_saturation = models.IntegerField(blank=True, null=True)  # percentage
     electromyography = models.CharField(max_length=50, blank=True, null=True)  # Normal, Abnormal, etc.
+    vitals_recorded_at = models.DateTimeField(blank=True, null=True)  # time of the reading above, see vitals.py
 
-    def save(self, *args, **kwargs):
+    # TRIAGE_SEVERITY of triage_code, computed by the database so bulk writes and other processes keep it right
+    triage_rank = models.GeneratedField(
+        expression=models.Case(
+            *[models.When(triage_code=code, then=models.Value(rank)) for code, rank in TRIAGE_SEVERITY.items()],
+            default=models.Value(UNTRIAGED),
+        ),
+        output_field=models.SmallIntegerField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        # Composite indexes matching the list filters (see filters.py); id keeps the
+        # cursor pagination order inside each filtered range
+        indexes = [
+            models.Index(fields=['is_active', 'id'], name='patient_active_idx'),
+            models.Index(fields=['triage_code', 'id'], name='patient_triage_idx'),
+            models.Index(fields=['hospital', 'id'], name='patient_hospital_idx'),
+            models.Index(fields=['assigned_ambulance', 'id'], name='patient_ambulance_idx'),
+            models.Index(fields=['created_at'], name='patient_created_at_idx'),
+            # Triage queue of a hospital (see triage.py) read in index order. Partial on is_active:
+            # filter(is_active=True) compiles to a bare boolean term, which only a partial index matches
+            models.Index(fields=['hospital', '-triage_rank', 'created_at', 'id'], condition=models.Q(is_active=True),
+                         name='patient_triage_queue_idx'),
+        ]
+        constraints = [
+            # A replayed offline create must not insert the patient twice
+            models.UniqueConstraint(fields=['created_by', 'client_ref'], name='patient_client_ref_unique'),
+        ]
+
+    def assign_generated_id(self):
         if not self.patient_id and not self.hasID:
             # Generate a random ID for patients without ID
             self.patient_id = f"NO_ID_{str(uuid.uuid4())[:8]}"
+
+    def save(self, *args, **kwargs):
+        # bulk_create skips save(), so bulk callers call assign_generated_id themselves
+        self.assign_generated_id()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.patient_id or f"Patient {self.id}"
+
+
+class VitalSignReading(models.Model):
+    # append-only vital signs series; the Patient columns only keep the latest reading (see vitals.py)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vital_signs')
+    recorded_at = models.DateTimeField()
+    systolic = models.PositiveSmallIntegerField(null=True)  # mmHg, blood pressure is stored as two numbers
+    diastolic = models.PositiveSmallIntegerField(null=True)
+    heart_rate = models.PositiveSmallIntegerField(null=True)  # bpm
+    oxygen_saturation = models.PositiveSmallIntegerField(null=True)  # percentage
+    electromyography = models.CharField(max_length=50, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'recorded_at'], name='vital_sign_series_idx'),
+        ]
+
+    @property
+    def blood_pressure(self):
+        if self.systolic is None or self.diastolic is None:
+            return None
+        return f"{self.systolic}/{self.diastolic}"
+
+    def __str__(self):
+        return f"{self.patient_id} @ {self.recorded_at}"
@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PatientCursorPagination(CursorPagination):
+    # Newest cases first. Ordered on the auto-increment id (unique, never null)
+    # so the cursor is a pure keyset position and pages stay O(page_size).
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
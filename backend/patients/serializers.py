@@ -1,17 +1,44 @@
+from django.utils import timezone
 from rest_framework import serializers
+from Django_config.instrumentation import TimedRepresentationMixin
 from .models import Patient
+from .vitals import MAX_CLOCK_SKEW
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = '__all__'
         #read_only_fields = ['created_by', 'created_at']
+        # Vital signs change only through the vitals endpoint, which keeps the series and this snapshot in step
+        read_only_fields = ['client_ref', 'vitals_recorded_at', 'blood_pressure', 'heart_rate', 'oxygen_saturation',
+                            'electromyography']
 
     #make all fields read-only for hospital staff
     def get_fields(self):
         fields = super().get_fields()
+        fields.pop('triage_rank', None)  # ordering column, triage_code already says the same
         user = self.context['request'].user
         if user.role == 'hospital':
             for field in fields.values():
                 field.read_only = True
-        return fields
\ No newline at end of file
+        return fields
+
+class VitalSignReadingSerializer(serializers.Serializer):
+    # one reading in a vitals batch, in the same units as the Patient vital sign columns
+    recorded_at = serializers.DateTimeField(required=False)
+    blood_pressure = serializers.RegexField(r'^\d{2,3}/\d{2,3}$', required=False, allow_null=True)
+    heart_rate = serializers.IntegerField(min_value=0, max_value=400, required=False, allow_null=True)
+    oxygen_saturation = serializers.IntegerField(min_value=0, max_value=100, required=False, allow_null=True)
+    electromyography = serializers.CharField(max_length=50, required=False, allow_null=True, allow_blank=True)
+
+    def validate_recorded_at(self, value):
+        # A device clock far ahead would pin the patient snapshot to its reading until real time caught up
+        if value > timezone.now() + MAX_CLOCK_SKEW:
+            raise serializers.ValidationError('recorded_at is in the future')
+        return value
+
+    def validate(self, data):
+        if not any(data.get(name) not in (None, '') for name in ('blood_pressure', 'heart_rate',
+                                                                 'oxygen_saturation', 'electromyography')):
+            raise serializers.ValidationError("A reading needs at least one vital sign")
+        return data
@@ -1,3 +1,421 @@
+from django.core.cache import caches
+from unittest import mock
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.test import APIClient
+from Django_config.conditional import _cache_key, bump_table_version, table_label
+from Django_config.testing import QueryBudgetMixin, FastListMixinAssertions, is_cache_query
+from ambulance.models import Ambulance
+from hospital.models import Hospital
+from users.models import User
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .bulk import is_client_ref_conflict
+from .models import Patient, VitalSignReading
+from .serializers import PatientSerializer
+from .triage import triage_queue
+from .vitals import downsample
 
-# Create your tests here.
+
+class PatientQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.hospital = Hospital.objects.create(name='ER', hosp_lat=45.4, hosp_long=11.87, address='x')
+        self.ambulance = Ambulance.objects.create(plate_number='AMB-1', location_lat=45.4, location_long=11.87)
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+
+    def add_patients(self, n):
+        for _ in range(n):
+            Patient.objects.create(created_by=self.crew, hospital=self.hospital,
+                                   assigned_ambulance=self.ambulance, triage_code='red')
+
+    def test_list(self):
+        self.assertConstantQueries(1, lambda: self.client.get('/api/patients/?page_size=100'), self.add_patients)
+
+    def test_filtered_list(self):
+        self.assertConstantQueries(
+            1, lambda: self.client.get(f'/api/patients/?is_active=true&hospital={self.hospital.id}'),
+            self.add_patients,
+        )
+
+    def test_list_as_hospital_staff(self):
+        self.client.force_authenticate(User.objects.create_user(username='er', password='pass', role='hospital'))
+        self.assertConstantQueries(1, lambda: self.client.get('/api/patients/'), self.add_patients)
+
+    def test_detail(self):
+        self.add_patients(1)
+        patient = Patient.objects.get()
+        with self.assertQueryBudget(1):
+            response = self.client.get(f'/api/patients/{patient.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+
+class PatientFastListTests(FastListMixinAssertions, TestCase):
+    def test_list_matches_model_serializer(self):
+        crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        hospital = Hospital.objects.create(name='ER', hosp_lat=45.4, hosp_long=11.87, address='x')
+        Patient.objects.create(created_by=crew, hospital=hospital, triage_code='red', heart_rate=80,
+                               symptoms=['Cardiac'], blood_pressure='120/80', name='A')
+        Patient.objects.create(hasID=True, patient_id='ID-1', is_active=False)
+        client = APIClient()
+        for role in ('ambulance', 'hospital'):
+            user = User.objects.create_user(username=f'{role}-viewer', password='pass', role=role)
+            client.force_authenticate(user)
+            response = client.get('/api/patients/')
+            self.assertSameAsSerializer(response.data['results'], PatientSerializer,
+                                        Patient.objects.order_by('-id'), user)
+
+
+class PatientFilterTests(TestCase):
+    def setUp(self):
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.er = Hospital.objects.create(name='ER', hosp_lat=45.4, hosp_long=11.87, address='x')
+        self.other = Hospital.objects.create(name='Other', hosp_lat=45.5, hosp_long=11.9, address='y')
+        self.ambulance = Ambulance.objects.create(plate_number='AMB-1', location_lat=45.4, location_long=11.87)
+        make = Patient.objects.create
+        self.red = make(created_by=self.crew, hospital=self.er, triage_code='red', name='Anna Rossi',
+                        assigned_ambulance=self.ambulance)
+        self.green = make(created_by=self.crew, hospital=self.other, triage_code='green', name='Marco Bianchi')
+        self.done = make(created_by=self.crew, hospital=self.er, triage_code='orange', is_active=False,
+                         hasID=True, patient_id='RSSMRA80A01')
+        self.loose = make(created_by=self.crew, triage_code='white')
+        Patient.objects.filter(pk=self.loose.pk).update(created_at=timezone.now() - timedelta(days=3))
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+
+    def ids(self, query):
+        response = self.client.get(f'/api/patients/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['id'] for row in response.data['results']]
+
+    def test_status(self):
+        self.assertEqual(self.ids('is_active=true'), [self.loose.id, self.green.id, self.red.id])
+        self.assertEqual(self.ids('is_active=false'), [self.done.id])
+
+    def test_hospital_and_ambulance(self):
+        self.assertEqual(self.ids(f'hospital={self.er.id}'), [self.done.id, self.red.id])
+        self.assertEqual(self.ids('hospital=null'), [self.loose.id])
+        self.assertEqual(self.ids(f'hospital={self.er.id}&is_active=true'), [self.red.id])
+        self.assertEqual(self.ids(f'assigned_ambulance={self.ambulance.id}'), [self.red.id])
+
+    def test_triage_code_and_created_range(self):
+        self.assertEqual(self.ids('triage_code=red,green'), [self.green.id, self.red.id])
+        yesterday = (timezone.now() - timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.ids(f'created_before={yesterday}'), [self.loose.id])
+        self.assertNotIn(self.loose.id, self.ids(f'created_after={yesterday}'))
+
+    def test_search(self):
+        self.assertEqual(self.ids('search=rossi'), [self.red.id])
+        self.assertEqual(self.ids('search=rssmra'), [self.done.id])
+        self.assertEqual(self.ids('search=ma&is_active=true'), [self.green.id])
+        self.assertEqual(len(self.ids('search=')), 4)
+
+    def test_newest_first_across_pages(self):
+        pages, url = [], '/api/patients/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data['next']
+        self.assertEqual(pages, [[self.loose.id, self.done.id, self.green.id], [self.red.id]])
+
+    def test_bad_values_are_rejected(self):
+        for query in ('is_active=maybe', 'hospital=er', 'created_after=last-week'):
+            self.assertEqual(self.client.get(f'/api/patients/?{query}').status_code, 400, query)
+
+
+class PatientConditionalGetTests(TestCase):
+    def setUp(self):
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient = Patient.objects.create(created_by=self.crew, triage_code='red')
+
+    def test_matching_etag_skips_list_query(self):
+        response = self.client.get('/api/patients/')
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Only the version lookup in the shared cache table
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(is_cache_query(queries[0]['sql']))
+
+    def test_write_in_another_worker_changes_etag(self):
+        # Another process shares only CACHES['shared']; the version it bumps is what this one reads
+        etag = self.client.get('/api/patients/')['ETag']
+        caches['shared'].set(_cache_key(table_label(Patient)), ('other-worker', datetime.now(dt_timezone.utc)))
+        self.assertEqual(self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get('/api/patients/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.triage_code = 'green'
+            self.patient.save()
+        response = self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['triage_code'], 'green')
+
+    def test_etag_varies_with_query_and_user(self):
+        etag = self.client.get('/api/patients/')['ETag']
+        self.assertNotEqual(self.client.get('/api/patients/?is_active=true')['ETag'], etag)
+        self.client.force_authenticate(User.objects.create_user(username='er', password='pass', role='hospital'))
+        self.assertEqual(self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_if_modified_since(self):
+        url = f'/api/patients/{self.patient.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_write_in_the_same_second_is_modified(self):
+        url = f'/api/patients/{self.patient.id}/'
+        second = timezone.now().replace(microsecond=0)
+        with mock.patch('Django_config.conditional.timezone.now', return_value=second):
+            bump_table_version(table_label(Patient))
+            last_modified = self.client.get(url)['Last-Modified']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.patient.triage_code = 'green'
+                self.patient.save()
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(last_modified))
+
+
+class TriageQueueTests(TestCase):
+    def setUp(self):
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.hospital = Hospital.objects.create(name='ER', hosp_lat=45.4, hosp_long=11.87, address='x')
+        self.other = Hospital.objects.create(name='North', hosp_lat=45.5, hosp_long=11.9, address='y')
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+
+    def admit(self, triage_code, hospital=None):
+        return Patient.objects.create(created_by=self.crew, hospital=hospital or self.hospital,
+                                      triage_code=triage_code)
+
+    def queue(self, **params):
+        response = self.client.get('/api/patients/triage-queue/', {'hospital': self.hospital.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_orders_by_severity_then_arrival(self):
+        green = self.admit('green')
+        first_red = self.admit('red')
+        untriaged = self.admit(None)
+        second_red = self.admit('red')
+        orange = self.admit('orange')
+        self.admit('red', hospital=self.other)
+        data = self.queue()
+        self.assertEqual([row['id'] for row in data['results']],
+                         [first_red.id, second_red.id, orange.id, green.id, untriaged.id])
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['by_triage_code']['red'], 2)
+        self.assertEqual([row['id'] for row in self.queue(offset=1, limit=2)['results']], [second_red.id, orange.id])
+
+    def test_follows_updates_and_deactivation(self):
+        green = self.admit('green')
+        red = self.admit('red')
+        green.triage_code = 'red'
+        green.save()
+        red.is_active = False
+        red.save()
+        self.assertEqual([row['id'] for row in self.queue()['results']], [green.id])
+        green.hospital = self.other
+        green.save()
+        self.assertEqual(self.queue()['results'], [])
+
+    def test_sees_writes_that_skip_signals(self):
+        # As a row written by another worker or a bulk query would look to this process
+        green = self.admit('green')
+        self.queue()
+        Patient.objects.bulk_create([Patient(created_by=self.crew, hospital=self.hospital, triage_code='orange')])
+        orange = Patient.objects.get(triage_code='orange')
+        Patient.objects.filter(pk=green.pk).update(triage_code='red')
+        data = self.queue()
+        self.assertEqual([row['id'] for row in data['results']], [green.id, orange.id])
+        self.assertEqual(data['by_triage_code'], {'red': 1, 'orange': 1})
+
+    def test_reads_the_queue_index(self):
+        plan = triage_queue(self.hospital.id)[:100].explain()
+        self.assertIn('patient_triage_queue_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_requires_hospital(self):
+        response = self.client.get('/api/patients/triage-queue/')
+        self.assertEqual(response.status_code, 400)
+
+
+class PatientBulkSyncTests(TestCase):
+    def setUp(self):
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+
+    def sync(self, items):
+        return self.client.post('/api/patients/bulk/', {'items': items}, format='json')
+
+    def test_creates_and_updates_in_one_request(self):
+        existing = Patient.objects.create(created_by=self.crew, triage_code='green')
+        items = [{'client_id': f'tmp-{i}', 'data': {'triage_code': 'red', 'name': f'P{i}'}} for i in range(20)]
+        items.append({'client_id': 'edit-1', 'id': existing.id, 'data': {'triage_code': 'orange', 'is_active': False}})
+        # client_ref lookup and existing rows, then one INSERT and one UPDATE (the primary pin is a cache write)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.sync(items)
+        self.assertEqual(sum(1 for query in queries if not is_cache_query(query['sql'])), 4)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual(list(results), [item['client_id'] for item in items])
+        created = Patient.objects.get(id=results['tmp-3']['id'])
+        self.assertEqual((created.name, created.created_by, created.client_ref), ('P3', self.crew, 'tmp-3'))
+        self.assertTrue(created.patient_id.startswith('NO_ID_'))
+        self.assertEqual(results['tmp-3']['patient_id'], created.patient_id)
+        existing.refresh_from_db()
+        self.assertEqual((existing.triage_code, existing.is_active), ('orange', False))
+        self.assertEqual(results['edit-1']['status'], 'updated')
+
+    def test_replayed_batch_does_not_duplicate(self):
+        items = [{'client_id': 'tmp-1', 'data': {'name': 'A'}}]
+        first = self.sync(items).data['results']['tmp-1']
+        again = self.sync(items).data['results']['tmp-1']
+        self.assertEqual((first['status'], again['status']), ('created', 'duplicate'))
+        self.assertEqual(first['id'], again['id'])
+        self.assertEqual(Patient.objects.count(), 1)
+
+    def test_reports_bad_items_and_applies_the_rest(self):
+        response = self.sync([
+            {'client_id': 'bad', 'data': {'triage_code': 'purple'}},
+            {'client_id': 'gone', 'id': 999999, 'data': {'name': 'B'}},
+            {'client_id': 'good', 'data': {'name': 'C'}},
+        ])
+        results = response.data['results']
+        self.assertEqual(results['bad']['status'], 'invalid')
+        self.assertIn('triage_code', results['bad']['errors'])
+        self.assertEqual(results['gone']['status'], 'not_found')
+        self.assertEqual(results['good']['status'], 'created')
+        self.assertEqual(Patient.objects.count(), 1)
+
+    def test_updates_write_only_their_own_fields(self):
+        first, second, third = (Patient.objects.create(created_by=self.crew, triage_code='green') for _ in range(3))
+        with CaptureQueriesContext(connection) as queries:
+            self.sync([
+                {'client_id': 'a', 'id': first.id, 'data': {'triage_code': 'red'}},
+                {'client_id': 'b', 'id': second.id, 'data': {'name': 'Bea'}},
+                {'client_id': 'c', 'id': third.id, 'data': {'triage_code': 'orange'}},
+            ])
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        # One UPDATE per field set, each touching only the columns its items sent
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(sorted('"name"' in sql for sql in updates), [False, True])
+        self.assertEqual(sorted('"triage_code"' in sql for sql in updates), [False, True])
+        values = Patient.objects.order_by('id').values_list('triage_code', 'name')
+        self.assertEqual(list(values), [('red', None), ('green', 'Bea'), ('orange', None)])
+
+    def test_only_client_ref_conflicts_are_409(self):
+        Patient.objects.create(created_by=self.crew, client_ref='tmp-1')
+        with self.assertRaises(IntegrityError) as raised, transaction.atomic():
+            Patient.objects.create(created_by=self.crew, client_ref='tmp-1')
+        self.assertTrue(is_client_ref_conflict(raised.exception))
+
+        items = [{'client_id': 'tmp-2', 'data': {}}]
+        with mock.patch('patients.views.apply_patient_batch', side_effect=raised.exception):
+            self.assertEqual(self.sync(items).status_code, 409)
+        other = IntegrityError('NOT NULL constraint failed: patients_patient.is_active')
+        self.assertFalse(is_client_ref_conflict(other))
+        with mock.patch('patients.views.apply_patient_batch', side_effect=other):
+            with self.assertRaises(IntegrityError):
+                self.sync(items)
+
+    def test_rejects_malformed_batches_and_hospital_staff(self):
+        self.assertEqual(self.sync([{'data': {}}]).status_code, 400)
+        self.assertEqual(self.sync([{'client_id': 'a'}, {'client_id': 'a'}]).status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='er', password='pass', role='hospital'))
+        self.assertEqual(self.sync([{'client_id': 'a', 'data': {}}]).status_code, 403)
+
+
+class VitalSignSeriesTests(TestCase):
+    def setUp(self):
+        self.crew = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.patient = Patient.objects.create(created_by=self.crew, triage_code='red')
+        self.url = f'/api/patients/{self.patient.id}/vitals/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.crew)
+        self.t0 = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def at(self, seconds):
+        return (self.t0 + timedelta(seconds=seconds)).isoformat()
+
+    def test_ingest_appends_and_keeps_latest_snapshot(self):
+        response = self.client.post(self.url, {'readings': [
+            {'recorded_at': self.at(60), 'heart_rate': 95, 'blood_pressure': '130/85'},
+            {'recorded_at': self.at(0), 'heart_rate': 90, 'oxygen_saturation': 97, 'electromyography': 'Normal'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(VitalSignReading.objects.filter(patient=self.patient).count(), 2)
+        snapshot = response.data['patient']
+        self.assertEqual((snapshot['heart_rate'], snapshot['blood_pressure'], snapshot['oxygen_saturation']),
+                         (95, '130/85', 97))
+
+        # A late, older reading is stored but does not move the snapshot back
+        self.client.post(self.url, {'readings': [{'recorded_at': self.at(30), 'heart_rate': 70}]}, format='json')
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.heart_rate, 95)
+        self.assertEqual(VitalSignReading.objects.filter(patient=self.patient).count(), 3)
+
+    def test_range_is_downsampled_per_bucket(self):
+        VitalSignReading.objects.bulk_create([
+            VitalSignReading(patient=self.patient, recorded_at=self.t0 + timedelta(seconds=s), heart_rate=hr,
+                             systolic=120, diastolic=80)
+            for s, hr in [(0, 80), (10, 100), (59, 90), (60, 70), (200, 60)]
+        ])
+        response = self.client.get(self.url, {'start': self.at(0), 'end': self.at(240), 'bucket': 60})
+        self.assertEqual(response.status_code, 200)
+        series = response.data['series']
+        self.assertEqual([bucket['count'] for bucket in series], [3, 1, 1])
+        self.assertEqual(series[0]['heart_rate'], {'min': 80, 'max': 100, 'avg': 90.0})
+        self.assertEqual(series[2]['start'], self.t0 + timedelta(seconds=180))
+        self.assertIsNone(series[0]['oxygen_saturation'])
+
+    def test_range_is_aggregated_in_the_database(self):
+        VitalSignReading.objects.bulk_create([
+            VitalSignReading(patient=self.patient, recorded_at=self.t0 + timedelta(seconds=s), heart_rate=60 + s % 40)
+            for s in range(0, 3600, 5)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            series = downsample(self.patient.id, self.t0, self.t0 + timedelta(hours=1), 600)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('GROUP BY', queries[0]['sql'])
+        self.assertEqual([bucket['count'] for bucket in series], [120] * 6)
+        self.assertEqual(series[5]['heart_rate'], {'min': 60, 'max': 95, 'avg': 77.5})
+        self.assertEqual(series[5]['start'], self.t0 + timedelta(seconds=3000))
+
+    def test_rejects_readings_from_the_future(self):
+        ahead = (timezone.now() + timedelta(hours=1)).isoformat()
+        response = self.client.post(self.url, {'readings': [{'recorded_at': ahead, 'heart_rate': 80}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(VitalSignReading.objects.exists())
+        slightly = (timezone.now() + timedelta(seconds=30)).isoformat()
+        response = self.client.post(self.url, {'readings': [{'recorded_at': slightly, 'heart_rate': 80}]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_vitals_are_read_only_on_the_patient(self):
+        response = self.client.patch(f'/api/patients/{self.patient.id}/', {'heart_rate': 150, 'name': 'A'},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.patient.refresh_from_db()
+        self.assertEqual((self.patient.heart_rate, self.patient.name), (None, 'A'))
+
+    def test_rejects_empty_readings_and_hospital_staff(self):
+        self.assertEqual(self.client.post(self.url, {'readings': [{'heart_rate': 80}, {}]}, format='json').status_code,
+                         400)
+        self.client.force_authenticate(User.objects.create_user(username='er', password='pass', role='hospital'))
+        self.assertEqual(self.client.post(self.url, {'readings': [{'heart_rate': 80}]}, format='json').status_code,
+                         403)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
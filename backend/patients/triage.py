@@ -0,0 +1,18 @@
+# per-hospital triage queue: active patients, most severe first and then by arrival
+# ordered by the database through patient_triage_queue_idx, so every worker sees every write as soon as it commits
+from django.db.models import Count
+from .models import Patient
+
+QUEUE_ORDER = ('-triage_rank', 'created_at', 'id')
+
+
+def triage_queue(hospital_id):
+    """Active patients of ``hospital_id`` in queue order; slicing reads only the head of the index range."""
+    return Patient.objects.filter(hospital_id=hospital_id, is_active=True).order_by(*QUEUE_ORDER)
+
+
+def counts_by_code(hospital_id):
+    """{triage_code: active patients} for ``hospital_id``, from the same index range."""
+    rows = (Patient.objects.filter(hospital_id=hospital_id, is_active=True)
+            .values_list('triage_code').annotate(n=Count('id')).order_by())
+    return dict(rows)
@@ -1,18 +1,35 @@
 from rest_framework.viewsets import ModelViewSet
+from Django_config.conditional import ConditionalGetMixin
+from Django_config.db_routers import ReplicaReadMixin
+from Django_config.fast_serializers import FastListMixin
+from Django_config.sqlite import retry_on_busy
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from datetime import timedelta
+from django.db import IntegrityError
+from django.utils import timezone
 from .models import Patient
-from .serializers import PatientSerializer
+from .serializers import PatientSerializer, VitalSignReadingSerializer
+from .filters import PatientFilterBackend, parse_timestamp
+from .pagination import PatientCursorPagination
+from .triage import triage_queue, counts_by_code
+from .bulk import apply_patient_batch, is_client_ref_conflict, MAX_BATCH_SIZE
+from .vitals import record_readings, downsample, bucket_width, MAX_BATCH_SIZE as MAX_VITALS_BATCH_SIZE
 
-class PatientViewSet(ModelViewSet):
+class PatientViewSet(ReplicaReadMixin, ConditionalGetMixin, FastListMixin, ModelViewSet):
     serializer_class = PatientSerializer
+    conditional_models = [Patient]
     permission_classes = [IsAuthenticated]
+    filter_backends = [PatientFilterBackend]
+    pagination_class = PatientCursorPagination
 
     def get_queryset(self):
         # Both ambulance and hospital staff can view patients
         return Patient.objects.all()
 
+    @retry_on_busy
     def perform_create(self, serializer):
         # Only ambulance staff can create patients
         if self.request.user.role != 'ambulance':
@@ -47,4 +64,108 @@ class PatientViewSet(ModelViewSet):
                 {"detail": "Only ambulance staff can delete patients."},
                 status=status.HTTP_403_FORBIDDEN
             )
-        return super().destroy(request, *args, **kwargs)
\ No newline at end of file
+        return super().destroy(request, *args, **kwargs)
+
+    #active patients of one hospital, most severe first then by arrival, read in patient_triage_queue_idx order
+    @action(detail=False, methods=['get'], url_path='triage-queue')
+    def triage_queue(self, request):
+        try:
+            hospital_id = int(request.query_params['hospital'])
+            offset = int(request.query_params.get('offset', 0))
+            limit = int(request.query_params.get('limit', 100))
+        except (KeyError, ValueError):
+            return Response({'error': 'hospital is a required id, offset and limit must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        offset = max(0, offset)
+        limit = max(1, min(limit, 500))
+
+        counts = counts_by_code(hospital_id)
+        patients = triage_queue(hospital_id)[offset:offset + limit]
+        return Response({
+            'hospital': hospital_id,
+            'count': sum(counts.values()),
+            'by_triage_code': counts,
+            'results': self.get_serializer(patients, many=True).data,
+        })
+
+    #offline sync: many creates/updates in one request, answered with a result per client id
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if request.user.role != 'ambulance':
+            return Response({'error': 'Only ambulance staff can create or update patients.'},
+                            status=status.HTTP_403_FORBIDDEN)
+        items = request.data.get('items') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BATCH_SIZE:
+            return Response({'error': f'at most {MAX_BATCH_SIZE} items per batch'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        seen = set()
+        for item in items:
+            client_id = item.get('client_id') if isinstance(item, dict) else None
+            if not isinstance(client_id, str) or not client_id or len(client_id) > 64 or client_id in seen:
+                return Response({'error': 'every item needs a unique client_id of at most 64 characters'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if item.get('id') is not None and not isinstance(item['id'], int):
+                return Response({'error': f'{client_id}: id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(item.get('data', {}), dict):
+                return Response({'error': f'{client_id}: data must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+            seen.add(client_id)
+
+        try:
+            results = apply_patient_batch(items, request.user, self.get_serializer_context())
+        except IntegrityError as error:
+            if not is_client_ref_conflict(error):
+                raise
+            # The same batch is being applied concurrently; a retry gets the duplicate results
+            return Response({'error': 'conflicting sync in progress, retry'}, status=status.HTTP_409_CONFLICT)
+        return Response({'results': results})
+
+    #vital signs series of one patient, downsampled to min/max/avg per bucket
+    #?start=&end= (ISO, default the last 24 hours) &bucket=<seconds> (default: at most 200 buckets)
+    @action(detail=True, methods=['get'])
+    def vitals(self, request, pk=None):
+        patient = self.get_object()
+        params = request.query_params
+        end = parse_timestamp('end', params['end']) if params.get('end') else timezone.now()
+        start = parse_timestamp('start', params['start']) if params.get('start') else end - timedelta(hours=24)
+        if start >= end:
+            return Response({'error': 'start must be before end'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            bucket = int(params['bucket']) if params.get('bucket') else None
+        except ValueError:
+            return Response({'error': 'bucket must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+        bucket = bucket_width(start, end, bucket)
+        if (end - start).total_seconds() / bucket > 2000:
+            return Response({'error': 'range too large for this bucket size (max 2000 buckets)'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'patient': patient.id,
+            'start': start,
+            'end': end,
+            'bucket_seconds': bucket,
+            'series': downsample(patient.id, start, end, bucket),
+        })
+
+    #batched vitals ingest: readings are appended, the patient row only keeps the newest one
+    @vitals.mapping.post
+    def record_vitals(self, request, pk=None):
+        if request.user.role != 'ambulance':
+            return Response({'error': 'Only ambulance staff can record vital signs.'},
+                            status=status.HTTP_403_FORBIDDEN)
+        patient = self.get_object()
+        readings = request.data.get('readings') if isinstance(request.data, dict) else request.data
+        if not isinstance(readings, list) or not readings:
+            return Response({'error': 'readings must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(readings) > MAX_VITALS_BATCH_SIZE:
+            return Response({'error': f'at most {MAX_VITALS_BATCH_SIZE} readings per batch'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = VitalSignReadingSerializer(data=readings, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        record_readings(patient.id, serializer.validated_data)
+        patient.refresh_from_db()
+        return Response({
+            'accepted': len(serializer.validated_data),
+            'patient': self.get_serializer(patient).data,
+        }, status=status.HTTP_201_CREATED)
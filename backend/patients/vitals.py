@@ -0,0 +1,122 @@
+#vital signs series: batched append-only ingest and range reads downsampled in the database
+import math
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Avg, Count, DateTimeField, Func, IntegerField, Max, Min, Q, Value
+from django.utils import timezone
+from Django_config.conditional import bump_table_version, table_label
+from Django_config.sqlite import retry_on_busy
+from .models import Patient, VitalSignReading
+
+MAX_BATCH_SIZE = 1000
+# How far ahead of the server clock a device may stamp a reading
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+SERIES_FIELDS = ('systolic', 'diastolic', 'heart_rate', 'oxygen_saturation')
+# Patient columns holding the latest reading; VitalSignReading has an attribute of the same name for each
+SNAPSHOT_FIELDS = ('blood_pressure', 'heart_rate', 'oxygen_saturation', 'electromyography')
+
+
+def build_reading(patient_id, data, now):
+    systolic = diastolic = None
+    if data.get('blood_pressure'):
+        systolic, diastolic = (int(part) for part in data['blood_pressure'].split('/'))
+    return VitalSignReading(
+        patient_id=patient_id,
+        recorded_at=data.get('recorded_at') or now,
+        systolic=systolic,
+        diastolic=diastolic,
+        heart_rate=data.get('heart_rate'),
+        oxygen_saturation=data.get('oxygen_saturation'),
+        electromyography=data.get('electromyography') or None,
+    )
+
+
+@retry_on_busy
+def record_readings(patient_id, readings):
+    """Append validated ``readings`` and move the Patient snapshot forward.
+
+    The snapshot takes, per column, the newest value in the batch, and only
+    if the batch is newer than the reading already on the row. It is written
+    with a single UPDATE of the vital sign columns, not a full row save.
+    """
+    now = timezone.now()
+    rows = sorted((build_reading(patient_id, data, now) for data in readings), key=lambda r: r.recorded_at)
+    newest = rows[-1].recorded_at
+    snapshot = {'vitals_recorded_at': newest}
+    for column in SNAPSHOT_FIELDS:
+        for row in reversed(rows):
+            value = getattr(row, column)
+            if value is not None:
+                snapshot[column] = value
+                break
+
+    with transaction.atomic():
+        VitalSignReading.objects.bulk_create(rows, batch_size=MAX_BATCH_SIZE)
+        updated = (Patient.objects.filter(pk=patient_id)
+                   .filter(Q(vitals_recorded_at__isnull=True) | Q(vitals_recorded_at__lt=newest))
+                   .update(**snapshot))
+        if updated:
+            # update() skips post_save, so bump the patient table version for ETags ourselves
+            transaction.on_commit(lambda: bump_table_version(table_label(Patient)))
+    return rows
+
+
+def bucket_width(start, end, bucket_seconds=None, max_buckets=200):
+    """Seconds per bucket: the requested width, or the smallest whole second giving at most ``max_buckets``."""
+    if bucket_seconds is None:
+        bucket_seconds = math.ceil((end - start).total_seconds() / max_buckets)
+    return max(1, bucket_seconds)
+
+
+class BucketIndex(Func):
+    """Number of the ``bucket_seconds`` wide bucket after ``start`` that a datetime column falls in."""
+    output_field = IntegerField()
+
+    def __init__(self, expression, start, bucket_seconds):
+        super().__init__(expression, Value(start, output_field=DateTimeField()), Value(int(bucket_seconds)))
+
+    def compile_arguments(self, compiler):
+        sql, params = [], []
+        for expression in self.get_source_expressions():
+            part, part_params = compiler.compile(expression)
+            sql.append(part)
+            params.extend(part_params)
+        return sql, params
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # julianday() keeps whole milliseconds; rounding to them drops the float error before dividing
+        (column, start, width), params = self.compile_arguments(compiler)
+        return (f'(CAST(ROUND((julianday({column}) - julianday({start})) * 86400000) AS INTEGER) '
+                f'/ ({width} * 1000))'), params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        (column, start, width), params = self.compile_arguments(compiler)
+        return f'FLOOR(EXTRACT(EPOCH FROM ({column} - {start})) / {width})::integer', params
+
+
+def downsample(patient_id, start, end, bucket_seconds):
+    """min/max/avg per ``bucket_seconds`` bucket of [start, end), skipping empty buckets.
+
+    The database groups the (patient, recorded_at) index range by bucket and
+    returns one row per non-empty bucket, so neither the query result nor
+    memory grows with the number of raw samples.
+    """
+    aggregates = {'count': Count('pk')}
+    for name in SERIES_FIELDS:
+        aggregates.update({f'{name}_min': Min(name), f'{name}_max': Max(name), f'{name}_avg': Avg(name)})
+    rows = (VitalSignReading.objects
+            .filter(patient_id=patient_id, recorded_at__gte=start, recorded_at__lt=end)
+            .annotate(bucket=BucketIndex('recorded_at', start, bucket_seconds))
+            .values('bucket')
+            .annotate(**aggregates)
+            .order_by('bucket'))
+    return [_bucket(start, bucket_seconds, row) for row in rows]
+
+
+def _bucket(start, bucket_seconds, row):
+    bucket = {'start': start + timedelta(seconds=row['bucket'] * bucket_seconds), 'count': row['count']}
+    for name in SERIES_FIELDS:
+        bucket[name] = None if row[f'{name}_min'] is None else {
+            'min': row[f'{name}_min'], 'max': row[f'{name}_max'], 'avg': round(row[f'{name}_avg'], 1),
+        }
+    return bucket
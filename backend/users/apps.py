@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import authentication  # noqa: F401  (registers the user cache invalidation receivers)
+        from . import checks, signals  # noqa: F401
+        from Django_config.instrumentation import register_collector
+        register_collector('users_auth_cache', authentication.user_cache.stats)
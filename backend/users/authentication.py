@@ -0,0 +1,117 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .models import User
+
+
+class UserCache:
+    """Small per-process LRU cache of User rows with a short TTL.
+
+    Entries are dropped when the user is saved or deleted (see the receivers
+    below); the TTL bounds staleness for writes that bypass signals, such as
+    queryset.update() or another process.
+    """
+
+    def __init__(self, maxsize=10000, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                # Hand out a copy so per-request changes never leak into the cache
+                return copy.copy(entry[0])
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, user):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (copy.copy(user), time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_config = getattr(settings, 'USER_AUTH_CACHE', {})
+user_cache = UserCache(maxsize=_config.get('MAX_SIZE', 10000), ttl=_config.get('TTL', 30))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the token's user through ``user_cache``.
+
+    In the steady state authenticating a request costs no database query.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+            return user
+
+        # Same checks as JWTAuthentication, against the cached row
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Covers role changes, deactivation and password changes
+    user_cache.invalidate(str(instance.pk))
@@ -0,0 +1,24 @@
+#system checks for settings that only break once more than one worker is running
+from django.conf import settings
+from django.core.checks import Error, register
+from .verification import verification_setting
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_login_verification_cache(app_configs, **kwargs):
+    alias = verification_setting('CACHE')
+    if alias not in settings.CACHES:
+        return [Error(f"LOGIN_VERIFICATION['CACHE'] names an unknown cache {alias!r}", id='users.E001')]
+    backend = settings.CACHES[alias]['BACKEND']
+    if not settings.DEBUG and backend in PER_PROCESS_CACHES:
+        return [Error(
+            f"LOGIN_VERIFICATION['CACHE'] ({alias!r}) uses {backend}, which other workers cannot see",
+            hint="Codes issued by one worker would fail verification on the others; use the 'shared' cache.",
+            id='users.E002',
+        )]
+    return []
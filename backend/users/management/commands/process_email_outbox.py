@@ -0,0 +1,21 @@
+#delivers queued outbox email from a separate process (cron, systemd, a sidecar container)
+import time
+from django.core.management.base import BaseCommand
+from users.outbox import process_outbox, outbox_setting
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending emails from the users outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when idle')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = process_outbox(options['batch_size'])
+            if sent:
+                self.stdout.write(f'sent {sent} email(s)')
+            if not options['loop']:
+                return
+            time.sleep(outbox_setting('POLL_INTERVAL'))
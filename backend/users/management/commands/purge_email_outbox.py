@@ -0,0 +1,15 @@
+#deletes delivered and failed outbox email past EMAIL_OUTBOX['RETENTION'] (run it from cron)
+from django.core.management.base import BaseCommand
+from users.outbox import purge_outbox
+
+
+class Command(BaseCommand):
+    help = 'Delete sent and failed emails older than the outbox retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, default=None,
+                            help="seconds to keep rows, defaults to EMAIL_OUTBOX['RETENTION']")
+
+    def handle(self, *args, **options):
+        deleted = purge_outbox(options['retention'])
+        self.stdout.write(f'deleted {deleted} email(s)')
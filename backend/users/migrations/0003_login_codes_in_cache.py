@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_email_outbox'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='email_verification_code',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='email_verification_code_created_at',
+        ),
+    ]
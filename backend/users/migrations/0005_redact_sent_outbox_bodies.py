@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def redact_bodies(apps, schema_editor):
+    # Rows sent or given up on before bodies were blanked still hold login codes
+    OutboxEmail = apps.get_model('users', 'OutboxEmail')
+    OutboxEmail.objects.filter(status__in=['sent', 'failed']).exclude(body='').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(redact_bodies, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,9 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 import uuid
-import random
-import string
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
+from .verification import consume_code, issue_code, verification_setting
 
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -16,32 +14,55 @@ class User(AbstractUser):
     ])
     mfa_secret = models.TextField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
-    email_verification_code = models.CharField(max_length=6, null=True, blank=True)
-    email_verification_code_created_at = models.DateTimeField(null=True, blank=True)
 
     def generate_email_verification_code(self):
         """Generate a 6-digit verification code and send it via email"""
-        code = ''.join(random.choices(string.digits, k=6))
-        self.email_verification_code = code
-        self.email_verification_code_created_at = timezone.now()
-        self.save()
+        # Kept in the cache with a TTL (see users.verification), so logging in does not write the user row
+        code = issue_code(self)
 
         # Send email with verification code
         subject = 'Your Login Verification Code'
-        message = f'Your verification code is: {code}\n\nThis code will expire in 10 minutes.'
+        minutes = verification_setting('TTL') // 60
+        message = f'Your verification code is: {code}\n\nThis code will expire in {minutes} minutes.'
         from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [self.email]
         
-        send_mail(subject, message, from_email, recipient_list)
+        # Delivered by the outbox workers so login never waits on SMTP
+        from .outbox import enqueue_email
+        enqueue_email(subject, message, from_email, recipient_list)
         return code
 
     def verify_email_code(self, code):
-        """Verify the email code and check if it's still valid"""
-        if not self.email_verification_code or not self.email_verification_code_created_at:
-            return False
-            
-        # Check if code is expired (10 minutes)
-        if timezone.now() - self.email_verification_code_created_at > timezone.timedelta(minutes=10):
-            return False
-            
-        return self.email_verification_code == code
+        """Verify the email code; a valid code can only be used once"""
+        return consume_code(self, code)
+
+
+class OutboxEmail(models.Model):
+    """Queued outgoing email, delivered in batches by users.outbox workers."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,156 @@
+#transactional email outbox: requests enqueue rows, worker threads deliver them in batches
+import logging
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WORKERS': 2,            # in-process delivery threads, 0 leaves delivery to process_email_outbox
+    'BATCH_SIZE': 50,        # emails sent per SMTP connection
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 30,     # seconds, doubled after every failed attempt
+    'POLL_INTERVAL': 5,      # seconds between scans when idle
+    'CLAIM_TIMEOUT': 300,    # seconds before a batch claimed by a dead worker is retried
+    'RETENTION': 7 * 86400,  # seconds sent and failed rows are kept, see purge_outbox
+}
+
+
+def outbox_setting(name):
+    return getattr(settings, 'EMAIL_OUTBOX', {}).get(name, DEFAULTS[name])
+
+
+def enqueue_email(subject, body, from_email, recipient_list):
+    """Store an email for asynchronous delivery and wake the workers once it is committed."""
+    email = OutboxEmail.objects.create(
+        subject=subject, body=body, from_email=from_email or '', recipients=list(recipient_list),
+    )
+    transaction.on_commit(worker_pool.notify)
+    return email
+
+
+def claim_batch(batch_size):
+    """Atomically claim up to ``batch_size`` due emails for this worker."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=outbox_setting('CLAIM_TIMEOUT'))
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_at__lt=stale)
+    ids = list(OutboxEmail.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    # Conditional update so two workers never claim the same row
+    OutboxEmail.objects.filter(due, id__in=ids).update(status='sending', claim_token=token, claimed_at=now)
+    return list(OutboxEmail.objects.filter(claim_token=token, status='sending'))
+
+
+def deliver_batch(emails):
+    """Send ``emails`` over one connection, recording success or scheduling a retry for each."""
+    max_attempts = outbox_setting('MAX_ATTEMPTS')
+    backoff = outbox_setting('RETRY_BACKOFF')
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in emails:
+            _record_failure(email, exc, max_attempts, backoff)
+        return 0
+    try:
+        for email in emails:
+            message = EmailMessage(
+                email.subject, email.body, email.from_email or settings.DEFAULT_FROM_EMAIL,
+                email.recipients, connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as exc:
+                _record_failure(email, exc, max_attempts, backoff)
+                continue
+            email.status = 'sent'
+            email.sent_at = timezone.now()
+            email.attempts += 1
+            email.claim_token = None
+            # Bodies carry login codes: nothing needs them once the message has left
+            email.body = ''
+            email.save(update_fields=['status', 'sent_at', 'attempts', 'claim_token', 'body'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def _record_failure(email, exc, max_attempts, backoff):
+    email.attempts += 1
+    email.last_error = repr(exc)
+    email.claim_token = None
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+        email.body = ''
+        logger.error('Giving up on outbox email %s after %s attempts: %r', email.id, email.attempts, exc)
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + timedelta(seconds=backoff * 2 ** (email.attempts - 1))
+    email.save(update_fields=['attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at', 'body'])
+
+
+def process_outbox(batch_size=None):
+    """Deliver every email that is currently due. Returns the number sent."""
+    batch_size = batch_size or outbox_setting('BATCH_SIZE')
+    total = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return total
+        total += deliver_batch(batch)
+
+
+def purge_outbox(retention=None):
+    """Delete sent and failed emails older than ``retention`` seconds. Returns the number deleted."""
+    retention = outbox_setting('RETENTION') if retention is None else retention
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    deleted, _ = OutboxEmail.objects.filter(status__in=['sent', 'failed'], created_at__lt=cutoff).delete()
+    return deleted
+
+
+class OutboxWorkerPool:
+    """Daemon threads that deliver queued email, woken on enqueue and polling as a fallback."""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def notify(self):
+        if outbox_setting('WORKERS') <= 0:
+            return
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _ensure_started(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), outbox_setting('WORKERS')):
+                thread = threading.Thread(target=self._run, name=f'email-outbox-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(outbox_setting('POLL_INTERVAL'))
+            self._wakeup.clear()
+            try:
+                process_outbox()
+            except Exception:
+                logger.exception('Email outbox worker failed')
+            finally:
+                close_old_connections()
+
+
+worker_pool = OutboxWorkerPool()
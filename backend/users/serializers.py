@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from Django_config.instrumentation import TimedRepresentationMixin
 from .models import User
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'role', 'is_active']
@@ -0,0 +1,5 @@
+from Django_config.conditional import track_model_changes
+from .models import User
+
+
+track_model_changes(User)
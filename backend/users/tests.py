@@ -1,3 +1,172 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Django_config.testing import QueryBudgetMixin
+from .models import User, OutboxEmail
+from .outbox import process_outbox
+from .authentication import user_cache
+from .checks import check_login_verification_cache
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='me', password='pass', role='ambulance')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_users(self, n):
+        start = User.objects.count()
+        for i in range(start, start + n):
+            User.objects.create_user(username=f'user{i}', password='pass', role='hospital')
+
+    def test_list(self):
+        self.assertConstantQueries(1, lambda: self.client.get('/api/users/'), self.add_users)
+
+    def test_detail(self):
+        self.add_users(1)
+        other = User.objects.exclude(id=self.user.id).get()
+        with self.assertQueryBudget(1):
+            response = self.client.get(f'/api/users/{other.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX={'WORKERS': 0, 'MAX_ATTEMPTS': 2, 'RETRY_BACKOFF': 60},
+)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='crew', email='crew@example.com',
+                                             password='pass', role='ambulance')
+
+    def test_login_queues_code_without_sending(self):
+        response = APIClient().post('/api/login/', {'username': 'crew', 'password': 'pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual(queued.status, 'pending')
+        self.assertEqual(queued.recipients, ['crew@example.com'])
+
+        self.assertEqual(process_outbox(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Your verification code is: ', mail.outbox[0].body)
+        sent = OutboxEmail.objects.get()
+        self.assertEqual((sent.status, sent.body), ('sent', ''))
+
+    def test_failed_delivery_is_retried_then_given_up(self):
+        self.user.generate_email_verification_code()
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('smtp down')):
+            self.assertEqual(process_outbox(), 0)
+            email = OutboxEmail.objects.get()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertEqual(process_outbox(), 0)  # backing off, nothing due yet
+            OutboxEmail.objects.update(next_attempt_at=email.created_at)
+            process_outbox()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.body), ('failed', 2, ''))
+        self.assertIn('smtp down', email.last_error)
+
+    def test_purge_deletes_only_old_finished_rows(self):
+        for status in ('sent', 'failed', 'pending', 'sent'):
+            OutboxEmail.objects.create(subject='s', body='b', recipients=['crew@example.com'], status=status)
+        old = timezone.now() - timedelta(days=8)
+        OutboxEmail.objects.filter(pk__in=OutboxEmail.objects.order_by('id').values('id')[:3]).update(created_at=old)
+        out = StringIO()
+        call_command('purge_email_outbox', stdout=out)
+        self.assertIn('deleted 2 email(s)', out.getvalue())
+        self.assertEqual(sorted(OutboxEmail.objects.values_list('status', flat=True)), ['pending', 'sent'])
+
+
+class CachedJWTAuthenticationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='crew', password='pass', role='ambulance')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_steady_state_auth_needs_no_query(self):
+        with self.assertQueryBudget(2):  # user lookup + list
+            self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        with self.assertQueryBudget(1):  # list only
+            self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        self.assertEqual(user_cache.stats()['hits'], 1)
+
+    def test_deactivation_invalidates_cache(self):
+        self.client.get('/api/users/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/').status_code, 401)
+
+
+@override_settings(
+    EMAIL_OUTBOX={'WORKERS': 0},
+    LOGIN_VERIFICATION={'MAX_ATTEMPTS': 3},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class LoginVerificationCodeTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user(username='crew', email='crew@example.com',
+                                             password='pass', role='ambulance')
+        self.client = APIClient()
+
+    def verify(self, code):
+        return self.client.post('/api/verify-login/', {'username': 'crew', 'verification_code': code},
+                                format='json')
+
+    def test_login_does_not_write_the_user_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/login/', {'username': 'crew', 'password': 'pass'}, format='json')
+            code = OutboxEmail.objects.get().body.split(': ')[1][:6]
+            response = self.verify(code)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        writes = [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and 'users_user' in q['sql']]
+        self.assertEqual(writes, [])
+
+    def test_code_is_consumed_once(self):
+        code = self.user.generate_email_verification_code()
+        self.assertEqual(self.verify(code).status_code, 200)
+        self.assertEqual(self.verify(code).status_code, 401)
+
+    def test_new_code_replaces_old(self):
+        old = self.user.generate_email_verification_code()
+        new = self.user.generate_email_verification_code()
+        if old != new:
+            self.assertEqual(self.verify(old).status_code, 401)
+        self.assertEqual(self.verify(new).status_code, 200)
+
+    def test_too_many_wrong_guesses_discard_the_code(self):
+        code = self.user.generate_email_verification_code()
+        wrong = '%06d' % ((int(code) + 1) % 1000000)
+        for _ in range(3):
+            self.assertEqual(self.verify(wrong).status_code, 401)
+        self.assertEqual(self.verify(code).status_code, 401)
+
+    @override_settings(LOGIN_VERIFICATION={'TTL': 0})
+    def test_expired_code(self):
+        # A zero timeout makes the cache drop the code right away
+        code = self.user.generate_email_verification_code()
+        self.assertEqual(self.verify(code).status_code, 401)
+
+    def test_code_is_kept_where_other_workers_see_it(self):
+        self.user.generate_email_verification_code()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM emergency_shared_cache')
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+    def test_per_process_cache_fails_the_system_check(self):
+        self.assertEqual(check_login_verification_cache(None), [])
+        with override_settings(DEBUG=False, LOGIN_VERIFICATION={'CACHE': 'default'}):
+            self.assertEqual([e.id for e in check_login_verification_cache(None)], ['users.E002'])
+        with override_settings(DEBUG=True, LOGIN_VERIFICATION={'CACHE': 'default'}):
+            self.assertEqual(check_login_verification_cache(None), [])
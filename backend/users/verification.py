@@ -0,0 +1,62 @@
+#login verification codes kept in the cache with a TTL, consumed at most once
+import secrets
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+DEFAULTS = {
+    'CACHE': 'shared',      # must be shared by all workers, see users.checks
+    'TTL': 600,             # seconds a code stays valid
+    'MAX_ATTEMPTS': 5,      # wrong guesses before the code is thrown away
+    'LENGTH': 6,
+}
+
+
+def verification_setting(name):
+    return getattr(settings, 'LOGIN_VERIFICATION', {}).get(name, DEFAULTS[name])
+
+
+def _cache():
+    return caches[verification_setting('CACHE')]
+
+
+def _code_key(user_pk):
+    return f'login-code:{user_pk}'
+
+
+def _attempts_key(user_pk):
+    return f'login-code-attempts:{user_pk}'
+
+
+def issue_code(user):
+    """Create a new code for ``user``, replacing any earlier one, and return it."""
+    code = ''.join(secrets.choice('0123456789') for _ in range(verification_setting('LENGTH')))
+    ttl = verification_setting('TTL')
+    _cache().set_many({_code_key(user.pk): code, _attempts_key(user.pk): 0}, ttl)
+    return code
+
+
+def consume_code(user, code):
+    """Return True if ``code`` is the user's current code, which is then used up.
+
+    Of two concurrent requests with the right code only the one that
+    manages to delete the key succeeds. Every wrong guess counts against
+    the code; after MAX_ATTEMPTS it is deleted and a new login is needed.
+    """
+    cache = _cache()
+    code_key, attempts_key = _code_key(user.pk), _attempts_key(user.pk)
+    stored = cache.get(code_key)
+    if stored is None or not code:
+        return False
+    if not constant_time_compare(stored, str(code)):
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:  # counter expired or evicted: do not allow unlimited guesses
+            attempts = verification_setting('MAX_ATTEMPTS')
+        if attempts >= verification_setting('MAX_ATTEMPTS'):
+            cache.delete_many([code_key, attempts_key])
+        return False
+    if not cache.delete(code_key):
+        return False
+    cache.delete(attempts_key)
+    return True
@@ -1,4 +1,7 @@
 from rest_framework.viewsets import ModelViewSet
+from Django_config.conditional import ConditionalGetMixin
+from Django_config.db_routers import ReplicaReadMixin
+from Django_config.fast_serializers import FastListMixin
 from .models import User
 from .serializers import UserSerializer, RegisterSerializer
 from rest_framework import status
@@ -9,9 +12,11 @@ from django.contrib.auth import authenticate
 from django.utils import timezone
 from rest_framework import generics
 from rest_framework_simplejwt.tokens import RefreshToken
+from Django_config.instrumentation import timed
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(ReplicaReadMixin, ConditionalGetMixin, FastListMixin, ModelViewSet):
     queryset = User.objects.all()
+    conditional_models = [User]
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
 
@@ -25,7 +30,9 @@ def login(request):
     username = request.data.get('username')
     password = request.data.get('password')
     
-    user = authenticate(username=username, password=password)
+    # Password hashing (PBKDF2) is the bulk of a login, report it with the other crypto time
+    with timed('crypto'):
+        user = authenticate(username=username, password=password)
     
     if user is None:
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -49,15 +56,11 @@ def verify_login(request):
     except User.DoesNotExist:
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     
+    # Consumes the code, so it cannot be used a second time
     if not user.verify_email_code(code):
         return Response({'error': 'Invalid or expired verification code'}, 
                        status=status.HTTP_401_UNAUTHORIZED)
     
-    # Clear the verification code
-    user.email_verification_code = None
-    user.email_verification_code_created_at = None
-    user.save()
-    
     refresh = RefreshToken.for_user(user)
     #frontend has access to role immediatly after login
     return Response({